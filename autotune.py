@@ -0,0 +1,126 @@
+import argparse
+import itertools
+import json
+import tempfile
+import time
+from pathlib import Path
+
+from common.engine_cache import write_config_overlay
+
+
+def parse_list(value):
+    return [int(v) for v in value.split(',') if v]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Sweep nvstreammux/nvinfer batching settings of final.py's LPR pipeline on a sample folder",
+        epilog="Only the LPRNet pipeline (LPRPipeline, lpr_config.txt) is tuned. The batch sizes of "
+               "traffic_config.txt and lpd_config.txt belong to lpr/lpr_image_processing.py's "
+               "three-model pipeline, which this does not run.")
+    parser.add_argument('--input', default="plate_images_processed",
+                        help="folder with sample JPEGs")
+    parser.add_argument('--images', type=int, default=200,
+                        help="images per trial, the samples are cycled to reach this count")
+    parser.add_argument('--batch-sizes', type=parse_list, default=[1, 2, 4, 8, 16],
+                        help="muxer batch sizes to try, comma separated")
+    parser.add_argument('--push-timeouts', type=parse_list, default=[4000, 20000, 100000, 4000000],
+                        help="batched-push-timeout values in microseconds, comma separated")
+    parser.add_argument('--infer-batch-sizes', type=parse_list, default=[],
+                        help="nvinfer batch sizes to try (default: same as the muxer)")
+    parser.add_argument('--max-p99-ms', type=float, default=None,
+                        help="only recommend settings whose p99 latency stays under this")
+    parser.add_argument('--lpr-config', default='spec_files/lpr_config.txt')
+    parser.add_argument('--output', required=True,
+                        help="folder for the tuned config overlay and settings.json")
+    parser.add_argument('--stub', action='store_true',
+                        help="use funnel/identity instead of nvstreammux/nvinfer (CPU only); these ignore "
+                             "batch size and push timeout, so this only exercises the sweep and nothing "
+                             "is recommended")
+    return parser.parse_args()
+
+
+def trial_settings(args):
+    for batch_size, push_timeout in itertools.product(args.batch_sizes, args.push_timeouts):
+        for infer_batch_size in args.infer_batch_sizes or [batch_size]:
+            yield {'batch_size': batch_size, 'push_timeout': push_timeout, 'infer_batch_size': infer_batch_size}
+
+
+def run_trial(args, samples, settings):
+    from final import LPRPipeline
+
+    files = list(itertools.islice(itertools.cycle(samples), args.images))
+    factories = {'infer_element': "identity", 'mux_element': "funnel"} if args.stub else {}
+    with tempfile.TemporaryDirectory() as output_dir:
+        lpr_pipeline = LPRPipeline(settings['batch_size'], push_timeout=settings['push_timeout'],
+                                   infer_batch_size=settings['infer_batch_size'],
+                                   lpr_config=args.lpr_config, output_dir=output_dir, **factories)
+        lpr_pipeline.writer.verbose = False
+        try:
+            ok = lpr_pipeline.process_folder(files)
+        finally:
+            lpr_pipeline.close()
+    if not ok:
+        return None
+    return lpr_pipeline.stream_stats
+
+
+def pick_best(results, max_p99_ms):
+    # Trials that failed or produced no latency figures can't be compared
+    candidates = [(settings, stats) for settings, stats in results
+                  if stats is not None and stats['p50'] is not None]
+    if max_p99_ms is not None:
+        candidates = [(settings, stats) for settings, stats in candidates
+                      if stats['p99'] is not None and stats['p99'] * 1000 <= max_p99_ms]
+    if not candidates:
+        return None
+    return max(candidates, key=lambda item: item[1]['images_per_sec'])
+
+
+def write_recommendation(args, settings, stats):
+    output = Path(args.output)
+    output.mkdir(parents=True, exist_ok=True)
+    overlay = write_config_overlay(args.lpr_config, {'batch-size': settings['infer_batch_size']},
+                                   output / Path(args.lpr_config).name,
+                                   f"Tuned by autotune.py on {time.strftime('%Y-%m-%d %H:%M')}")
+    with open(output / "settings.json", 'w') as f:
+        json.dump({'streammux': {'batch-size': settings['batch_size'],
+                                 'batched-push-timeout': settings['push_timeout']},
+                   'lpr_config': str(overlay),
+                   'measured': stats}, f, indent=2)
+    print(f"\nRecommended: batch size {settings['batch_size']}, push timeout {settings['push_timeout']} us, "
+          f"nvinfer batch {settings['infer_batch_size']} ({stats['images_per_sec']:.1f} images/sec)")
+    print(f"Wrote {overlay} and {output / 'settings.json'}")
+    print(f"Run with: python final.py --stream --batch-size {settings['batch_size']} "
+          f"--push-timeout {settings['push_timeout']} --lpr-config {overlay}")
+
+
+def main():
+    args = parse_args()
+    samples = sorted(Path(args.input).glob("*.jpg")) + sorted(Path(args.input).glob("*.jpeg"))
+    if not samples:
+        raise SystemExit(f"No sample JPEGs in {args.input}")
+
+    results = []
+    for settings in trial_settings(args):
+        stats = run_trial(args, samples, settings)
+        results.append((settings, stats))
+        if stats is None or stats['p50'] is None:
+            print(f"{settings}: failed")
+            continue
+        print(f"batch {settings['batch_size']:>2}  push-timeout {settings['push_timeout']:>7} us  "
+              f"nvinfer batch {settings['infer_batch_size']:>2}:  {stats['images_per_sec']:8.1f} images/sec  "
+              f"p50 {stats['p50'] * 1000:7.1f} ms  p99 {stats['p99'] * 1000:7.1f} ms")
+
+    if args.stub:
+        print("\nStand-in elements ignore the batching settings, the differences above are noise; "
+              "nothing recommended")
+        return
+    best = pick_best(results, args.max_p99_ms)
+    if best is None:
+        raise SystemExit("No setting met the constraints")
+    write_recommendation(args, *best)
+
+
+if __name__ == '__main__':
+    main()
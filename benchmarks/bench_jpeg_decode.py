@@ -0,0 +1,94 @@
+import argparse
+import math
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.append(str(REPO_ROOT))
+from common.frame_cache import FrameDecoder
+
+from PIL import Image
+
+ROUNDS = 20
+# Typical camera frame sizes; the repo's samples are smaller than the muxer
+# output, so they are also re-encoded at these sizes
+CAMERA_SIZES = [(1920, 1080), (4032, 3024)]
+
+
+def psnr(a, b):
+    # Over the luma plane, which is what LPRNet mostly sees
+    luma = len(a) * 2 // 3
+    error = sum((x - y) ** 2 for x, y in zip(a[:luma], b[:luma])) / luma
+    return float('inf') if error == 0 else 10 * math.log10(255 ** 2 / error)
+
+
+def time_decode(decoder, path):
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        frame = decoder.decode(path)
+    return (time.perf_counter() - start) / ROUNDS, frame
+
+
+def make_samples(work_dir):
+    samples = sorted(REPO_ROOT.glob("*.jpg"))
+    for sample in list(samples):
+        with Image.open(sample) as image:
+            for width, height in CAMERA_SIZES:
+                path = Path(work_dir) / f"{sample.stem}_{width}x{height}.jpg"
+                image.convert('RGB').resize((width, height), Image.BICUBIC).save(path, quality=90)
+                samples.append(path)
+    return samples
+
+
+def recognize(samples, dct_scaling):
+    from final import LPRPipeline, MUX_WIDTH, MUX_HEIGHT
+
+    plates = {}
+    with tempfile.TemporaryDirectory() as output_dir:
+        lpr_pipeline = LPRPipeline(output_dir=output_dir,
+                                   frame_source=FrameDecoder(MUX_WIDTH, MUX_HEIGHT, dct_scaling))
+        lpr_pipeline.writer.verbose = False
+        lpr_pipeline.on_image_done = lambda image_path, labels: plates.__setitem__(
+            Path(image_path).name, sorted(label.plate_number for label in labels or []))
+        try:
+            lpr_pipeline.process_folder(samples)
+        finally:
+            lpr_pipeline.close()
+    return plates
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Full-size vs DCT-scaled JPEG decode to the muxer resolution")
+    parser.add_argument('--width', type=int, default=720)
+    parser.add_argument('--height', type=int, default=320)
+    parser.add_argument('--recognize', action='store_true',
+                        help="also run LPRNet on both decodes and compare the plates (needs DeepStream)")
+    args = parser.parse_args()
+
+    full = FrameDecoder(args.width, args.height, dct_scaling=False)
+    scaled = FrameDecoder(args.width, args.height, dct_scaling=True)
+    with tempfile.TemporaryDirectory() as work_dir:
+        samples = make_samples(work_dir)
+        for path in samples:
+            with Image.open(path) as image:
+                size = image.size
+            full_time, full_frame = time_decode(full, path)
+            scaled_time, scaled_frame = time_decode(scaled, path)
+            print(f"{path.name:>30} {size[0]:>4}x{size[1]:<4}: full {full_time * 1000:7.2f} ms, "
+                  f"DCT-scaled {scaled_time * 1000:7.2f} ms ({full_time / scaled_time:4.1f}x), "
+                  f"luma PSNR {psnr(full_frame, scaled_frame):5.1f} dB")
+
+        if args.recognize:
+            full_plates = recognize(samples, False)
+            scaled_plates = recognize(samples, True)
+            mismatches = [name for name in full_plates if full_plates[name] != scaled_plates.get(name)]
+            print(f"Recognition parity: {len(full_plates) - len(mismatches)}/{len(full_plates)} images "
+                  f"give the same plates")
+            for name in mismatches:
+                print(f"  {name}: full {full_plates[name]}, DCT-scaled {scaled_plates.get(name)}")
+
+
+if __name__ == '__main__':
+    main()
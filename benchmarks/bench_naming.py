@@ -0,0 +1,64 @@
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from common.plate_naming import PlateNameIndex
+
+PLATES = 100
+SAVES = 1000
+
+
+def exists_probe_reserve(output_dir, plate_number, file_extension):
+    # The original naming scheme from save_image_with_plate_number
+    new_filename = f"{plate_number}{file_extension}"
+    output_path = output_dir / new_filename
+    counter = 1
+    while output_path.exists():
+        new_filename = f"{plate_number}_{counter}{file_extension}"
+        output_path = output_dir / new_filename
+        counter += 1
+    output_path.touch()
+    return output_path
+
+
+def populate(output_dir, existing):
+    per_plate = existing // PLATES
+    for plate in range(PLATES):
+        for counter in range(per_plate):
+            name = f"PLATE{plate}.jpg" if counter == 0 else f"PLATE{plate}_{counter}.jpg"
+            open(output_dir / name, 'wb').close()
+
+
+def run(existing):
+    with tempfile.TemporaryDirectory() as probe_dir, tempfile.TemporaryDirectory() as index_dir:
+        probe_dir, index_dir = Path(probe_dir), Path(index_dir)
+        populate(probe_dir, existing)
+        populate(index_dir, existing)
+
+        start = time.perf_counter()
+        for i in range(SAVES):
+            exists_probe_reserve(probe_dir, f"PLATE{i % PLATES}", ".jpg")
+        probe_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        index = PlateNameIndex(index_dir)
+        scan_time = time.perf_counter() - start
+        start = time.perf_counter()
+        for i in range(SAVES):
+            index.reserve(f"PLATE{i % PLATES}", ".jpg")
+        index_time = time.perf_counter() - start
+
+    print(f"{existing:>7} existing files: exists() probing {probe_time / SAVES * 1e6:9.1f} us/save, "
+          f"index {index_time / SAVES * 1e6:6.1f} us/save (startup scan {scan_time * 1e3:.0f} ms)")
+
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [1000, 10000, 100000]
+    for existing in sizes:
+        run(existing)
+
+
+if __name__ == '__main__':
+    main()
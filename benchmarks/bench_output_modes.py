@@ -0,0 +1,65 @@
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.append(str(REPO_ROOT))
+from common.result_writer import OUTPUT_MODES, PlateResult, ResultWriter
+
+# Each sample is saved this many times, as when one image yields several labels
+LABELS_PER_IMAGE = 3
+ROUNDS = 50
+# The repo's samples are already plate crops; crops are measured against
+# them re-encoded as camera frames, with the plate at a typical size
+CAMERA_SIZE = (1920, 1080)
+# (left, top, width, height) in final.py's 720x320 muxer coordinates
+PLATE_BBOX = (300.0, 200.0, 90.0, 30.0)
+
+
+def run(mode, samples, bbox=None):
+    with tempfile.TemporaryDirectory(dir=REPO_ROOT) as output_dir:
+        writer = ResultWriter(output_dir, workers=1, output_mode=mode, verbose=False)
+        start = time.perf_counter()
+        for _ in range(ROUNDS):
+            for sample in samples:
+                for label in range(LABELS_PER_IMAGE):
+                    writer.save(PlateResult(sample, f"{sample.stem}_{label}", 1.0, bbox))
+        elapsed = time.perf_counter() - start
+        writer.close()
+    saves = ROUNDS * len(samples) * LABELS_PER_IMAGE
+    print(f"{mode:>8}: {saves} saves, {writer.bytes_written:>9} bytes written "
+          f"({writer.bytes_written / saves:8.0f} per save), {elapsed / saves * 1e6:7.1f} us/save")
+    return writer.bytes_written
+
+
+def make_camera_frames(work_dir):
+    from PIL import Image
+
+    frames = []
+    for sample in sorted(REPO_ROOT.glob("*.jpg")):
+        path = Path(work_dir) / f"{sample.stem}_camera.jpg"
+        with Image.open(sample) as image:
+            image.convert('RGB').resize(CAMERA_SIZE, Image.BICUBIC).save(path, quality=90)
+        frames.append(path)
+    return frames
+
+
+def main():
+    samples = sorted(REPO_ROOT.glob("*.jpg"))
+    print(f"{len(samples)} sample images, {sum(s.stat().st_size for s in samples)} bytes")
+    for mode in OUTPUT_MODES:
+        if mode != 'crop':
+            run(mode, samples)
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        frames = make_camera_frames(work_dir)
+        print(f"{len(frames)} camera frames at {CAMERA_SIZE[0]}x{CAMERA_SIZE[1]}, "
+              f"{sum(f.stat().st_size for f in frames)} bytes, plate box {PLATE_BBOX}")
+        copied = run('copy', frames)
+        cropped = run('crop', frames, PLATE_BBOX)
+        print(f"Plate crops write {copied / cropped:.1f}x fewer bytes than full-frame copies")
+
+
+if __name__ == '__main__':
+    main()
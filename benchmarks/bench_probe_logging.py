@@ -0,0 +1,76 @@
+import io
+import os
+import sys
+import time
+from collections import namedtuple
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from common.probe_log import ProbeLog, OFF, INFO, DEBUG
+
+FRAMES = 2000
+# Stand-ins for the pyds metadata the probes walk
+Obj = namedtuple('Obj', 'object_id obj_label class_id confidence labels')
+Label = namedtuple('Label', 'component_id result_label result_prob')
+
+
+def make_frame(objects):
+    return [Obj(i, "car", 0, 0.9, [Label(3, f"ABC{i:03d}", 0.95)]) for i in range(objects)]
+
+
+def print_probe(frame_num, objects, out):
+    # What the probes did before: several print() calls per object
+    print(f"\nFrame Number={frame_num}", file=out)
+    for obj in objects:
+        print(f"\nObject ID: {obj.object_id}", file=out)
+        print(f"Label: {obj.obj_label}", file=out)
+        print(f"Class ID: {obj.class_id}", file=out)
+        print(f"Confidence: {obj.confidence}", file=out)
+        for label in obj.labels:
+            print(f"Component ID: {label.component_id}", file=out)
+            print(f"Label: {label.result_label}", file=out)
+            print(f"Confidence: {label.result_prob}", file=out)
+
+
+def plog_probe(frame_num, objects, plog):
+    if plog.debug:
+        plog.write("\nFrame Number={}", frame_num)
+    for obj in objects:
+        if plog.debug:
+            plog.write("\nObject ID: {}\nLabel: {}\nClass ID: {}\nConfidence: {}",
+                       obj.object_id, obj.obj_label, obj.class_id, obj.confidence)
+        for label in obj.labels:
+            if plog.debug:
+                plog.write("Component ID: {}\nLabel: {}\nConfidence: {}",
+                           label.component_id, label.result_label, label.result_prob)
+
+
+def timed(probe, objects, sink):
+    frame = make_frame(objects)
+    start = time.perf_counter()
+    for frame_num in range(FRAMES):
+        probe(frame_num, frame, sink)
+    return (time.perf_counter() - start) / FRAMES * 1e6
+
+
+def run(objects):
+    # Line buffered, so every print() is a write(2) as on a terminal
+    devnull = io.TextIOWrapper(open(os.devnull, 'wb'), line_buffering=True)
+    results = [("print()", timed(print_probe, objects, devnull))]
+    for name, level in (("ProbeLog debug", DEBUG), ("ProbeLog info", INFO), ("ProbeLog off", OFF)):
+        plog = ProbeLog(level, capacity=FRAMES * objects * 2 + FRAMES, stream=devnull)
+        results.append((name, timed(plog_probe, objects, plog)))
+        plog.close()
+    devnull.close()
+    print(f"{objects:>3} objects/frame: " +
+          ", ".join(f"{name} {cost:7.1f} us/frame" for name, cost in results))
+
+
+def main():
+    counts = [int(arg) for arg in sys.argv[1:]] or [1, 10, 50]
+    for objects in counts:
+        run(objects)
+
+
+if __name__ == '__main__':
+    main()
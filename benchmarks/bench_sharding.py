@@ -0,0 +1,46 @@
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.append(str(REPO_ROOT))
+from supervisor import Supervisor
+
+from PIL import Image
+
+IMAGES = 400
+
+
+def make_images(folder, count):
+    # Large enough frames that decoding dominates, like real camera shots
+    image = Image.effect_noise((1920, 1080), 64).convert('RGB')
+    files = []
+    for index in range(count):
+        path = Path(folder) / f"SYN{index:05d}.jpg"
+        image.save(path, quality=90)
+        files.append(path)
+    return files
+
+
+def main():
+    worker_counts = [int(arg) for arg in sys.argv[1:]] or \
+                    sorted({1, 2, 4, os.cpu_count() or 1})
+    with tempfile.TemporaryDirectory(dir=REPO_ROOT) as work_dir:
+        files = make_images(work_dir, IMAGES)
+        baseline = None
+        for workers in worker_counts:
+            with tempfile.TemporaryDirectory(dir=REPO_ROOT) as output_dir:
+                options = {'batch_size': 1, 'sources': None, 'push_timeout': 20000,
+                           'output_dir': output_dir, 'output_mode': 'hardlink',
+                           'results_db': None, 'results_jsonl': None,
+                           'lpr_config': 'spec_files/lpr_config.txt', 'engine_cache': None, 'stub': True}
+                stats = Supervisor(files, workers, [], options).run()
+            baseline = baseline or stats['images_per_sec']
+            print(f"{workers:>3} workers: {stats['images_per_sec']:7.1f} images/sec, "
+                  f"speedup {stats['images_per_sec'] / baseline:.2f}x "
+                  f"(ideal {workers}x)")
+
+
+if __name__ == '__main__':
+    main()
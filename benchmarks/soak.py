@@ -0,0 +1,191 @@
+import argparse
+import contextlib
+import gc
+import itertools
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# The leaks tracer keeps the count of live GstObjects; it has to be
+# configured before Gst.init()
+os.environ.setdefault('GST_TRACERS', 'leaks(filters=GstObject)')
+os.environ.setdefault('GST_DEBUG', 'GST_TRACER:0')
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.append(str(REPO_ROOT))
+sys.path.append(str(REPO_ROOT / "lpr"))
+
+import gi
+gi.require_version('Gst', '1.0')
+from gi.repository import GObject, Gst
+
+VARIANTS = ('final-per-image', 'final-stream', 'lpr-rebuild')
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE')
+
+
+def rss_bytes():
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * PAGE_SIZE
+
+
+def open_fds():
+    return len(os.listdir('/proc/self/fd'))
+
+
+def live_objects():
+    # GstObjects still alive according to the leaks tracer, or the Python
+    # wrappers of GObjects when the tracer is unavailable
+    get_tracers = getattr(Gst, 'tracing_get_active_tracers', None)
+    for tracer in get_tracers() if get_tracers else []:
+        if GObject.type_name(tracer.__gtype__) == 'GstLeaksTracer':
+            live = tracer.emit('get-live-objects').get_value('live-objects-list')
+            return len(live) if hasattr(live, '__len__') else Gst.ValueList.get_size(live)
+    return sum(1 for o in gc.get_objects() if isinstance(o, GObject.Object))
+
+
+def make_images(folder, distinct):
+    try:
+        from PIL import Image
+    except ImportError:
+        Image = None
+    files = []
+    samples = sorted(REPO_ROOT.glob("*.jpg"))
+    for index in range(distinct):
+        path = Path(folder) / f"SYN{index:05d}.jpg"
+        if Image is not None:
+            # Small and smooth, so 100k saved copies stay a few hundred MB
+            gradient = Image.linear_gradient('L').rotate(index * 360 / distinct).resize((320, 240))
+            Image.merge('RGB', (gradient, gradient.transpose(Image.FLIP_LEFT_RIGHT), gradient)).save(path, quality=75)
+        else:
+            path.write_bytes(samples[index % len(samples)].read_bytes())
+        files.append(path)
+    return files
+
+
+def slope(points):
+    # Least-squares growth per image
+    n = len(points)
+    if n < 2:
+        return 0.0
+    mean_x = sum(x for x, _ in points) / n
+    mean_y = sum(y for _, y in points) / n
+    var = sum((x - mean_x) ** 2 for x, _ in points)
+    return sum((x - mean_x) * (y - mean_y) for x, y in points) / var if var else 0.0
+
+
+class Sampler:
+    def __init__(self, variant, every, out):
+        self.variant = variant
+        self.every = every
+        self.out = out
+        self.images = 0
+        self.window = []
+        self.samples = []
+        self.last = time.perf_counter()
+        # Saved outputs are deleted at every sample so the disk doesn't fill up
+        self.purge_dir = None
+
+    def image_done(self, latency=None):
+        now = time.perf_counter()
+        self.window.append(latency if latency is not None else now - self.last)
+        self.last = now
+        self.images += 1
+        if self.images % self.every == 0:
+            self.sample()
+
+    def sample(self):
+        window = sorted(self.window)
+        self.window = []
+        p50 = window[len(window) // 2] if window else 0.0
+        p99 = window[min(len(window) - 1, int(len(window) * 0.99))] if window else 0.0
+        if self.purge_dir is not None:
+            for entry in os.scandir(self.purge_dir):
+                if entry.is_file(follow_symlinks=False):
+                    with contextlib.suppress(OSError):
+                        os.unlink(entry.path)
+        sample = (self.images, rss_bytes(), open_fds(), live_objects())
+        self.samples.append(sample)
+        print(f"{self.variant:>16} {sample[0]:>8} images: RSS {sample[1] / 1e6:8.1f} MB, {sample[2]:>4} fds, "
+              f"{sample[3]:>6} objects, per image p50 {p50 * 1000:6.2f} ms p99 {p99 * 1000:6.2f} ms",
+              file=self.out, flush=True)
+
+
+def run_variant(variant, files, images, sampler, output_dir):
+    work = itertools.islice(itertools.cycle(files), images)
+    if variant == 'lpr-rebuild':
+        from simplified_pipeline_with_save_to_folder import LPRPipeline as RebuildPipeline
+        pipeline = RebuildPipeline(infer_element="identity", mux_element="funnel", output_dir=output_dir)
+        for image_path in work:
+            start = time.perf_counter()
+            pipeline.process_image(image_path)
+            sampler.image_done(time.perf_counter() - start)
+        return
+
+    from final import LPRPipeline
+    pipeline = LPRPipeline(infer_element="identity", mux_element="funnel",
+                           output_mode='hardlink', output_dir=output_dir)
+    pipeline.writer.verbose = False
+    try:
+        if variant == 'final-per-image':
+            for image_path in work:
+                start = time.perf_counter()
+                pipeline.process_image(image_path)
+                sampler.image_done(time.perf_counter() - start)
+        else:
+            pipeline.on_image_done = lambda image_path, labels: sampler.image_done()
+            pipeline.process_folder(work)
+    finally:
+        pipeline.close()
+
+
+def check(variant, samples, warmup, limits, out):
+    # Growth is measured after the warm-up, once caches and pools are full
+    steady = samples[int(len(samples) * warmup):]
+    failed = False
+    for column, name, unit in ((1, 'rss', 'bytes'), (2, 'fds', 'fds'), (3, 'objects', 'objects')):
+        growth = slope([(s[0], s[column]) for s in steady])
+        ok = growth <= limits[name]
+        failed |= not ok
+        print(f"{variant:>16} {name:>8} growth {growth:10.4f} {unit}/image "
+              f"(limit {limits[name]}) {'ok' if ok else 'FAIL'}", file=out)
+    return not failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Soak the pipelines with CPU stand-ins and check for leaks")
+    parser.add_argument('--images', type=int, default=100000, help="images pushed through each variant")
+    parser.add_argument('--sample-every', type=int, default=1000, help="sample RSS/fds/objects every N images")
+    parser.add_argument('--distinct', type=int, default=32, help="distinct synthetic images, cycled")
+    parser.add_argument('--variants', default=','.join(VARIANTS),
+                        help=f"comma separated, out of {', '.join(VARIANTS)}")
+    parser.add_argument('--warmup', type=float, default=0.2,
+                        help="fraction of the samples ignored when measuring growth")
+    parser.add_argument('--max-rss-per-image', type=float, default=64.0, help="bytes")
+    parser.add_argument('--max-fds-per-image', type=float, default=0.001)
+    parser.add_argument('--max-objects-per-image', type=float, default=0.001)
+    args = parser.parse_args()
+    limits = {'rss': args.max_rss_per_image, 'fds': args.max_fds_per_image,
+              'objects': args.max_objects_per_image}
+
+    Gst.init(None)
+    out = sys.stdout
+    passed = True
+    with tempfile.TemporaryDirectory() as work_dir:
+        files = make_images(work_dir, args.distinct)
+        for variant in args.variants.split(','):
+            sampler = Sampler(variant, args.sample_every, out)
+            sampler.sample()
+            # The pipelines print per image; only the samples go to stdout
+            with tempfile.TemporaryDirectory(dir=work_dir) as output_dir, \
+                    open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                sampler.purge_dir = output_dir
+                run_variant(variant, files, args.images, sampler, output_dir)
+            passed &= check(variant, sampler.samples, args.warmup, limits, out)
+    print("PASS" if passed else "FAIL: growth per image over the limit", file=out)
+    return 0 if passed else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
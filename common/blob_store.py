@@ -0,0 +1,101 @@
+import errno
+import fcntl
+import hashlib
+import os
+import shutil
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+# ioctl number of FICLONE (linux/fs.h), shares extents on btrfs/xfs/ocfs2
+FICLONE = 0x40049409
+
+# errors meaning "this filesystem cannot do that kind of link"
+UNSUPPORTED_LINK_ERRORS = (errno.EXDEV, errno.EPERM, errno.EOPNOTSUPP, errno.ENOTTY,
+                           errno.EINVAL, errno.EMLINK, errno.ENOSYS)
+
+LINK_MODES = ('hardlink', 'reflink', 'symlink')
+
+
+def file_digest(path):
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+class BlobStore:
+    # Keeps one copy of every source image under root/<aa>/<sha256><ext>;
+    # the plate-named outputs point at it instead of duplicating the bytes
+    def __init__(self, root):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.lock = threading.Lock()
+        self.digests = OrderedDict()
+        self.unsupported = set()
+        self.bytes_written = 0
+
+    def digest(self, source_path):
+        # One image often yields several labels, hash it only once
+        stat = os.stat(source_path)
+        key = (str(source_path), stat.st_mtime_ns, stat.st_size)
+        with self.lock:
+            if key in self.digests:
+                self.digests.move_to_end(key)
+                return self.digests[key]
+        digest = file_digest(source_path)
+        with self.lock:
+            self.digests[key] = digest
+            if len(self.digests) > 1024:
+                self.digests.popitem(last=False)
+        return digest
+
+    def put(self, source_path):
+        digest = self.digest(source_path)
+        blob_path = self.root / digest[:2] / f"{digest}{Path(source_path).suffix.lower()}"
+        if blob_path.exists():
+            return blob_path
+        blob_path.parent.mkdir(exist_ok=True)
+        # Copy under a private name and rename, so readers never see a
+        # half-written blob and racing writers both end up with a full one
+        tmp_path = blob_path.with_name(f".{blob_path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        shutil.copy2(source_path, tmp_path)
+        os.replace(tmp_path, blob_path)
+        with self.lock:
+            self.bytes_written += blob_path.stat().st_size
+        return blob_path
+
+    def link(self, blob_path, output_path, mode):
+        # output_path has already been reserved (created empty) by the name
+        # index; the link replaces it. Falls back to a copy when the
+        # filesystem cannot link, and remembers that for later saves.
+        if mode not in self.unsupported:
+            try:
+                self.make_link(blob_path, output_path, mode)
+                return mode
+            except OSError as e:
+                if e.errno not in UNSUPPORTED_LINK_ERRORS:
+                    raise
+                print(f"Cannot {mode} into {output_path.parent}: {e.strerror}, copying instead")
+                with self.lock:
+                    self.unsupported.add(mode)
+        shutil.copy2(blob_path, output_path)
+        with self.lock:
+            self.bytes_written += output_path.stat().st_size
+        return 'copy'
+
+    def make_link(self, blob_path, output_path, mode):
+        if mode == 'reflink':
+            with open(blob_path, 'rb') as src, open(output_path, 'wb') as dst:
+                fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+            return
+
+        tmp_path = output_path.with_name(f".{output_path.name}.tmp")
+        if mode == 'hardlink':
+            os.link(blob_path, tmp_path)
+        elif mode == 'symlink':
+            os.symlink(os.path.relpath(blob_path, output_path.parent), tmp_path)
+        else:
+            raise ValueError(f"Unknown link mode: {mode}")
+        os.replace(tmp_path, output_path)
@@ -0,0 +1,223 @@
+import configparser
+import hashlib
+import os
+import re
+import shutil
+import time
+from collections import namedtuple
+from pathlib import Path
+
+# nvinfer's network-mode values and the precision tag it puts in engine names
+PRECISIONS = {0: 'fp32', 1: 'int8', 2: 'fp16'}
+
+# nvinfer names serialized engines <model>_b<batch>_gpu<id>_<precision>.engine
+ENGINE_NAME = re.compile(r'_b(\d+)_gpu(\d+)_(fp32|fp16|int8)\.engine$')
+
+# Keys whose values are file paths; nvinfer resolves relative ones against
+# the directory of the config file
+PATH_KEYS = ('model-engine-file', 'labelfile-path', 'int8-calib-file', 'tlt-encoded-model',
+             'onnx-file', 'model-file', 'proto-file', 'uff-file', 'custom-lib-path')
+MODEL_KEYS = ('tlt-encoded-model', 'onnx-file', 'uff-file', 'model-file')
+
+EngineCheck = namedtuple('EngineCheck', ['config_path', 'engine_path', 'model_path',
+                                         'batch_size', 'gpu_id', 'precision', 'problems'])
+
+
+def read_infer_config(config_path):
+    parser = configparser.ConfigParser(interpolation=None, strict=False,
+                                       comment_prefixes=('#',), inline_comment_prefixes=None)
+    parser.optionxform = str
+    with open(config_path) as f:
+        parser.read_file(f)
+    return parser
+
+
+def resolve_path(config_path, value):
+    if not value:
+        return None
+    path = Path(value)
+    if not path.is_absolute():
+        path = Path(os.path.normpath(Path(config_path).resolve().parent / path))
+    return path
+
+
+def check_engine(config_path, batch_size=None, gpu_id=None):
+    # Compares the engine named in an nvinfer config with what the config
+    # (or the caller's overrides) asks for. Pure file/config inspection, no
+    # GPU or GStreamer needed.
+    properties = read_infer_config(config_path)['property']
+    batch_size = batch_size or int(properties.get('batch-size', 1))
+    gpu_id = int(properties.get('gpu-id', 0)) if gpu_id is None else gpu_id
+    precision = PRECISIONS.get(int(properties.get('network-mode', 0)), 'fp32')
+    engine_path = resolve_path(config_path, properties.get('model-engine-file'))
+    model_path = next((resolve_path(config_path, properties[key])
+                       for key in MODEL_KEYS if properties.get(key)), None)
+
+    problems = []
+    if engine_path is None:
+        problems.append("no model-engine-file, nvinfer will build the engine on every start")
+    else:
+        match = ENGINE_NAME.search(engine_path.name)
+        if match:
+            engine_batch, engine_gpu, engine_precision = int(match.group(1)), int(match.group(2)), match.group(3)
+            if engine_batch < batch_size:
+                problems.append(f"engine is built for batch {engine_batch}, config needs {batch_size}")
+            elif engine_batch != batch_size:
+                problems.append(f"engine batch {engine_batch} differs from batch-size {batch_size}")
+            if engine_gpu != gpu_id:
+                problems.append(f"engine is built for gpu {engine_gpu}, config uses gpu {gpu_id}")
+            if engine_precision != precision:
+                problems.append(f"engine precision {engine_precision}, network-mode asks for {precision}")
+        if not engine_path.exists():
+            problems.append(f"engine file {engine_path} does not exist")
+    if model_path is None:
+        problems.append("no model file to build an engine from")
+    elif not model_path.exists():
+        problems.append(f"model file {model_path} does not exist")
+    return EngineCheck(Path(config_path), engine_path, model_path, batch_size, gpu_id, precision, problems)
+
+
+def engine_is_usable(check):
+    if check.engine_path is None or not check.engine_path.exists():
+        return False
+    match = ENGINE_NAME.search(check.engine_path.name)
+    return bool(match) and int(match.group(1)) >= check.batch_size and \
+        int(match.group(2)) == check.gpu_id and match.group(3) == check.precision
+
+
+def cache_key(check):
+    # Anything that changes the built engine goes into the key
+    sha = hashlib.sha256()
+    sha.update(str(check.model_path).encode())
+    if check.model_path is not None and check.model_path.exists():
+        stat = check.model_path.stat()
+        sha.update(f"{stat.st_size}:{stat.st_mtime_ns}".encode())
+    properties = read_infer_config(check.config_path)['property']
+    for key in ('infer-dims', 'input-dims', 'int8-calib-file', 'output-blob-names', 'network-type'):
+        sha.update(f"{key}={properties.get(key, '')}".encode())
+    return sha.hexdigest()[:16]
+
+
+def model_version(config_path):
+    # Changes whenever the config or any file it points at (engine, model,
+    # labels, custom parser) changes, so cached results can be invalidated
+    sha = hashlib.sha256(Path(config_path).read_bytes())
+    properties = read_infer_config(config_path)['property']
+    for key in PATH_KEYS:
+        path = resolve_path(config_path, properties.get(key))
+        if path is not None and path.exists():
+            stat = path.stat()
+            sha.update(f"{key}={path}:{stat.st_size}:{stat.st_mtime_ns}".encode())
+    return sha.hexdigest()[:16]
+
+
+def cached_engine_path(check, cache_dir):
+    model_name = check.model_path.name if check.model_path is not None else check.config_path.stem
+    return Path(cache_dir) / cache_key(check) / \
+        f"{model_name}_b{check.batch_size}_gpu{check.gpu_id}_{check.precision}.engine"
+
+
+def write_config_overlay(config_path, overrides, overlay_path, comment):
+    # Copy of an nvinfer config with some [property] values replaced;
+    # relative paths are made absolute since the overlay lives elsewhere
+    config = read_infer_config(config_path)
+    properties = config['property']
+    for key in PATH_KEYS:
+        if properties.get(key):
+            properties[key] = str(resolve_path(config_path, properties[key]))
+    for key, value in overrides.items():
+        properties[key] = str(value)
+    overlay_path = Path(overlay_path)
+    overlay_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(overlay_path, 'w') as f:
+        f.write(f"# {comment}\n")
+        config.write(f)
+    return overlay_path
+
+
+def write_overlay(check, engine_path, overlay_path):
+    overrides = {'model-engine-file': engine_path, 'batch-size': check.batch_size, 'gpu-id': check.gpu_id}
+    return write_config_overlay(check.config_path, overrides, overlay_path,
+                                f"Generated from {check.config_path} by the engine cache")
+
+
+def built_engine_candidates(check):
+    # Where nvinfer serializes an engine it had to build: next to the model,
+    # or the current directory if the model folder is read-only
+    name = f"{check.model_path.name}_b{check.batch_size}_gpu{check.gpu_id}_{check.precision}.engine"
+    return [check.model_path.parent / name, Path.cwd() / name]
+
+
+def run_inference(config_path, batch_size, gpu_id, width=720, height=320, rounds=2, timeout=900):
+    # Runs the config's engine in a throwaway pipeline of its own: builds and
+    # serializes the engine if it is missing, and otherwise gets the engine
+    # file into the page cache and the CUDA/TensorRT libraries loaded and
+    # initialized on the GPU. It does not warm the nvinfer instance of the
+    # pipeline that runs afterwards, which still deserializes the engine and
+    # creates its own CUDA context when it starts, only the one-off costs
+    # behind that. One test source per batch slot makes the muxer push full
+    # batches of batch_size, and the config is run as a primary detector
+    # (process-mode=1) so the test frames reach inference even when it
+    # normally works on another model's objects. Returns seconds taken; an
+    # engine build can take minutes, so the wait is bounded by timeout.
+    import gi
+    gi.require_version('Gst', '1.0')
+    from gi.repository import Gst
+    Gst.init(None)
+
+    sources = " ".join(
+        f"videotestsrc num-buffers={rounds} ! video/x-raw,width={width},height={height} ! "
+        f"nvvideoconvert gpu-id={gpu_id} ! m.sink_{index}" for index in range(batch_size))
+    pipeline = Gst.parse_launch(
+        f"{sources} nvstreammux name=m batch-size={batch_size} width={width} height={height} "
+        f"gpu-id={gpu_id} batched-push-timeout=4000000 ! "
+        f"nvinfer name=infer config-file-path={config_path} batch-size={batch_size} gpu-id={gpu_id} "
+        f"process-mode=1 ! fakesink")
+    start = time.perf_counter()
+    try:
+        if pipeline.set_state(Gst.State.PLAYING) == Gst.StateChangeReturn.FAILURE:
+            raise RuntimeError(f"{config_path}: warm-up pipeline failed to start")
+        message = pipeline.get_bus().timed_pop_filtered(
+            timeout * Gst.SECOND, Gst.MessageType.EOS | Gst.MessageType.ERROR)
+        if message is None:
+            raise RuntimeError(f"{config_path}: warm-up did not finish within {timeout}s")
+        if message.type == Gst.MessageType.ERROR:
+            err, debug = message.parse_error()
+            raise RuntimeError(f"{err}: {debug}")
+    finally:
+        pipeline.set_state(Gst.State.NULL)
+    return time.perf_counter() - start
+
+
+def prepare_engine(config_path, cache_dir="engine_cache", batch_size=None, gpu_id=None, warm_up=True):
+    # Returns the config nvinfer should use: the original one if its engine
+    # already matches, otherwise an overlay pointing at a cached engine,
+    # building that engine first if needed
+    check = check_engine(config_path, batch_size, gpu_id)
+    for problem in check.problems:
+        print(f"{config_path}: {problem}")
+    if engine_is_usable(check):
+        if warm_up:
+            print(f"{config_path}: warm-up took {run_inference(config_path, check.batch_size, check.gpu_id):.2f}s")
+        return Path(config_path)
+
+    engine_path = cached_engine_path(check, cache_dir)
+    overlay_path = write_overlay(check, engine_path, engine_path.with_suffix('.txt'))
+    if engine_path.exists():
+        print(f"{config_path}: using cached engine {engine_path}")
+        if warm_up:
+            print(f"{config_path}: warm-up took {run_inference(overlay_path, check.batch_size, check.gpu_id):.2f}s")
+        return overlay_path
+
+    if check.model_path is None or not check.model_path.exists():
+        raise RuntimeError(f"{config_path}: cannot build an engine without the model file")
+    print(f"{config_path}: building {engine_path.name}, this can take minutes...")
+    seconds = run_inference(overlay_path, check.batch_size, check.gpu_id)
+    for candidate in built_engine_candidates(check):
+        if candidate.exists():
+            shutil.move(str(candidate), engine_path)
+            break
+    else:
+        raise RuntimeError(f"{config_path}: nvinfer did not leave a serialized engine behind")
+    print(f"{config_path}: engine built and cached in {seconds:.1f}s")
+    return overlay_path
@@ -0,0 +1,149 @@
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import threading
+import time
+from pathlib import Path
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_Q_OVERFLOW = 0x00004000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+EVENT_HEADER = struct.Struct('iIII')
+
+
+def load_inotify():
+    libc_name = ctypes.util.find_library('c')
+    if not libc_name:
+        return None
+    libc = ctypes.CDLL(libc_name, use_errno=True)
+    if not hasattr(libc, 'inotify_init1'):
+        return None
+    libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+    return libc
+
+
+class FolderWatcher:
+    # Yields files dropped into a folder once they are complete: with inotify
+    # that is IN_CLOSE_WRITE / IN_MOVED_TO, with the polling fallback a file
+    # whose size and mtime stayed the same across two scans. Files already
+    # there when inotify starts get the polling check (or their close event,
+    # whichever comes first), as they may still be being written.
+    def __init__(self, folder, suffixes=('.jpg', '.jpeg', '.png'), poll_interval=0.5,
+                 use_inotify=True):
+        self.folder = Path(folder)
+        self.folder.mkdir(parents=True, exist_ok=True)
+        self.suffixes = tuple(s.lower() for s in suffixes)
+        self.poll_interval = poll_interval
+        self.libc = load_inotify() if use_inotify else None
+        self.stop_event = threading.Event()
+
+    def stop(self):
+        self.stop_event.set()
+
+    def wanted(self, name):
+        return not name.startswith('.') and name.lower().endswith(self.suffixes)
+
+    def existing_files(self):
+        with os.scandir(self.folder) as entries:
+            return sorted(Path(e.path) for e in entries if e.is_file() and self.wanted(e.name))
+
+    def settle(self, candidates, paths):
+        # Splits paths into the ones whose size and mtime are unchanged since
+        # the last scan (the writer is done with them) and the rest, with
+        # their new signatures for the next scan
+        complete, current = [], {}
+        for path in paths:
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            signature = (stat.st_size, stat.st_mtime_ns)
+            if candidates.get(path) == signature:
+                complete.append(path)
+            else:
+                current[path] = signature
+        return complete, current
+
+    def __iter__(self):
+        if self.libc is not None:
+            fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+            if fd >= 0:
+                return self.watch_inotify(fd)
+            print(f"inotify unavailable ({os.strerror(ctypes.get_errno())}), polling {self.folder}")
+        return self.watch_polling()
+
+    def watch_inotify(self, fd):
+        try:
+            wd = self.libc.inotify_add_watch(fd, str(self.folder).encode(), IN_CLOSE_WRITE | IN_MOVED_TO)
+            if wd < 0:
+                raise OSError(ctypes.get_errno(), f"inotify_add_watch failed for {self.folder}")
+            # Files that were already there when the daemon started. The
+            # watch is added first so nothing slips in between; they are only
+            # yielded once complete, and added to seen then, so the close
+            # event of one still being uploaded is not mistaken for a repeat.
+            _, backlog = self.settle({}, self.existing_files())
+            next_scan = time.monotonic() + self.poll_interval
+            seen = set()
+            while not self.stop_event.is_set():
+                ready, _, _ = select.select([fd], [], [], self.poll_interval)
+                if backlog and time.monotonic() >= next_scan:
+                    complete, backlog = self.settle(backlog, sorted(backlog))
+                    next_scan = time.monotonic() + self.poll_interval
+                    for path in complete:
+                        seen.add(path)
+                        yield path
+                if not ready:
+                    if not backlog:
+                        # Forget the startup backlog once the event stream
+                        # has caught up, so the set doesn't grow forever
+                        seen.clear()
+                    continue
+                try:
+                    data = os.read(fd, 64 * 1024)
+                except OSError as e:
+                    if e.errno == errno.EAGAIN:
+                        continue
+                    raise
+                offset = 0
+                while offset < len(data):
+                    _, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+                    name = data[offset + EVENT_HEADER.size:offset + EVENT_HEADER.size + length]
+                    offset += EVENT_HEADER.size + length
+                    if mask & IN_Q_OVERFLOW:
+                        print("inotify queue overflowed, rescanning input folder")
+                        for path in self.existing_files():
+                            if path not in seen and path not in backlog:
+                                seen.add(path)
+                                yield path
+                        continue
+                    name = name.rstrip(b'\0').decode(errors='surrogateescape')
+                    if mask & IN_ISDIR or not self.wanted(name):
+                        continue
+                    path = self.folder / name
+                    if backlog.pop(path, None) is not None:
+                        # A startup file finished uploading
+                        seen.add(path)
+                    elif path in seen:
+                        continue
+                    yield path
+        finally:
+            os.close(fd)
+
+    def watch_polling(self):
+        seen = set()
+        candidates = {}
+        while not self.stop_event.is_set():
+            complete, candidates = self.settle(candidates, [p for p in self.existing_files() if p not in seen])
+            for path in complete:
+                seen.add(path)
+                yield path
+            # Files moved away (e.g. to the done folder) can be forgotten
+            seen.intersection_update(self.existing_files())
+            self.stop_event.wait(self.poll_interval)
@@ -0,0 +1,199 @@
+import json
+import mmap
+import os
+import threading
+from pathlib import Path
+
+from common.blob_store import file_digest
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+INDEX_VERSION = 1
+
+
+def to_i420(image, width, height):
+    # Planar Y, then U and V at half resolution, as GStreamer's I420 lays it out.
+    # JPEGs opened in YCbCr draft mode skip the colour conversion altogether.
+    if image.mode not in ('RGB', 'YCbCr'):
+        image = image.convert('RGB')
+    if image.mode == 'RGB':
+        image = image.convert('YCbCr')
+    y, cb, cr = image.resize((width, height), Image.BILINEAR).split()
+    half = (width // 2, height // 2)
+    return y.tobytes() + cb.resize(half, Image.BILINEAR).tobytes() + cr.resize(half, Image.BILINEAR).tobytes()
+
+
+class FrameDecoder:
+    # Decodes images straight to I420 at the muxer's resolution. With
+    # dct_scaling, JPEGs are decoded by libjpeg at the smallest 1/2, 1/4 or
+    # 1/8 scale that still covers width x height (PIL's draft mode), so a
+    # 4K camera frame never gets fully decoded just to be shrunk to 720x320.
+    def __init__(self, width=720, height=320, dct_scaling=True):
+        if Image is None:
+            raise RuntimeError("FrameDecoder needs Pillow to decode frames")
+        if width % 2 or height % 2:
+            raise ValueError("I420 frames need an even width and height")
+        self.width = width
+        self.height = height
+        self.dct_scaling = dct_scaling
+        self.frame_size = width * height * 3 // 2
+        self.lock = threading.Lock()
+        self.decoded = 0
+        self.scaled = 0
+
+    @property
+    def caps(self):
+        # JPEG (and PIL's YCbCr) is full-range BT.601
+        return (f"video/x-raw,format=I420,width={self.width},height={self.height},"
+                f"colorimetry=1:4:0:0,framerate=0/1")
+
+    def decode(self, path):
+        with Image.open(path) as image:
+            full_size = image.size
+            if self.dct_scaling and image.format == 'JPEG':
+                image.draft('YCbCr', (self.width, self.height))
+            scaled = image.size != full_size
+            frame = to_i420(image, self.width, self.height)
+        with self.lock:
+            self.decoded += 1
+            self.scaled += scaled
+        return frame
+
+    def get(self, path):
+        return self.decode(path)
+
+    def report(self):
+        print(f"Frame decoder: {self.decoded} images decoded to {self.width}x{self.height}, "
+              f"{self.scaled} of them at a reduced DCT scale")
+
+    def close(self):
+        pass
+
+
+class FrameCache:
+    # Decoded frames, already scaled to the muxer's resolution, stored as
+    # fixed-size I420 slots in one raw file that is memory-mapped for reading.
+    # index.json maps each source file to its slot together with the mtime,
+    # size and sha256 it had when decoded; a changed mtime or size triggers a
+    # hash check, and a changed hash re-decodes the file into the same slot.
+    def __init__(self, directory, width=720, height=320, dct_scaling=True):
+        self.decoder = FrameDecoder(width, height, dct_scaling)
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.width = width
+        self.height = height
+        self.frame_size = self.decoder.frame_size
+        self.index_path = self.directory / "index.json"
+        self.frames_path = self.directory / "frames.i420"
+        self.lock = threading.Lock()
+        self.entries = {}
+        self.next_slot = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidated = 0
+        self.load_index()
+        self.fd = os.open(self.frames_path, os.O_RDWR | os.O_CREAT, 0o644)
+        self.map = None
+        self.mapped_size = 0
+
+    @property
+    def caps(self):
+        return self.decoder.caps
+
+    def load_index(self):
+        try:
+            with open(self.index_path) as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            return
+        if (index.get('version'), index.get('width'), index.get('height'), index.get('dct_scaling')) != \
+                (INDEX_VERSION, self.width, self.height, self.decoder.dct_scaling):
+            # Built for another muxer resolution or decode mode, start over
+            print(f"Frame cache {self.directory} was built with other decode settings, rebuilding")
+            return
+        self.entries = index['entries']
+        self.next_slot = index['next_slot']
+
+    def save(self):
+        with self.lock:
+            index = {'version': INDEX_VERSION, 'width': self.width, 'height': self.height,
+                     'dct_scaling': self.decoder.dct_scaling, 'next_slot': self.next_slot, 'entries': self.entries}
+        tmp_path = self.index_path.with_suffix('.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(index, f)
+        os.replace(tmp_path, self.index_path)
+
+    def is_current(self, entry, stat, path):
+        if entry['mtime_ns'] == stat.st_mtime_ns and entry['size'] == stat.st_size:
+            return True
+        if entry['size'] == stat.st_size and file_digest(path) == entry['sha256']:
+            # Touched or copied, same content
+            entry['mtime_ns'] = stat.st_mtime_ns
+            return True
+        return False
+
+    def get(self, path):
+        # Returns the frame for path, decoding it into the cache on a miss
+        key = str(path)
+        stat = os.stat(path)
+        with self.lock:
+            entry = self.entries.get(key)
+        if entry is not None and self.is_current(entry, stat, path):
+            frame = self.read(entry['slot'])
+            if frame is not None:
+                with self.lock:
+                    self.hits += 1
+                return frame
+
+        frame = self.decoder.decode(path)
+        digest = file_digest(path)
+        with self.lock:
+            if entry is not None:
+                self.invalidated += 1
+                slot = entry['slot']
+            else:
+                self.misses += 1
+                slot = self.next_slot
+                self.next_slot += 1
+            self.entries[key] = {'slot': slot, 'mtime_ns': stat.st_mtime_ns,
+                                 'size': stat.st_size, 'sha256': digest}
+        os.pwrite(self.fd, frame, slot * self.frame_size)
+        return frame
+
+    def read(self, slot):
+        offset = slot * self.frame_size
+        with self.lock:
+            if offset + self.frame_size > self.mapped_size:
+                # The file grew since it was mapped
+                if self.map is not None:
+                    self.map.close()
+                self.map = None
+                self.mapped_size = os.fstat(self.fd).st_size
+                if offset + self.frame_size > self.mapped_size:
+                    # Indexed but never written, e.g. after a crash
+                    self.mapped_size = 0
+                    return None
+                self.map = mmap.mmap(self.fd, self.mapped_size, prot=mmap.PROT_READ)
+            return self.map[offset:offset + self.frame_size]
+
+    @property
+    def size_bytes(self):
+        return os.fstat(self.fd).st_size
+
+    def report(self):
+        lookups = self.hits + self.misses + self.invalidated
+        hit_rate = self.hits / lookups * 100 if lookups else 0.0
+        print(f"Frame cache: {self.hits} hits, {self.misses} misses, {self.invalidated} invalidated "
+              f"({hit_rate:.1f}% hit rate), {len(self.entries)} frames, "
+              f"{self.size_bytes / 1e6:.1f} MB in {self.frames_path}")
+
+    def close(self):
+        self.save()
+        with self.lock:
+            if self.map is not None:
+                self.map.close()
+                self.map = None
+        os.close(self.fd)
@@ -0,0 +1,53 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+
+class FrameEncoder:
+    # JPEG-encodes raw RGBA frames on a pool of threads (Pillow releases the
+    # GIL while encoding). At most max_pending frames wait, after which
+    # submit() blocks and the pipeline feels the backpressure.
+    def __init__(self, output_dir, workers=4, quality=85, max_pending=None):
+        if Image is None:
+            raise RuntimeError("FrameEncoder needs Pillow")
+        self.output_dir = Path(output_dir)
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        self.quality = quality
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="frame-encoder")
+        self.slots = threading.BoundedSemaphore(max_pending or workers * 2)
+        self.lock = threading.Lock()
+        self.written = 0
+        self.failed = 0
+
+    @staticmethod
+    def available():
+        return Image is not None
+
+    def submit(self, data, width, height, stride, name):
+        self.slots.acquire()
+        try:
+            self.pool.submit(self.encode, data, width, height, stride, name)
+        except Exception:
+            self.slots.release()
+            raise
+
+    def encode(self, data, width, height, stride, name):
+        try:
+            image = Image.frombuffer('RGBA', (width, height), data, 'raw', 'RGBA', stride, 1)
+            image.convert('RGB').save(self.output_dir / name, quality=self.quality)
+            with self.lock:
+                self.written += 1
+        except Exception as e:
+            with self.lock:
+                self.failed += 1
+            print(f"Error encoding {name}: {str(e)}")
+        finally:
+            self.slots.release()
+
+    def close(self):
+        self.pool.shutdown(wait=True)
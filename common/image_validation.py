@@ -0,0 +1,193 @@
+import os
+import shutil
+import struct
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+try:
+    from PIL import Image
+except ImportError:
+    # Without Pillow only the header/structure checks run
+    Image = None
+
+MAX_DIMENSION = 16384
+MIN_DIMENSION = 16
+
+# SOFn markers carrying the frame size (everything from C0-CF except the
+# DHT, JPG and DAC markers)
+JPEG_SOF_MARKERS = set(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+
+class InvalidImage(Exception):
+    pass
+
+
+def jpeg_dimensions(f):
+    f.seek(2)
+    width = height = None
+    while True:
+        byte = f.read(1)
+        while byte == b'\xff':
+            byte = f.read(1)
+        if not byte:
+            raise InvalidImage("truncated JPEG header")
+        marker = byte[0]
+        if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7:
+            continue
+        length_bytes = f.read(2)
+        if len(length_bytes) < 2:
+            raise InvalidImage("truncated JPEG segment")
+        length = struct.unpack('>H', length_bytes)[0]
+        if length < 2:
+            raise InvalidImage("corrupt JPEG segment length")
+        if marker in JPEG_SOF_MARKERS:
+            data = f.read(5)
+            if len(data) < 5:
+                raise InvalidImage("truncated JPEG frame header")
+            height, width = struct.unpack('>HH', data[1:5])
+            f.seek(length - 7, os.SEEK_CUR)
+        elif marker == 0xDA:
+            if width is None:
+                raise InvalidImage("JPEG scan before frame header")
+            return width, height
+        else:
+            f.seek(length - 2, os.SEEK_CUR)
+
+
+def png_dimensions(f):
+    f.seek(8)
+    chunk = f.read(8 + 13)
+    if len(chunk) < 21 or chunk[4:8] != b'IHDR':
+        raise InvalidImage("missing PNG IHDR chunk")
+    return struct.unpack('>II', chunk[8:16])
+
+
+def check_image(path):
+    # Returns (format, width, height); raises InvalidImage with the reason
+    size = os.path.getsize(path)
+    if size == 0:
+        raise InvalidImage("empty file")
+    with open(path, 'rb') as f:
+        head = f.read(8)
+        if head[:3] == b'\xff\xd8\xff':
+            image_format = 'jpeg'
+            width, height = jpeg_dimensions(f)
+            trailer_marker = b'\xff\xd9'
+        elif head == b'\x89PNG\r\n\x1a\n':
+            image_format = 'png'
+            width, height = png_dimensions(f)
+            trailer_marker = b'IEND'
+        else:
+            raise InvalidImage("unsupported format")
+
+        if Image is None:
+            # Without a decoder a missing end marker is the only sign of a
+            # file cut off mid-upload. Camera trailers and padding may follow
+            # it, so the whole rest of the file is searched
+            if trailer_marker not in f.read():
+                raise InvalidImage(f"truncated {image_format} (no end marker)")
+
+    if not (MIN_DIMENSION <= width <= MAX_DIMENSION and MIN_DIMENSION <= height <= MAX_DIMENSION):
+        raise InvalidImage(f"unsupported dimensions {width}x{height}")
+
+    if Image is not None:
+        # Cheap partial decode: JPEGs are decoded at 1/8 scale via draft(),
+        # which still reads every scan, so a truncated file fails here
+        try:
+            with Image.open(path) as img:
+                img.draft('RGB', (max(1, width // 8), max(1, height // 8)))
+                img.load()
+        except Exception as e:
+            raise InvalidImage(f"decode failed: {e}")
+    return image_format, width, height
+
+
+class ImageValidator:
+    def __init__(self, quarantine_dir="quarantine", workers=4, formats=('jpeg', 'png')):
+        self.quarantine_dir = Path(quarantine_dir)
+        self.workers = workers
+        self.formats = formats
+        self.lock = threading.Lock()
+        self.checked = 0
+        self.quarantined = 0
+
+    def check(self, path):
+        try:
+            image_format, width, height = check_image(path)
+            if image_format not in self.formats:
+                raise InvalidImage(f"{image_format} is not handled by this pipeline")
+        except (InvalidImage, OSError) as e:
+            self.quarantine(path, str(e))
+            return False
+        finally:
+            with self.lock:
+                self.checked += 1
+        return True
+
+    def quarantine(self, path, reason):
+        path = Path(path)
+        self.quarantine_dir.mkdir(exist_ok=True)
+        target = self.quarantine_dir / path.name
+        counter = 1
+        while target.exists():
+            target = self.quarantine_dir / f"{path.stem}_{counter}{path.suffix}"
+            counter += 1
+        try:
+            shutil.move(str(path), target)
+            with open(target.with_name(target.name + ".reason.txt"), 'w') as f:
+                f.write(reason + "\n")
+        except OSError as e:
+            print(f"Failed to quarantine {path}: {str(e)}")
+        with self.lock:
+            self.quarantined += 1
+        print(f"Quarantined {path.name}: {reason}")
+
+    def validate(self, image_files, lookahead=None):
+        # Checks run in the pool up to `lookahead` files ahead of the consumer;
+        # valid files come out in their original order. Live sources use a
+        # lookahead of 1 so a file isn't held back waiting for the next one.
+        lookahead = lookahead or self.workers * 4
+        pending = deque()
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="validator") as pool:
+            for image_path in image_files:
+                pending.append((image_path, pool.submit(self.check, image_path)))
+                if len(pending) >= lookahead:
+                    image_path, future = pending.popleft()
+                    if future.result():
+                        yield image_path
+            while pending:
+                image_path, future = pending.popleft()
+                if future.result():
+                    yield image_path
+
+
+class LatencyWatchdog:
+    # Per-image deadline derived from recently observed latencies instead of
+    # a fixed timeout; until enough samples exist the ceiling is used
+    def __init__(self, min_deadline=2.0, max_deadline=30.0, factor=3.0, window=512, min_samples=20):
+        self.min_deadline = min_deadline
+        self.max_deadline = max_deadline
+        self.factor = factor
+        self.min_samples = min_samples
+        self.samples = deque(maxlen=window)
+        self.lock = threading.Lock()
+
+    def record(self, seconds):
+        with self.lock:
+            self.samples.append(seconds)
+
+    def percentile(self, fraction):
+        with self.lock:
+            samples = sorted(self.samples)
+        if not samples:
+            return None
+        return samples[min(len(samples) - 1, int(len(samples) * fraction))]
+
+    def deadline(self):
+        with self.lock:
+            enough = len(self.samples) >= self.min_samples
+        if not enough:
+            return self.max_deadline
+        return min(self.max_deadline, max(self.min_deadline, self.percentile(0.99) * self.factor))
@@ -0,0 +1,112 @@
+import json
+from collections import Counter, namedtuple
+
+GateRule = namedtuple('GateRule', ['min_width', 'min_height', 'min_confidence'])
+GateRule.__new__.__defaults__ = (0, 0, 0.0)
+
+# Reasons an object is dropped, in the order they are checked
+DROP_REASONS = ('confidence', 'size', 'roi', 'no_vehicle')
+
+
+def point_in_polygon(x, y, polygon):
+    inside = False
+    j = len(polygon) - 1
+    for i in range(len(polygon)):
+        xi, yi = polygon[i]
+        xj, yj = polygon[j]
+        if (yi > y) != (yj > y) and x < (xj - xi) * (y - yi) / (yj - yi) + xi:
+            inside = not inside
+        j = i
+    return inside
+
+
+class RoiMask:
+    # Polygons rasterized once into a coarse grid, so the per-object test on
+    # the streaming thread is a single lookup instead of a polygon walk
+    def __init__(self, polygons, width, height, cell=8):
+        self.cell = cell
+        self.columns = (width + cell - 1) // cell
+        self.rows = (height + cell - 1) // cell
+        self.mask = bytearray(self.columns * self.rows)
+        for row in range(self.rows):
+            y = row * cell + cell / 2
+            for column in range(self.columns):
+                x = column * cell + cell / 2
+                if any(point_in_polygon(x, y, polygon) for polygon in polygons):
+                    self.mask[row * self.columns + column] = 1
+
+    def contains(self, x, y):
+        # Points on or past the frame edge (a box touching the bottom has its
+        # anchor at y == height) count as the nearest cell inside the frame
+        column = min(max(int(x) // self.cell, 0), self.columns - 1)
+        row = min(max(int(y) // self.cell, 0), self.rows - 1)
+        return self.mask[row * self.columns + column] == 1
+
+
+class ObjectGate:
+    # Decides which detections are passed on to the next inference stage.
+    # Config is JSON with a rule per stage and optional ROI polygons per
+    # source, in muxer coordinates:
+    #
+    #   {"vehicles": {"min_width": 60, "min_height": 40, "min_confidence": 0.4},
+    #    "plates": {"min_width": 40, "min_height": 15, "require_vehicle": true},
+    #    "rois": {"0": [[[0, 400], [1920, 400], [1920, 1080], [0, 1080]]]}}
+    #
+    # An object is inside the ROI when the bottom centre of its box is; a
+    # source without polygons has no ROI. Counts of objects seen, passed and
+    # dropped (by reason) are kept per stage.
+    def __init__(self, rules=None, rois=None, require_vehicle=False, width=1920, height=1080):
+        self.rules = rules or {}
+        self.require_vehicle = require_vehicle
+        self.masks = {int(source_id): RoiMask(polygons, width, height)
+                      for source_id, polygons in (rois or {}).items() if polygons}
+        self.seen = Counter()
+        self.passed = Counter()
+        self.dropped = Counter()
+
+    @classmethod
+    def load(cls, path, width=1920, height=1080):
+        with open(path) as f:
+            config = json.load(f)
+        rules = {}
+        require_vehicle = False
+        for stage in ('vehicles', 'plates'):
+            settings = dict(config.get(stage, {}))
+            if stage == 'plates':
+                require_vehicle = bool(settings.pop('require_vehicle', False))
+            rules[stage] = GateRule(**settings)
+        return cls(rules, config.get('rois'), require_vehicle, width, height)
+
+    def drop_reason(self, stage, source_id, left, top, width, height, confidence, vehicles=None):
+        rule = self.rules.get(stage)
+        if rule is not None:
+            if confidence < rule.min_confidence:
+                return 'confidence'
+            if width < rule.min_width or height < rule.min_height:
+                return 'size'
+        mask = self.masks.get(source_id)
+        if mask is not None and not mask.contains(left + width / 2, top + height):
+            return 'roi'
+        if stage == 'plates' and self.require_vehicle and vehicles is not None:
+            x, y = left + width / 2, top + height / 2
+            if not any(vl <= x <= vl + vw and vt <= y <= vt + vh for vl, vt, vw, vh in vehicles):
+                return 'no_vehicle'
+        return None
+
+    def keep(self, stage, source_id, left, top, width, height, confidence, vehicles=None):
+        self.seen[stage] += 1
+        reason = self.drop_reason(stage, source_id, left, top, width, height, confidence, vehicles)
+        if reason is None:
+            self.passed[stage] += 1
+            return True
+        self.dropped[stage, reason] += 1
+        return False
+
+    def report(self):
+        for stage in ('vehicles', 'plates'):
+            if not self.seen[stage]:
+                continue
+            reasons = ", ".join(f"{reason} {self.dropped[stage, reason]}"
+                                for reason in DROP_REASONS if self.dropped[stage, reason])
+            print(f"Gating {stage}: {self.seen[stage]} detected, {self.passed[stage]} passed to the next stage"
+                  f"{f' (dropped: {reasons})' if reasons else ''}")
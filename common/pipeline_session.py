@@ -0,0 +1,125 @@
+import time
+
+from gi.repository import GLib, Gst
+
+PHASES = ('build', 'preroll', 'run', 'drain', 'teardown')
+
+
+class PipelineSession:
+    # Drives one Gst.Pipeline through PLAYING -> EOS -> NULL and times every
+    # phase. Shutdown waits for the EOS (or an error) to come back on the bus
+    # with a bounded timeout, instead of sending EOS and sleeping.
+    #
+    # on_message(bus, message) sees every bus message first; the session
+    # itself ends run() on EOS or ERROR. Pass build_started (a
+    # time.perf_counter() value) to have the build phase recorded.
+    def __init__(self, pipeline, on_message=None, build_started=None):
+        self.pipeline = pipeline
+        self.on_message = on_message
+        self.timings = dict.fromkeys(PHASES, 0.0)
+        if build_started is not None:
+            self.timings['build'] = time.perf_counter() - build_started
+        self.loop = GLib.MainLoop()
+        # 'eos', 'error', 'timeout' or 'stopped' once the current run ended
+        self.outcome = None
+        self.error = None
+        self.play_started = None
+        self.timeout_id = None
+        self.bus = pipeline.get_bus()
+        self.bus.add_signal_watch()
+        self.watch_id = self.bus.connect("message", self.bus_call)
+
+    def bus_call(self, bus, message):
+        if self.on_message is not None:
+            self.on_message(bus, message)
+        t = message.type
+        if t == Gst.MessageType.ASYNC_DONE and message.src == self.pipeline:
+            self.prerolled()
+        elif t == Gst.MessageType.EOS:
+            self.finish('eos')
+        elif t == Gst.MessageType.ERROR:
+            self.error = message.parse_error()[0]
+            self.finish('error')
+        return True
+
+    def prerolled(self):
+        if self.play_started is not None:
+            self.timings['preroll'] = time.perf_counter() - self.play_started
+            self.play_started = None
+
+    def finish(self, outcome):
+        if self.outcome is None:
+            self.outcome = outcome
+        self.loop.quit()
+
+    def play(self):
+        self.outcome = None
+        self.error = None
+        self.play_started = time.perf_counter()
+        ret = self.pipeline.set_state(Gst.State.PLAYING)
+        if ret == Gst.StateChangeReturn.FAILURE:
+            return False
+        if ret == Gst.StateChangeReturn.SUCCESS:
+            # Nothing to preroll, e.g. live sources or async=false sinks
+            self.prerolled()
+        return True
+
+    def run(self, timeout=None):
+        # Returns how the run ended: 'eos', 'error', 'timeout' or 'stopped'
+        if timeout is not None:
+            self.timeout_id = GLib.timeout_add(int(timeout * 1000), self.run_timeout)
+        start = time.perf_counter()
+        try:
+            if self.outcome is None:
+                self.loop.run()
+        finally:
+            self.timings['run'] += time.perf_counter() - start
+            if self.timeout_id is not None:
+                GLib.source_remove(self.timeout_id)
+                self.timeout_id = None
+        return self.outcome
+
+    def run_timeout(self):
+        self.timeout_id = None
+        self.finish('timeout')
+        return False
+
+    def stop(self):
+        # Safe to call from any thread; g_main_loop_quit() wakes the loop
+        self.finish('stopped')
+
+    def drain(self, timeout=5.0):
+        # Push an EOS through whatever is still in flight and wait until it
+        # reaches the sinks. Returns True if the pipeline drained cleanly.
+        if self.outcome in ('eos', 'error'):
+            return self.outcome == 'eos'
+        start = time.perf_counter()
+        self.pipeline.send_event(Gst.Event.new_eos())
+        message = self.bus.timed_pop_filtered(int(timeout * Gst.SECOND),
+                                              Gst.MessageType.EOS | Gst.MessageType.ERROR)
+        self.timings['drain'] += time.perf_counter() - start
+        if message is None:
+            return False
+        if message.type == Gst.MessageType.ERROR:
+            self.error = message.parse_error()[0]
+            return False
+        self.outcome = 'eos'
+        return True
+
+    def reset(self):
+        # Back to NULL, ready to play again; this also flushes the bus
+        start = time.perf_counter()
+        self.pipeline.set_state(Gst.State.NULL)
+        self.pipeline.get_state(Gst.CLOCK_TIME_NONE)
+        self.timings['teardown'] += time.perf_counter() - start
+        self.play_started = None
+
+    def close(self):
+        self.reset()
+        if self.watch_id is not None:
+            self.bus.disconnect(self.watch_id)
+            self.bus.remove_signal_watch()
+            self.watch_id = None
+
+    def report(self):
+        return ", ".join(f"{phase} {self.timings[phase] * 1000:.1f} ms" for phase in PHASES)
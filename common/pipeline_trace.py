@@ -0,0 +1,205 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict, defaultdict
+
+import gi
+gi.require_version('Gst', '1.0')
+from gi.repository import Gst
+
+
+def iterate(iterator):
+    while True:
+        result, item = iterator.next()
+        if result == Gst.IteratorResult.RESYNC:
+            iterator.resync()
+            continue
+        if result != Gst.IteratorResult.OK:
+            return
+        yield item
+
+
+class PipelineTrace:
+    # Per-element, per-buffer latency written as a Chrome trace (JSON that
+    # chrome://tracing and ui.perfetto.dev open). Buffer probes on every pad
+    # of every element, including the ones decodebin adds later, time a buffer
+    # from its first arrival on a sink pad to its push on a src pad; buffers
+    # are matched by PTS, which every element here passes through. The span
+    # therefore covers the element's own work plus any wait in it, e.g.
+    # nvstreammux filling a batch or a queue handing over to its thread.
+    # Sources and sinks only get an instant event. Spans are tagged with the
+    # source file and frame number set through begin_image()/tag(), and each
+    # image also gets an async span from its first to its last event, its
+    # critical path through the pipeline.
+    def __init__(self, path, max_events=2000000, pending_limit=4096):
+        self.path = path
+        self.max_events = max_events
+        self.pending_limit = pending_limit
+        self.lock = threading.Lock()
+        self.origin = time.perf_counter()
+        self.pid = os.getpid()
+        self.events = []
+        self.dropped = 0
+        # First arrival on a sink pad by (element, pts)
+        self.started = OrderedDict()
+        # source file/frame number by PTS for streamed buffers, and the
+        # current image for per-image pipelines
+        self.tags = OrderedDict()
+        self.current = {}
+        self.next_frame = 0
+        self.sinks = set()
+        self.thread_names = {}
+        # (source, frame) -> [first, last] timestamp
+        self.images = OrderedDict()
+        self.totals = defaultdict(lambda: [0, 0.0])
+
+    def attach(self, pipeline):
+        # Call once per pipeline, after the static elements are linked and
+        # before adding probes that may drop buffers: probes run in the order
+        # they were added
+        pipeline.connect('deep-element-added', self.element_added)
+        for element in iterate(pipeline.iterate_recurse()):
+            self.watch_element(element)
+
+    def element_added(self, pipeline, bin, element):
+        self.watch_element(element)
+
+    def element_name(self, element):
+        # decodebin's children get a new numbered name every run, name them
+        # after their factory so runs add up
+        parent = element.get_parent()
+        if parent is None or isinstance(parent, Gst.Pipeline):
+            return element.get_name()
+        factory = element.get_factory()
+        return f"{parent.get_name()}/{factory.get_name() if factory else element.get_name()}"
+
+    def watch_element(self, element):
+        if isinstance(element, Gst.Bin):
+            # Its children are watched instead of its ghost pads
+            return
+        name = self.element_name(element)
+        factory = element.get_factory()
+        templates = factory.get_static_pad_templates() if factory else []
+        if templates and not any(template.direction == Gst.PadDirection.SRC for template in templates):
+            self.sinks.add(name)
+        for pad in iterate(element.iterate_pads()):
+            self.watch_pad(pad, name)
+        element.connect('pad-added', lambda element, pad: self.watch_pad(pad, name))
+
+    def watch_pad(self, pad, name):
+        pad.add_probe(Gst.PadProbeType.BUFFER, self.pad_probe, name, pad.get_direction())
+
+    def begin_image(self, source, frame=None):
+        # Per-image pipelines: everything until the next call belongs to
+        # source; without a frame number, frames are numbered by PTS
+        with self.lock:
+            self.started.clear()
+            self.tags.clear()
+            self.current = {'source': str(source), 'frame': frame}
+
+    def tag(self, pts, source, frame):
+        # Streamed buffers: the buffer pushed with pts comes from source
+        with self.lock:
+            self.remember(pts, {'source': str(source), 'frame': frame})
+
+    def remember(self, pts, tags):
+        self.tags[pts] = tags
+        if len(self.tags) > self.pending_limit:
+            self.tags.popitem(last=False)
+
+    def describe(self, pts):
+        tags = self.tags.get(pts)
+        if tags is None:
+            tags = self.current
+            if tags.get('frame') is None and pts is not None:
+                # A video, or images without numbers: number frames as seen
+                tags = dict(tags, frame=self.next_frame)
+                self.next_frame += 1
+                self.remember(pts, tags)
+        return tags
+
+    def pad_probe(self, pad, info, name, direction):
+        now = time.perf_counter()
+        buffer = info.get_buffer()
+        pts = buffer.pts if buffer is not None and buffer.pts != Gst.CLOCK_TIME_NONE else None
+        key = (name, pts)
+        with self.lock:
+            if direction == Gst.PadDirection.SINK:
+                if name in self.sinks:
+                    self.add_event(name, 'element', now, None, pts)
+                elif key not in self.started:
+                    self.started[key] = now
+                    if len(self.started) > self.pending_limit:
+                        # e.g. frames batched with another frame's PTS
+                        self.started.popitem(last=False)
+            else:
+                start = self.started.pop(key, None)
+                # Nothing came in for it: a source element
+                self.add_event(name, 'element', now if start is None else start,
+                               None if start is None else now, pts)
+        return Gst.PadProbeReturn.OK
+
+    def wrap_probe(self, name, probe):
+        # Times a Python pad probe, which runs on the streaming thread
+        def traced_probe(pad, info, *args):
+            start = time.perf_counter()
+            try:
+                return probe(pad, info, *args)
+            finally:
+                end = time.perf_counter()
+                buffer = info.get_buffer()
+                pts = buffer.pts if buffer is not None and buffer.pts != Gst.CLOCK_TIME_NONE else None
+                with self.lock:
+                    self.add_event(name, 'probe', start, end, pts)
+        return traced_probe
+
+    def add_event(self, name, category, start, end, pts):
+        # Called with the lock held; end None makes an instant event
+        if len(self.events) >= self.max_events:
+            self.dropped += 1
+            return
+        thread = threading.get_ident()
+        if thread not in self.thread_names:
+            self.thread_names[thread] = f"streaming thread of {name}"
+        tags = self.describe(pts)
+        event = {'name': name, 'cat': category, 'ts': (start - self.origin) * 1e6,
+                 'pid': self.pid, 'tid': thread, 'args': dict(tags, pts=pts)}
+        if end is None:
+            event.update(ph='i', s='t')
+            end = start
+        else:
+            event.update(ph='X', dur=(end - start) * 1e6)
+            total = self.totals[category, name]
+            total[0] += 1
+            total[1] += end - start
+        self.events.append(event)
+        if 'source' in tags:
+            image = self.images.setdefault((tags['source'], tags.get('frame')), [start, end])
+            image[0] = min(image[0], start)
+            image[1] = max(image[1], end)
+
+    def trace_events(self):
+        events = [{'name': 'thread_name', 'ph': 'M', 'pid': self.pid, 'tid': thread, 'args': {'name': name}}
+                  for thread, name in self.thread_names.items()]
+        events.append({'name': 'process_name', 'ph': 'M', 'pid': self.pid, 'args': {'name': 'lpr pipeline'}})
+        for index, ((source, frame), (first, last)) in enumerate(self.images.items()):
+            span = {'name': os.path.basename(source), 'cat': 'image', 'id': index, 'pid': self.pid,
+                    'tid': 0, 'args': {'source': source, 'frame': frame}}
+            events.append(dict(span, ph='b', ts=(first - self.origin) * 1e6))
+            events.append(dict(span, ph='e', ts=(last - self.origin) * 1e6))
+        return events + self.events
+
+    def report(self):
+        print(f"Trace: {len(self.events)} events for {len(self.images)} images written to {self.path}"
+              f"{f', {self.dropped} dropped over the limit' if self.dropped else ''}")
+        for (category, name), (count, seconds) in sorted(self.totals.items(), key=lambda item: -item[1][1]):
+            print(f"  {name:>32} ({category}): {count:>7} buffers, {seconds * 1000:10.1f} ms total, "
+                  f"{seconds / count * 1000:7.3f} ms/buffer")
+
+    def close(self):
+        with self.lock:
+            events = self.trace_events()
+        with open(self.path, 'w') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+        self.report()
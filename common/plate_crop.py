@@ -0,0 +1,78 @@
+import json
+import os
+import threading
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+
+class PlateCropper:
+    # Cuts the plate out of the source file instead of saving the whole
+    # frame. Boxes come from nvinfer in muxer coordinates (the muxer stretches
+    # every input to frame_width x frame_height), so they are scaled back to
+    # the source's pixels, grown by padding (a fraction of the box's width
+    # and height on each side) and clamped to the image. Images without a box
+    # are saved as a thumbnail no larger than max_size instead.
+    def __init__(self, frame_width=720, frame_height=320, padding=0.1, quality=85, max_size=(320, 320)):
+        if Image is None:
+            raise RuntimeError("plate crops need Pillow")
+        self.frame_width = frame_width
+        self.frame_height = frame_height
+        self.padding = padding
+        self.quality = quality
+        self.max_size = max_size
+
+    def source_box(self, bbox, image_size):
+        image_width, image_height = image_size
+        scale_x = image_width / self.frame_width
+        scale_y = image_height / self.frame_height
+        left, top, width, height = bbox
+        pad_x, pad_y = width * self.padding, height * self.padding
+        box = (int((left - pad_x) * scale_x), int((top - pad_y) * scale_y),
+               int((left + width + pad_x) * scale_x + 0.5), int((top + height + pad_y) * scale_y + 0.5))
+        box = (max(0, box[0]), max(0, box[1]), min(image_width, box[2]), min(image_height, box[3]))
+        if box[2] <= box[0] or box[3] <= box[1]:
+            # Box outside the frame, keep the whole image rather than nothing
+            return None
+        return box
+
+    def crop(self, source_path, bbox, output_path):
+        # Writes the crop as a JPEG and returns the (left, top, right, bottom)
+        # it was cut from in source pixels, None for a thumbnail
+        with Image.open(source_path) as image:
+            box = self.source_box(bbox, image.size) if bbox else None
+            if box is not None:
+                thumbnail = image.crop(box)
+            else:
+                image.draft('RGB', self.max_size)
+                thumbnail = image.copy()
+                thumbnail.thumbnail(self.max_size)
+            if thumbnail.mode != 'RGB':
+                thumbnail = thumbnail.convert('RGB')
+            thumbnail.save(output_path, 'JPEG', quality=self.quality)
+        return box
+
+
+class CropLog:
+    # crops.jsonl next to the crops: one line per crop with the file it was
+    # cut from and the boxes, appended by the writer threads
+    def __init__(self, output_dir):
+        self.path = os.path.join(output_dir, "crops.jsonl")
+        self.lock = threading.Lock()
+        self.file = open(self.path, 'a', encoding='utf-8')
+
+    def write(self, crop_path, result, box):
+        line = json.dumps({'file': os.path.basename(crop_path), 'source': str(result.image_path),
+                           'plate_number': result.plate_number, 'confidence': result.confidence,
+                           'bbox': list(result.bbox) if result.bbox else None,
+                           'source_box': list(box) if box else None, 'timestamp': result.timestamp})
+        with self.lock:
+            self.file.write(line + "\n")
+            self.file.flush()
+        return len(line) + 1
+
+    def close(self):
+        with self.lock:
+            self.file.close()
@@ -0,0 +1,215 @@
+import json
+import os
+import re
+import socket
+import socketserver
+import threading
+from collections import namedtuple
+from pathlib import Path
+
+# Characters LPRNet commonly mixes up are folded onto one representative,
+# so "O8C123" and "0BC123" are the same key at distance 0
+CONFUSABLES = str.maketrans({
+    'O': '0', 'Q': '0', 'D': '0',
+    'I': '1', 'L': '1',
+    'Z': '2',
+    'S': '5',
+    'G': '6',
+    'B': '8',
+})
+
+SEPARATORS = re.compile(r'[\s_\-.]+')
+# "{plate}_{n}" as handed out by PlateNameIndex for the n-th repeat
+COUNTER_SUFFIX = re.compile(r'^(.*)_(\d+)$')
+IMAGE_SUFFIXES = ('.jpg', '.jpeg', '.png')
+
+PlateRecord = namedtuple('PlateRecord', ['plate_number', 'source_file', 'timestamp', 'confidence'])
+PlateMatch = namedtuple('PlateMatch', ['distance', 'plate_number', 'records'])
+
+
+def fold_plate(plate_number):
+    return SEPARATORS.sub('', plate_number.upper()).translate(CONFUSABLES)
+
+
+def deletions(key, max_distance):
+    # Every string reachable from key by deleting up to max_distance chars
+    result = {key}
+    level = {key}
+    for _ in range(max_distance):
+        level = {k[:i] + k[i + 1:] for k in level for i in range(len(k))}
+        result |= level
+    return result
+
+
+def edit_distance(a, b, limit):
+    # Levenshtein distance, giving up (returning limit + 1) as soon as the
+    # best row value exceeds limit
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+
+class PlateIndex:
+    # Symmetric-delete index: each folded plate is filed under all of its
+    # deletion variants, and a query only looks up its own variants. Lookups
+    # are a handful of dict hits regardless of how many plates are indexed.
+    def __init__(self, max_distance=1):
+        self.max_distance = max_distance
+        self.records = {}
+        self.variants = {}
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return sum(len(records) for records in self.records.values())
+
+    def add(self, plate_number, source_file=None, timestamp=None, confidence=None):
+        key = fold_plate(plate_number)
+        if not key:
+            return
+        record = PlateRecord(plate_number, source_file, timestamp, confidence)
+        with self.lock:
+            records = self.records.get(key)
+            if records is not None:
+                records.append(record)
+                return
+            self.records[key] = [record]
+            for variant in deletions(key, self.max_distance):
+                keys = self.variants.get(variant)
+                if keys is None:
+                    self.variants[variant] = key
+                elif isinstance(keys, str):
+                    self.variants[variant] = [keys, key]
+                else:
+                    keys.append(key)
+
+    def search(self, plate_number, max_distance=1):
+        if max_distance > self.max_distance:
+            raise ValueError(f"index was built for distance <= {self.max_distance}")
+        query = fold_plate(plate_number)
+        candidates = set()
+        with self.lock:
+            for variant in deletions(query, max_distance):
+                keys = self.variants.get(variant)
+                if keys is None:
+                    continue
+                if isinstance(keys, str):
+                    candidates.add(keys)
+                else:
+                    candidates.update(keys)
+            matches = []
+            for key in candidates:
+                distance = edit_distance(query, key, max_distance)
+                if distance <= max_distance:
+                    records = list(self.records[key])
+                    matches.append(PlateMatch(distance, records[-1].plate_number, records))
+        matches.sort(key=lambda m: (m.distance, -len(m.records)))
+        return matches
+
+    def load_sqlite(self, path):
+        from common.results_store import connect
+        connection = connect(str(path))
+        try:
+            rows = connection.execute(
+                "SELECT plate, source_file, recognized_at, confidence FROM recognitions")
+            for plate, source_file, timestamp, confidence in rows:
+                self.add(plate, source_file, timestamp, confidence)
+        finally:
+            connection.close()
+
+    def load_jsonl(self, directory):
+        for path in sorted(Path(directory).glob("*.jsonl")):
+            with open(path, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue
+                    self.add(record['plate'], record.get('source_file'),
+                             record.get('recognized_at'), record.get('confidence'))
+
+    def load_folder(self, directory):
+        # recognized_plates/ mostly knows the plate from the file name; the
+        # crops.jsonl of the crop output mode has the exact text
+        directory = Path(directory)
+        exact = {}
+        crop_log = directory / "crops.jsonl"
+        if crop_log.exists():
+            with open(crop_log, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue
+                    exact[record['file']] = (record['plate_number'], record.get('confidence'))
+        paths = [path for path in directory.iterdir()
+                 if path.is_file() and not path.name.startswith('.') and path.suffix.lower() in IMAGE_SUFFIXES]
+        names = {path.name for path in paths}
+        for path in paths:
+            plate, confidence = exact.get(path.name, (path.stem, None))
+            if path.name not in exact:
+                # PlateNameIndex only adds "_n" once "{plate}{ext}" is taken,
+                # otherwise the digits are part of the plate ("AB 12" -> AB_12)
+                match = COUNTER_SUFFIX.match(path.stem)
+                if match and f"{match.group(1)}{path.suffix}" in names:
+                    plate = match.group(1)
+            self.add(plate, str(path), path.stat().st_mtime, confidence)
+
+
+class PlateSearchServer:
+    # Answers plate_search.py queries from a live index over a Unix socket,
+    # one JSON request and one JSON reply per line:
+    #   {"plate": "ABC123", "distance": 1, "limit": 5}
+    #   [{"distance": 0, "plate_number": "ABC123", "records": [[plate, file, time, conf], ...]}, ...]
+    def __init__(self, index, path):
+        self.index = index
+        self.path = str(path)
+        if os.path.exists(self.path):
+            # Left behind by a previous run
+            os.unlink(self.path)
+        index = self.index
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                for line in self.rfile:
+                    try:
+                        request = json.loads(line)
+                        matches = index.search(request['plate'], request.get('distance', 1))
+                        limit = request.get('limit', 5)
+                        reply = [{'distance': m.distance, 'plate_number': m.plate_number,
+                                  'sightings': len(m.records), 'records': [list(r) for r in m.records[-limit:]]}
+                                 for m in matches]
+                    except (ValueError, KeyError) as e:
+                        reply = {'error': str(e)}
+                    self.wfile.write(json.dumps(reply).encode() + b"\n")
+
+        self.server = socketserver.ThreadingUnixStreamServer(self.path, Handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, name="plate-search", daemon=True)
+        self.thread.start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+
+def query_server(path, plate_number, max_distance=1, limit=5):
+    # Client side of PlateSearchServer
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.connect(str(path))
+        request = {'plate': plate_number, 'distance': max_distance, 'limit': limit}
+        client.sendall(json.dumps(request).encode() + b"\n")
+        reply = client.makefile('rb').readline()
+    reply = json.loads(reply)
+    if isinstance(reply, dict):
+        raise ValueError(reply['error'])
+    return reply
@@ -0,0 +1,56 @@
+import os
+import re
+import threading
+from pathlib import Path
+
+SUFFIX_PATTERN = re.compile(r'^(.*)_(\d+)$')
+
+
+class PlateNameIndex:
+    # Hands out "{plate}{ext}", "{plate}_1{ext}", ... without probing the
+    # directory for every candidate. The folder is scanned once; after that
+    # a per-plate counter says where the next free name starts.
+    def __init__(self, output_dir):
+        self.output_dir = Path(output_dir)
+        self.output_dir.mkdir(exist_ok=True)
+        self.lock = threading.Lock()
+        self.next_counter = {}
+        self.scan()
+
+    def scan(self):
+        with os.scandir(self.output_dir) as entries:
+            for entry in entries:
+                stem, ext = os.path.splitext(entry.name)
+                self.mark_taken(stem, ext, 0)
+                # "ABC_12" may be plate "ABC" #12 or a plate containing an
+                # underscore, count it for both so neither reuses a name
+                match = SUFFIX_PATTERN.match(stem)
+                if match:
+                    self.mark_taken(match.group(1), ext, int(match.group(2)))
+
+    def mark_taken(self, plate_number, file_extension, counter):
+        key = (plate_number, file_extension)
+        if self.next_counter.get(key, 0) <= counter:
+            self.next_counter[key] = counter + 1
+
+    def filename(self, plate_number, file_extension, counter):
+        if counter == 0:
+            return f"{plate_number}{file_extension}"
+        return f"{plate_number}_{counter}{file_extension}"
+
+    def reserve(self, plate_number, file_extension):
+        key = (plate_number, file_extension)
+        with self.lock:
+            counter = self.next_counter.get(key, 0)
+            while True:
+                output_path = self.output_dir / self.filename(plate_number, file_extension, counter)
+                # Create-exclusive guards against other processes writing
+                # into the same folder behind the index's back
+                try:
+                    fd = os.open(output_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+                except FileExistsError:
+                    counter += 1
+                    continue
+                os.close(fd)
+                self.next_counter[key] = counter + 1
+                return output_path
@@ -0,0 +1,88 @@
+import sys
+import threading
+import time
+from collections import deque
+
+OFF, INFO, DEBUG = 0, 1, 2
+LEVELS = {'off': OFF, 'info': INFO, 'debug': DEBUG}
+
+
+class ProbeLog:
+    # Logging for pad probes. write() only appends a (format, args) tuple to a
+    # bounded deque, which is atomic under the GIL, so the streaming thread
+    # never formats strings or touches stdout; a background thread drains the
+    # deque and writes in batches. Arguments must be plain values: pyds
+    # metadata is recycled as soon as the probe returns.
+    #
+    # Callers guard each call with the level flags, so a disabled level costs
+    # one attribute lookup:
+    #
+    #     if plog.debug:
+    #         plog.write("Label: {} ({:.2f})", label.result_label, label.result_prob)
+    def __init__(self, level=INFO, capacity=8192, rate_limit=None, sample_every=1,
+                 stream=None, flush_interval=0.05):
+        self.level = level
+        self.info = level >= INFO
+        self.debug = level >= DEBUG
+        self.capacity = capacity
+        self.rate_limit = rate_limit
+        self.sample_every = max(1, sample_every)
+        self.stream = stream or sys.stdout
+        self.flush_interval = flush_interval
+        self.records = deque()
+        self.seen = 0
+        self.dropped = 0
+        self.suppressed = 0
+        self.window_start = 0.0
+        self.window_count = 0
+        self.stop_event = threading.Event()
+        self.thread = None
+        if level > OFF:
+            self.thread = threading.Thread(target=self.drain_loop, name="probe-log", daemon=True)
+            self.thread.start()
+
+    def write(self, fmt, *args):
+        self.seen += 1
+        if self.sample_every > 1 and self.seen % self.sample_every:
+            return
+        if self.rate_limit is not None:
+            now = time.monotonic()
+            if now - self.window_start >= 1.0:
+                self.window_start = now
+                self.window_count = 0
+            self.window_count += 1
+            if self.window_count > self.rate_limit:
+                self.suppressed += 1
+                return
+        if len(self.records) >= self.capacity:
+            self.dropped += 1
+            return
+        self.records.append((fmt, args))
+
+    def drain(self):
+        lines = []
+        records = self.records
+        while records:
+            fmt, args = records.popleft()
+            try:
+                lines.append(fmt.format(*args) if args else fmt)
+            except Exception as e:
+                lines.append(f"<unformattable log record {fmt!r}: {e}>")
+        if lines:
+            lines.append('')
+            self.stream.write('\n'.join(lines))
+            self.stream.flush()
+
+    def drain_loop(self):
+        while not self.stop_event.wait(self.flush_interval):
+            self.drain()
+
+    def close(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+        self.drain()
+        if self.dropped or self.suppressed:
+            self.stream.write(f"probe log: {self.dropped} records dropped (buffer full), "
+                              f"{self.suppressed} rate-limited\n")
+            self.stream.flush()
@@ -0,0 +1,172 @@
+import json
+import sqlite3
+import threading
+from collections import OrderedDict
+
+from common.blob_store import file_digest
+from common.result_writer import PlateLabel
+
+try:
+    from PIL import Image
+except ImportError:
+    # Perceptual matching needs Pillow, exact matching does not
+    Image = None
+
+
+def perceptual_hash(path):
+    # 64-bit difference hash: brightness gradients of a 9x8 thumbnail, which
+    # survive re-encoding and resizing of the same shot
+    with Image.open(path) as image:
+        image.draft('L', (64, 64))
+        pixels = image.convert('L').resize((9, 8), Image.BILINEAR).tobytes()
+    value = 0
+    for row in range(8):
+        for col in range(8):
+            value = (value << 1) | (pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+    # SQLite integers are signed 64-bit
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def hamming(a, b):
+    return bin((a ^ b) & 0xFFFFFFFFFFFFFFFF).count('1')
+
+
+def hash_chunks(phash, parts):
+    # Splits the 64 bits into parts pieces. Two hashes within parts - 1 bits
+    # of each other agree exactly on at least one piece (pigeonhole), so the
+    # pieces work as bucket keys for the near-duplicate search.
+    value = phash & 0xFFFFFFFFFFFFFFFF
+    bits, extra = divmod(64, parts)
+    chunks = []
+    shift = 0
+    for index in range(parts):
+        width = bits + (index < extra)
+        chunks.append((index, (value >> shift) & ((1 << width) - 1)))
+        shift += width
+    return chunks
+
+
+class ResultCache:
+    # Recognized labels by image content, so resent or re-run images skip
+    # the pipeline. Entries are keyed by (sha256, version) where version
+    # identifies the model/config that produced them (engine_cache.model_version),
+    # kept in SQLite with an in-memory LRU in front. With perceptual=True an
+    # image without an exact match may reuse the labels of one whose
+    # difference hash is within max_distance bits.
+    SCHEMA = """CREATE TABLE IF NOT EXISTS result_cache (
+        digest TEXT NOT NULL,
+        version TEXT NOT NULL,
+        phash INTEGER,
+        labels TEXT NOT NULL,
+        PRIMARY KEY (digest, version))"""
+
+    def __init__(self, path, version, lru_size=4096, perceptual=False, max_distance=4, commit_every=100):
+        if perceptual and Image is None:
+            raise RuntimeError("perceptual matching needs Pillow")
+        self.version = version
+        self.lru_size = lru_size
+        self.perceptual = perceptual
+        self.max_distance = max_distance
+        self.commit_every = commit_every
+        self.lock = threading.Lock()
+        self.lru = OrderedDict()
+        # Digest of every looked-up file still waiting for its result
+        self.pending = {}
+        self.uncommitted = 0
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+        # Lookups and stores come from feeder and streaming threads
+        self.connection = sqlite3.connect(str(path), check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        with self.connection:
+            self.connection.execute(self.SCHEMA)
+        # (piece index, piece value) -> [(phash, labels)], see hash_chunks
+        self.phash_buckets = {}
+        if perceptual:
+            rows = self.connection.execute(
+                "SELECT phash, labels FROM result_cache WHERE version = ? AND phash IS NOT NULL", (version,))
+            for phash, encoded in rows:
+                self.add_phash(phash, encoded)
+
+    def add_phash(self, phash, encoded):
+        for chunk in hash_chunks(phash, self.max_distance + 1):
+            self.phash_buckets.setdefault(chunk, []).append((phash, encoded))
+
+    def remember(self, digest, labels):
+        self.lru[digest] = labels
+        self.lru.move_to_end(digest)
+        if len(self.lru) > self.lru_size:
+            self.lru.popitem(last=False)
+
+    def lookup(self, image_path):
+        # Cached labels for the image, or None if it has to be recognized
+        digest = file_digest(image_path)
+        with self.lock:
+            labels = self.lru.get(digest)
+            if labels is None:
+                row = self.connection.execute(
+                    "SELECT labels FROM result_cache WHERE digest = ? AND version = ?",
+                    (digest, self.version)).fetchone()
+                if row is not None:
+                    labels = self.decode(row[0])
+            if labels is not None:
+                self.remember(digest, labels)
+                self.hits += 1
+                return labels
+
+        phash = perceptual_hash(image_path) if self.perceptual else None
+        with self.lock:
+            if phash is not None:
+                for chunk in hash_chunks(phash, self.max_distance + 1):
+                    for known, encoded in self.phash_buckets.get(chunk, ()):
+                        if hamming(phash, known) <= self.max_distance:
+                            self.near_hits += 1
+                            return self.decode(encoded)
+            self.misses += 1
+            self.pending[str(image_path)] = (digest, phash)
+        return None
+
+    def store(self, image_path, labels):
+        with self.lock:
+            pending = self.pending.pop(str(image_path), None)
+        if pending is None or labels is None:
+            # Not looked up, or failed/timed out: nothing worth caching
+            return
+        digest, phash = pending
+        encoded = json.dumps([[label.plate_number, label.confidence, label.bbox] for label in labels])
+        with self.lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO result_cache (digest, version, phash, labels) VALUES (?, ?, ?, ?)",
+                (digest, self.version, phash, encoded))
+            self.uncommitted += 1
+            if self.uncommitted >= self.commit_every:
+                self.connection.commit()
+                self.uncommitted = 0
+            self.remember(digest, list(labels))
+            if phash is not None:
+                self.add_phash(phash, encoded)
+
+    def discard(self, image_path):
+        # The image looked up as a miss failed or timed out: nothing will be
+        # stored for it, stop waiting
+        with self.lock:
+            self.pending.pop(str(image_path), None)
+
+    @staticmethod
+    def decode(encoded):
+        return [PlateLabel(plate, confidence, tuple(bbox) if bbox else None)
+                for plate, confidence, bbox in json.loads(encoded)]
+
+    def report(self):
+        lookups = self.hits + self.near_hits + self.misses
+        hit_rate = (self.hits + self.near_hits) / lookups * 100 if lookups else 0.0
+        near = f", {self.near_hits} near-duplicate" if self.perceptual else ""
+        print(f"Result cache: {self.hits} hits{near}, {self.misses} misses "
+              f"({hit_rate:.1f}% hit rate over {lookups} images)")
+
+    def close(self):
+        with self.lock:
+            self.connection.commit()
+            self.connection.close()
@@ -0,0 +1,152 @@
+import os
+import queue
+import shutil
+import threading
+import time
+from collections import namedtuple
+from pathlib import Path
+
+from common.blob_store import LINK_MODES, BlobStore
+from common.plate_crop import CropLog, PlateCropper
+from common.plate_naming import PlateNameIndex
+
+# 'crop' saves only the plate region, see common.plate_crop
+OUTPUT_MODES = ('copy', 'crop') + LINK_MODES
+
+# One classifier label read from the NvDs metadata; bbox is the plate's
+# (left, top, width, height) in muxer coordinates, None if unknown
+PlateLabel = namedtuple('PlateLabel', ['plate_number', 'confidence', 'bbox'])
+
+# Compact record handed over by the pad probe; everything else happens on
+# the writer threads so the streaming thread never waits for the disk
+PlateResult = namedtuple('PlateResult', ['image_path', 'plate_number', 'confidence', 'bbox', 'timestamp'],
+                         defaults=(None, None))
+
+
+class ResultWriter:
+    def __init__(self, output_dir, workers=2, max_pending=256, output_mode='copy', verbose=True, cropper=None):
+        if output_mode not in OUTPUT_MODES:
+            raise ValueError(f"Unknown output mode: {output_mode}")
+        self.output_dir = Path(output_dir)
+        self.output_dir.mkdir(exist_ok=True)
+        self.output_mode = output_mode
+        self.verbose = verbose
+        # In link modes each source image is stored once, keyed by content
+        self.blobs = BlobStore(self.output_dir / ".blobs") if output_mode in LINK_MODES else None
+        self.cropper = None
+        self.crop_log = None
+        if output_mode == 'crop':
+            self.cropper = cropper or PlateCropper()
+            self.crop_log = CropLog(self.output_dir)
+        # Bounded so a slow disk pushes back on the pipeline instead of
+        # growing memory without limit
+        self.queue = queue.Queue(maxsize=max_pending)
+        self.names = PlateNameIndex(self.output_dir)
+        self.stats_lock = threading.Lock()
+        self.saved = 0
+        self.failed = 0
+        self.copied_bytes = 0
+        self.save_seconds = 0.0
+        # Saves still queued per source image, and callbacks waiting for them
+        self.outstanding = {}
+        self.idle_callbacks = {}
+        self.threads = []
+        for index in range(workers):
+            thread = threading.Thread(target=self.worker, name=f"result-writer-{index}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def submit(self, result):
+        with self.stats_lock:
+            self.outstanding[result.image_path] = self.outstanding.get(result.image_path, 0) + 1
+        # Blocks while the queue is full (backpressure)
+        self.queue.put(result)
+
+    def when_idle(self, image_path, callback):
+        # Runs callback once every save reading image_path has finished, e.g.
+        # before the source file is moved away
+        with self.stats_lock:
+            if self.outstanding.get(image_path):
+                self.idle_callbacks.setdefault(image_path, []).append(callback)
+                return
+        callback()
+
+    def save_finished(self, image_path):
+        with self.stats_lock:
+            remaining = self.outstanding[image_path] - 1
+            if remaining:
+                self.outstanding[image_path] = remaining
+                return
+            del self.outstanding[image_path]
+            callbacks = self.idle_callbacks.pop(image_path, [])
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                print(f"Error in writer callback: {str(e)}")
+
+    def flush(self):
+        self.queue.join()
+
+    def close(self):
+        self.flush()
+        for _ in self.threads:
+            self.queue.put(None)
+        for thread in self.threads:
+            thread.join()
+        self.threads = []
+        if self.crop_log is not None:
+            self.crop_log.close()
+
+    def worker(self):
+        while True:
+            result = self.queue.get()
+            try:
+                if result is None:
+                    return
+                self.save(result)
+            except Exception as e:
+                with self.stats_lock:
+                    self.failed += 1
+                print(f"Error saving image: {str(e)}")
+            finally:
+                if result is not None:
+                    self.save_finished(result.image_path)
+                self.queue.task_done()
+
+    def save(self, result):
+        start = time.perf_counter()
+        plate_number = result.plate_number.strip().replace(' ', '_')
+        file_extension = '.jpg' if self.cropper is not None else Path(result.image_path).suffix
+        output_path = self.names.reserve(plate_number, file_extension)
+        copied = 0
+        try:
+            if self.cropper is not None:
+                box = self.cropper.crop(result.image_path, result.bbox, output_path)
+                copied = os.path.getsize(output_path) + self.crop_log.write(output_path, result, box)
+            elif self.blobs is None:
+                shutil.copy2(result.image_path, output_path)
+                copied = os.path.getsize(output_path)
+            else:
+                blob_path = self.blobs.put(result.image_path)
+                self.blobs.link(blob_path, output_path, self.output_mode)
+        except Exception:
+            output_path.unlink(missing_ok=True)
+            raise
+        with self.stats_lock:
+            self.saved += 1
+            self.copied_bytes += copied
+            self.save_seconds += time.perf_counter() - start
+        if self.verbose:
+            print(f"Saved image as: {output_path.name} (confidence: {result.confidence:.2f})")
+
+    @property
+    def bytes_written(self):
+        if self.blobs is None:
+            return self.copied_bytes
+        return self.copied_bytes + self.blobs.bytes_written
+
+    def report(self):
+        per_save = self.save_seconds / self.saved * 1000 if self.saved else 0.0
+        print(f"Saved {self.saved} images ({self.output_mode}), {self.failed} failed, "
+              f"{self.bytes_written} bytes written, {per_save:.2f} ms/save")
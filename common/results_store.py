@@ -0,0 +1,175 @@
+import json
+import queue
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+
+class BatchingSink:
+    # Records are queued by the pad probe and written by one background
+    # thread, grouped so each transaction/write covers many recognitions
+    def __init__(self, batch_size=500, flush_interval=0.5, max_pending=10000):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue = queue.Queue(maxsize=max_pending)
+        self.written = 0
+        self.batches = 0
+        self.thread = threading.Thread(target=self.run, name=type(self).__name__, daemon=True)
+        self.thread.start()
+
+    def submit(self, result):
+        self.queue.put(result)
+
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
+
+    def run(self):
+        self.open_store()
+        try:
+            batch = []
+            deadline = None
+            while True:
+                timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+                try:
+                    result = self.queue.get(timeout=timeout)
+                except queue.Empty:
+                    result = False
+                if result:
+                    batch.append(result)
+                    if deadline is None:
+                        deadline = time.monotonic() + self.flush_interval
+                if batch and (result is None or result is False or len(batch) >= self.batch_size):
+                    try:
+                        self.write_batch(batch)
+                        self.written += len(batch)
+                        self.batches += 1
+                    except Exception as e:
+                        print(f"Error writing {len(batch)} results: {str(e)}")
+                    batch = []
+                    deadline = None
+                if result is None:
+                    return
+        finally:
+            self.close_store()
+
+    def open_store(self):
+        pass
+
+    def write_batch(self, batch):
+        raise NotImplementedError
+
+    def close_store(self):
+        pass
+
+
+class SqliteResultSink(BatchingSink):
+    SCHEMA = [
+        """CREATE TABLE IF NOT EXISTS recognitions (
+            id INTEGER PRIMARY KEY,
+            plate TEXT NOT NULL,
+            confidence REAL NOT NULL,
+            source_file TEXT NOT NULL,
+            recognized_at REAL NOT NULL,
+            left REAL, top REAL, width REAL, height REAL)""",
+        "CREATE INDEX IF NOT EXISTS idx_recognitions_plate ON recognitions(plate, recognized_at)",
+        "CREATE INDEX IF NOT EXISTS idx_recognitions_time ON recognitions(recognized_at)",
+    ]
+
+    def __init__(self, path, **kwargs):
+        self.path = str(path)
+        self.connection = None
+        super().__init__(**kwargs)
+
+    def open_store(self):
+        # The connection lives on the sink thread, sqlite objects can't be
+        # shared between threads
+        self.connection = connect(self.path)
+
+    def write_batch(self, batch):
+        rows = [(r.plate_number, r.confidence, str(r.image_path), r.timestamp) + tuple(r.bbox or (None,) * 4)
+                for r in batch]
+        with self.connection:
+            self.connection.executemany(
+                "INSERT INTO recognitions (plate, confidence, source_file, recognized_at, "
+                "left, top, width, height) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+
+    def close_store(self):
+        if self.connection is not None:
+            self.connection.close()
+
+
+def connect(path):
+    connection = sqlite3.connect(path)
+    # WAL lets readers query while the pipeline keeps appending;
+    # synchronous=NORMAL is durable enough in WAL mode and much cheaper
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=NORMAL")
+    with connection:
+        for statement in SqliteResultSink.SCHEMA:
+            connection.execute(statement)
+    return connection
+
+
+def find_plate(path, plate, since=None):
+    connection = connect(path)
+    try:
+        query = ("SELECT plate, confidence, source_file, recognized_at, left, top, width, height "
+                 "FROM recognitions WHERE plate = ?")
+        params = [plate]
+        if since is not None:
+            query += " AND recognized_at >= ?"
+            params.append(since)
+        return connection.execute(query + " ORDER BY recognized_at", params).fetchall()
+    finally:
+        connection.close()
+
+
+class JsonlResultSink(BatchingSink):
+    def __init__(self, directory, max_bytes=64 * 1024 * 1024, **kwargs):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.file = None
+        super().__init__(**kwargs)
+
+    def rotate(self):
+        if self.file is not None:
+            self.file.close()
+        name = time.strftime("results-%Y%m%d-%H%M%S")
+        path = self.directory / f"{name}.jsonl"
+        counter = 1
+        while path.exists():
+            path = self.directory / f"{name}-{counter}.jsonl"
+            counter += 1
+        self.file = open(path, 'a', encoding='utf-8')
+
+    def open_store(self):
+        self.rotate()
+
+    def write_batch(self, batch):
+        lines = []
+        for r in batch:
+            record = {'plate': r.plate_number, 'confidence': r.confidence,
+                      'source_file': str(r.image_path), 'recognized_at': r.timestamp}
+            if r.bbox is not None:
+                record['bbox'] = list(r.bbox)
+            lines.append(json.dumps(record) + "\n")
+        self.file.write("".join(lines))
+        self.file.flush()
+        if self.file.tell() >= self.max_bytes:
+            self.rotate()
+
+    def close_store(self):
+        if self.file is not None:
+            self.file.close()
+
+
+def make_results_sink(args):
+    # The sink chosen by --results-db/--results-jsonl, None without either
+    if args.results_db:
+        return SqliteResultSink(args.results_db)
+    if args.results_jsonl:
+        return JsonlResultSink(args.results_jsonl)
+    return None
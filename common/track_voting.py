@@ -0,0 +1,93 @@
+from collections import namedtuple
+
+# Track ids are only assigned by nvtracker; objects it didn't track carry this
+UNTRACKED_OBJECT_ID = 0xFFFFFFFFFFFFFFFF
+
+TrackResult = namedtuple('TrackResult', ['source_id', 'track_id', 'plate_number', 'confidence',
+                                         'observations', 'best_frame', 'best_bbox', 'best_crop'])
+
+
+class TrackVotes:
+    __slots__ = ('lengths', 'positions', 'observations', 'last_frame',
+                 'best_confidence', 'best_frame', 'best_bbox', 'best_crop')
+
+    def __init__(self):
+        # confidence-weighted votes for the plate length, and for each
+        # length one {char: weight} dict per character position
+        self.lengths = {}
+        self.positions = {}
+        self.observations = 0
+        self.last_frame = 0
+        self.best_confidence = -1.0
+        self.best_frame = None
+        self.best_bbox = None
+        self.best_crop = None
+
+
+class TrackAggregator:
+    # Collects the LPR reading of a vehicle on every frame it is visible and
+    # emits one voted result per track once the track ends or goes stale
+    def __init__(self, ttl_frames=30, max_tracks=1024, min_observations=1):
+        self.ttl_frames = ttl_frames
+        self.max_tracks = max_tracks
+        self.min_observations = min_observations
+        self.tracks = {}
+
+    def update(self, source_id, track_id, plate_number, confidence, frame_num, bbox=None, crop=None):
+        key = (source_id, track_id)
+        votes = self.tracks.get(key)
+        if votes is None:
+            votes = self.tracks[key] = TrackVotes()
+        text = plate_number.strip()
+        weight = max(confidence, 1e-3)
+        votes.observations += 1
+        votes.last_frame = frame_num
+        votes.lengths[len(text)] = votes.lengths.get(len(text), 0.0) + weight
+        positions = votes.positions.get(len(text))
+        if positions is None:
+            positions = votes.positions[len(text)] = [{} for _ in text]
+        for position, char in zip(positions, text):
+            position[char] = position.get(char, 0.0) + weight
+        if confidence > votes.best_confidence:
+            votes.best_confidence = confidence
+            votes.best_frame = frame_num
+            votes.best_bbox = bbox
+            # crop may be a callable so pixels are only copied for a new best
+            votes.best_crop = crop() if callable(crop) else crop
+
+        finished = []
+        if len(self.tracks) > self.max_tracks:
+            # Over budget: finish the track that was updated longest ago
+            oldest = min(self.tracks, key=lambda k: self.tracks[k].last_frame)
+            finished.extend(self.finish(oldest))
+        return finished
+
+    def expire(self, source_id, frame_num):
+        stale = [key for key, votes in self.tracks.items()
+                 if key[0] == source_id and frame_num - votes.last_frame > self.ttl_frames]
+        finished = []
+        for key in stale:
+            finished.extend(self.finish(key))
+        return finished
+
+    def flush(self):
+        finished = []
+        for key in list(self.tracks):
+            finished.extend(self.finish(key))
+        return finished
+
+    def finish(self, key):
+        votes = self.tracks.pop(key)
+        if votes.observations < self.min_observations:
+            return []
+        length = max(votes.lengths, key=votes.lengths.get)
+        chars = []
+        scores = []
+        for position in votes.positions[length]:
+            char = max(position, key=position.get)
+            chars.append(char)
+            scores.append(position[char] / sum(position.values()))
+        # Agreement across frames, scaled by the best single reading
+        confidence = min(scores, default=0.0) * votes.best_confidence
+        return [TrackResult(key[0], key[1], ''.join(chars), confidence, votes.observations,
+                            votes.best_frame, votes.best_bbox, votes.best_crop)]
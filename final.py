@@ -1,38 +1,105 @@
 import gi
 gi.require_version('Gst', '1.0')
 from gi.repository import GObject, Gst, GLib
-import pyds
+try:
+    import pyds
+except ImportError:
+    # Only needed to read nvinfer metadata; stand-in runs work without it
+    pyds = None
 import sys
 import time
 import os
 from pathlib import Path
-import shutil
+import threading
+import queue
+import argparse
+from common.engine_cache import model_version, prepare_engine
+from common.frame_cache import FrameCache, FrameDecoder
+from common.image_validation import ImageValidator, LatencyWatchdog
+from common.pipeline_session import PipelineSession
+from common.pipeline_trace import PipelineTrace
+from common.plate_crop import PlateCropper
+from common.result_cache import ResultCache
+from common.result_writer import OUTPUT_MODES, PlateLabel, PlateResult, ResultWriter
+from common.results_store import make_results_sink
+
+# Spacing of the synthetic timestamps stamped on streamed images; each image
+# gets its own PTS so results coming out of nvinfer map back to a file.
+STREAM_FRAME_DURATION = Gst.SECOND // 30
+
+# Resolution nvstreammux scales every input to
+MUX_WIDTH, MUX_HEIGHT = 720, 320
 
 class LPRPipeline:
-    def __init__(self):
+    def __init__(self, batch_size=1, infer_element="nvinfer", mux_element="nvstreammux",
+                 writer_threads=2, output_mode='copy', num_sources=None, push_timeout=4000000,
+                 results_sink=None, plate_index=None, lpr_config='spec_files/lpr_config.txt',
+                 output_dir="recognized_plates", infer_batch_size=None, gpu_id=None, frame_source=None,
+                 result_cache=None, crop_padding=0.1, crop_quality=85, trace=None):
+        self.batch_size = batch_size
+        # Microseconds nvstreammux waits to fill a batch before pushing it
+        self.push_timeout = push_timeout
+        # nvinfer may run a different batch size than the muxer
+        self.infer_batch_size = infer_batch_size
+        # Overrides gpu-id from the config files, e.g. one GPU per worker process
+        self.gpu_id = gpu_id
+        # Optional common.frame_cache.FrameCache or FrameDecoder; streamed
+        # images are then pushed as raw frames decoded (or cached) in the
+        # feeder threads and the jpegdec branches are skipped
+        self.frame_source = frame_source
+        # Optional common.result_cache.ResultCache; images seen before (by
+        # content) skip the pipeline and have their cached labels replayed
+        self.result_cache = result_cache
+        # Optional common.pipeline_trace.PipelineTrace recording per-element,
+        # per-buffer spans of both pipelines
+        self.trace = trace
+        self.traced_images = 0
+        self.image_labels = []
+        # Decode branches feeding the muxer; at least one per batch slot so
+        # full batches can be formed
+        self.num_sources = max(num_sources or batch_size, batch_size)
+        self.infer_element = infer_element
+        self.mux_element = mux_element
+        # With a stand-in for nvinfer (e.g. identity/funnel on a CPU-only box)
+        # there is no NvDs metadata, results are derived from the source file
+        self.deepstream = pyds is not None and infer_element == "nvinfer"
+        # Called as on_image_done(image_path, labels) once a streamed image
+        # has left nvinfer; labels is None if it failed or timed out
+        self.on_image_done = None
+        # Called as on_stream_stop() once a streaming run stops taking images
+        # (pipeline error, failed push or teardown); a source blocked waiting
+        # for the next image should give up then
+        self.on_stream_stop = None
+        # Optional SqliteResultSink/JsonlResultSink recording every result
+        self.results_sink = results_sink
+        # Optional common.plate_index.PlateIndex kept up to date for lookups
+        self.plate_index = plate_index
+        # nvinfer config, possibly an engine cache overlay of lpr_config.txt
+        self.lpr_config = str(lpr_config)
+        self.first_result_at = None
         self.current_file = None
         self.current_image_path = None
-        self.output_dir = Path("recognized_plates")
-        self.output_dir.mkdir(exist_ok=True)
+        self.output_dir = Path(output_dir)
+        # With output_mode 'crop' the writer threads cut the plate out of the
+        # source file, mapping boxes back from the muxer's resolution
+        cropper = None
+        if output_mode == 'crop':
+            cropper = PlateCropper(MUX_WIDTH, MUX_HEIGHT, padding=crop_padding, quality=crop_quality)
+        self.writer = ResultWriter(self.output_dir, workers=writer_threads, output_mode=output_mode,
+                                   cropper=cropper)
+        self.watchdog = LatencyWatchdog()
         Gst.init(None)
         
         # Initialize pipeline and elements once
+        build_started = time.perf_counter()
         self.pipeline = Gst.Pipeline()
         self.source = Gst.ElementFactory.make("filesrc", "file-source")
         self.decoder = Gst.ElementFactory.make("decodebin", "image-decoder")
         self.videoconvert = Gst.ElementFactory.make("videoconvert", "video-convert")
-        self.streammux = Gst.ElementFactory.make("nvstreammux", "stream-muxer")
-        self.lprnet = Gst.ElementFactory.make("nvinfer", "lpr-inference")
+        self.streammux = Gst.ElementFactory.make(self.mux_element, "stream-muxer")
+        self.lprnet = Gst.ElementFactory.make(self.infer_element, "lpr-inference")
         self.fakesink = Gst.ElementFactory.make("fakesink", "fakesink")
 
-        # Configure static properties
-        self.streammux.set_property('width', 720)
-        self.streammux.set_property('height', 320)
-        self.streammux.set_property('batch-size', 1)
-        self.streammux.set_property('batched-push-timeout', 4000000)
-        self.streammux.set_property('live-source', 0)
-        self.lprnet.set_property('config-file-path', 'spec_files/lpr_config.txt')
-
         # Add elements to pipeline
         elements = [self.source, self.decoder, self.videoconvert, 
                    self.streammux, self.lprnet, self.fakesink]
@@ -41,7 +108,12 @@ class LPRPipeline:
                 raise RuntimeError("Failed to create elements")
             self.pipeline.add(element)
 
+        # Configure static properties
+        self.configure_inference(self.streammux, self.lprnet, 1)
+
         # Link static elements
+        if not self.source.link(self.decoder):
+            raise RuntimeError("Failed to link source to decoder")
         self.decoder.connect("pad-added", self.decoder_pad_added, self.videoconvert)
         sinkpad = self.streammux.get_request_pad("sink_0")
         srcpad = self.videoconvert.get_static_pad("src")
@@ -54,73 +126,200 @@ class LPRPipeline:
             raise RuntimeError("Failed to link lprnet to fakesink")
 
         # Add probe
+        probe = self.inference_pad_buffer_probe
+        if self.trace is not None:
+            # Before the probe, which drops every buffer
+            self.trace.attach(self.pipeline)
+            probe = self.trace.wrap_probe("inference probe", probe)
         infer_pad = self.lprnet.get_static_pad("src")
-        infer_pad.add_probe(Gst.PadProbeType.BUFFER, self.inference_pad_buffer_probe)
+        infer_pad.add_probe(Gst.PadProbeType.BUFFER, probe)
+
+        # The bus watch is set up once for the lifetime of the pipeline; the
+        # session ends each image's run on its EOS, an error or the deadline
+        self.session = PipelineSession(self.pipeline, self.bus_call, build_started)
+
+    def configure_inference(self, streammux, lprnet, batch_size):
+        if self.mux_element == "nvstreammux":
+            streammux.set_property('width', MUX_WIDTH)
+            streammux.set_property('height', MUX_HEIGHT)
+            streammux.set_property('batch-size', batch_size)
+            streammux.set_property('batched-push-timeout', self.push_timeout)
+            streammux.set_property('live-source', 0)
+            if self.gpu_id is not None:
+                streammux.set_property('gpu-id', self.gpu_id)
+        if self.infer_element == "nvinfer":
+            lprnet.set_property('config-file-path', self.lpr_config)
+            # Overrides batch-size from the config file so it matches the muxer
+            lprnet.set_property('batch-size', self.infer_batch_size or batch_size)
+            if self.gpu_id is not None:
+                lprnet.set_property('gpu-id', self.gpu_id)
 
-    def bus_call(self, bus, message, loop):
+    def bus_call(self, bus, message):
         t = message.type
         if t == Gst.MessageType.EOS:
             print(f"Finished processing: {self.current_file}")
-            loop.quit()
         elif t == Gst.MessageType.WARNING:
             warn, debug = message.parse_warning()
             print(f"Warning: {warn}: {debug}\n")
         elif t == Gst.MessageType.ERROR:
             err, debug = message.parse_error()
             print(f"Error: {err}: {debug}\n")
-            loop.quit()
-        return True
 
-    def save_image_with_plate_number(self, plate_number, confidence):
+    def stream_bus_call(self, bus, message):
+        t = message.type
+        if t == Gst.MessageType.EOS:
+            print("Finished streaming images")
+        elif t == Gst.MessageType.WARNING:
+            warn, debug = message.parse_warning()
+            print(f"Warning: {warn}: {debug}\n")
+        elif t == Gst.MessageType.ERROR:
+            err, debug = message.parse_error()
+            print(f"Error: {err}: {debug}\n")
+
+    def save_image_with_plate_number(self, plate_number, confidence, image_path=None, bbox=None):
         if confidence < 0.5:
             return
-        plate_number = plate_number.strip().replace(' ', '_')
-        file_extension = Path(self.current_file).suffix
-        new_filename = f"{plate_number}{file_extension}"
-        output_path = self.output_dir / new_filename
-        
-        counter = 1
-        while output_path.exists():
-            new_filename = f"{plate_number}_{counter}{file_extension}"
-            output_path = self.output_dir / new_filename
-            counter += 1
-            
+        if image_path is None:
+            image_path = self.current_image_path
+        if self.first_result_at is None:
+            self.first_result_at = time.perf_counter()
+        # Runs on the streaming thread: only queue the result, the copy is
+        # done by the writer threads and the record by the results sink
+        result = PlateResult(image_path, plate_number, confidence, bbox, time.time())
+        self.writer.submit(result)
+        if self.results_sink is not None:
+            self.results_sink.submit(result)
+        if self.plate_index is not None:
+            self.plate_index.add(plate_number, str(image_path), result.timestamp, confidence)
+
+    def replay_cached(self, image_path, labels):
+        for label in labels:
+            self.save_image_with_plate_number(label.plate_number, label.confidence, image_path, label.bbox)
+
+    def iter_frame_labels(self, gst_buffer):
+        # Yields every frame of the batch with the labels found on it, also
+        # frames without any, so callers can tell when an image is done
+        batch_meta = pyds.gst_buffer_get_nvds_batch_meta(hash(gst_buffer))
+        l_frame = batch_meta.frame_meta_list
+        while l_frame is not None:
+            frame_meta = pyds.NvDsFrameMeta.cast(l_frame.data)
+            labels = []
+            l_obj = frame_meta.obj_meta_list
+            while l_obj is not None:
+                obj_meta = pyds.NvDsObjectMeta.cast(l_obj.data)
+                if obj_meta.classifier_meta_list:
+                    rect = obj_meta.rect_params
+                    bbox = (rect.left, rect.top, rect.width, rect.height)
+                    cls_meta = obj_meta.classifier_meta_list
+                    while cls_meta:
+                        cls = pyds.NvDsClassifierMeta.cast(cls_meta.data)
+                        label_info = cls.label_info_list
+                        while label_info:
+                            label = pyds.glist_get_nvds_label_info(label_info.data)
+                            labels.append(PlateLabel(label.result_label, label.result_prob, bbox))
+                            label_info = label_info.next
+                        cls_meta = cls_meta.next
+                l_obj = l_obj.next
+            yield frame_meta, labels
+            l_frame = l_frame.next
+
+    def iter_stream_results(self, gst_buffer):
+        if self.deepstream:
+            for frame_meta, labels in self.iter_frame_labels(gst_buffer):
+                yield frame_meta.buf_pts, labels
+            return
+
+        # Stand-in inference: the sample images are named after their plate,
+        # so the file stem plays the part of the recognized text
+        with self.stream_lock:
+            pending = self.stream_pending.get(gst_buffer.pts)
+        if pending is not None:
+            yield gst_buffer.pts, [PlateLabel(Path(pending[0]).stem, 1.0, None)]
+
+    def inference_pad_buffer_probe(self, pad, info):
+        gst_buffer = info.get_buffer()
+        if not gst_buffer:
+            print("Unable to get GstBuffer ")
+            return
+
         try:
-            shutil.copy2(self.current_image_path, output_path)
-            print(f"Saved image as: {new_filename} (confidence: {confidence:.2f})")
+            if not self.deepstream:
+                self.image_labels.append(PlateLabel(Path(self.current_image_path).stem, 1.0, None))
+                self.save_image_with_plate_number(Path(self.current_image_path).stem, 1.0)
+                return Gst.PadProbeReturn.DROP
+            for frame_meta, labels in self.iter_frame_labels(gst_buffer):
+                self.image_labels.extend(labels)
+                for label in labels:
+                    self.save_image_with_plate_number(label.plate_number, label.confidence, bbox=label.bbox)
         except Exception as e:
-            print(f"Error saving image: {str(e)}")
+            print(f"Error in buffer probe: {str(e)}")
+        return Gst.PadProbeReturn.DROP
 
-    def inference_pad_buffer_probe(self, pad, info):
+    def stream_pad_buffer_probe(self, pad, info):
         gst_buffer = info.get_buffer()
         if not gst_buffer:
             print("Unable to get GstBuffer ")
             return
 
         try:
-            batch_meta = pyds.gst_buffer_get_nvds_batch_meta(hash(gst_buffer))
-            l_frame = batch_meta.frame_meta_list
-            while l_frame is not None:
-                frame_meta = pyds.NvDsFrameMeta.cast(l_frame.data)
-                l_obj = frame_meta.obj_meta_list
-                while l_obj is not None:
-                    obj_meta = pyds.NvDsObjectMeta.cast(l_obj.data)
-                    if obj_meta.classifier_meta_list:
-                        cls_meta = obj_meta.classifier_meta_list
-                        while cls_meta:
-                            cls = pyds.NvDsClassifierMeta.cast(cls_meta.data)
-                            label_info = cls.label_info_list
-                            while label_info:
-                                label = pyds.glist_get_nvds_label_info(label_info.data)
-                                self.save_image_with_plate_number(label.result_label, label.result_prob)
-                                label_info = label_info.next
-                            cls_meta = cls_meta.next
-                    l_obj = l_obj.next
-                l_frame = l_frame.next
+            for pts, labels in self.iter_stream_results(gst_buffer):
+                # Every pushed image carries a unique PTS, use it to find the
+                # file no matter which muxer pad or batch slot it came through
+                with self.stream_lock:
+                    pending = self.stream_pending.pop(pts, None)
+                    if pending is not None and labels:
+                        self.stream_recognized += 1
+                if pending is None:
+                    print(f"No source file for frame with PTS {pts}")
+                    continue
+                image_path, pushed_at = pending
+                self.watchdog.record(time.perf_counter() - pushed_at)
+                for label in labels:
+                    self.save_image_with_plate_number(label.plate_number, label.confidence,
+                                                      image_path, label.bbox)
+                if self.result_cache is not None:
+                    self.result_cache.store(image_path, labels)
+                self.notify_image_done(image_path, labels)
         except Exception as e:
             print(f"Error in buffer probe: {str(e)}")
         return Gst.PadProbeReturn.DROP
 
+    def check_stream_deadlines(self):
+        # Runs on the main loop; images stuck longer than the watchdog
+        # deadline are reported and no longer waited for
+        deadline = self.watchdog.deadline()
+        now = time.perf_counter()
+        with self.stream_lock:
+            expired = [pts for pts, (image_path, pushed_at) in self.stream_pending.items()
+                       if now - pushed_at > deadline]
+            expired = [self.stream_pending.pop(pts)[0] for pts in expired]
+            self.stream_timed_out += len(expired)
+        for image_path in expired:
+            print(f"Watchdog: {image_path} exceeded the {deadline:.1f}s deadline")
+            self.discard_cached(image_path)
+            self.notify_image_done(image_path, None)
+        return True
+
+    def discard_cached(self, image_path):
+        # No result is coming for an image the result cache missed on
+        if self.result_cache is not None:
+            self.result_cache.discard(image_path)
+
+    def stop_stream(self):
+        self.stream_stop.set()
+        if self.on_stream_stop is not None:
+            try:
+                self.on_stream_stop()
+            except Exception as e:
+                print(f"Error in stream stop callback: {str(e)}")
+
+    def notify_image_done(self, image_path, labels):
+        if self.on_image_done is not None:
+            try:
+                self.on_image_done(image_path, labels)
+            except Exception as e:
+                print(f"Error in image completion callback: {str(e)}")
+
     def decoder_pad_added(self, dbin, pad, videoconvert):
         if pad.get_current_caps().get_structure(0).get_name().startswith("video/"):
             sink_pad = videoconvert.get_static_pad("sink")
@@ -131,54 +330,416 @@ class LPRPipeline:
         self.current_image_path = image_path
         self.current_file = os.path.basename(str(image_path))
         print(f"Processing: {self.current_file}")
+        if self.result_cache is not None:
+            labels = self.result_cache.lookup(image_path)
+            if labels is not None:
+                print(f"Cached result for: {self.current_file}")
+                self.replay_cached(image_path, labels)
+                return True
+        self.image_labels = []
 
         # Update source location
         self.source.set_property('location', str(image_path))
-        self.source.link(self.decoder)
-
-        # Create a new main loop for this image
-        loop = GLib.MainLoop()
-        bus = self.pipeline.get_bus()
-        bus.add_signal_watch()
-        bus.connect("message", self.bus_call, loop)
+        if self.trace is not None:
+            self.trace.begin_image(image_path, self.traced_images)
+            self.traced_images += 1
+        start = time.perf_counter()
 
         # Set to playing state
-        ret = self.pipeline.set_state(Gst.State.PLAYING)
-        if ret == Gst.StateChangeReturn.FAILURE:
+        if not self.session.play():
             print(f"Failed to set pipeline to PLAYING state for {image_path}")
+            self.session.reset()
+            self.discard_cached(image_path)
+            return False
+
+        try:
+            outcome = self.session.run(timeout=self.watchdog.deadline())
+        except Exception as e:
+            print(f"Error in processing loop: {str(e)}")
+            self.discard_cached(image_path)
+            return False
+        finally:
+            # Reset pipeline state between images, this also flushes the bus
+            self.session.reset()
+        if outcome == 'timeout':
+            print(f"Timed out processing: {self.current_file}")
+        if outcome != 'eos':
+            self.discard_cached(image_path)
+            return False
+        self.watchdog.record(time.perf_counter() - start)
+        if self.result_cache is not None:
+            self.result_cache.store(image_path, self.image_labels)
+        return True
+
+    def build_stream_pipeline(self):
+        pipeline = Gst.Pipeline.new("lpr-stream-pipeline")
+        streammux = Gst.ElementFactory.make(self.mux_element, "stream-muxer")
+        lprnet = Gst.ElementFactory.make(self.infer_element, "lpr-inference")
+        fakesink = Gst.ElementFactory.make("fakesink", "fakesink")
+        for element in [streammux, lprnet, fakesink]:
+            if not element:
+                raise RuntimeError("Failed to create streaming elements")
+            pipeline.add(element)
+
+        self.configure_inference(streammux, lprnet, self.batch_size)
+
+        # One decode branch per muxer pad. Every appsrc runs its own streaming
+        # thread, so JPEG decoding and videoconvert run in parallel across
+        # branches while the muxer collects them into batches.
+        appsrcs = []
+        for index in range(self.num_sources):
+            appsrc = Gst.ElementFactory.make("appsrc", f"image-source-{index}")
+            if self.frame_source is not None:
+                # Raw frames are already I420 at the muxer's resolution
+                if not appsrc:
+                    raise RuntimeError("Failed to create streaming elements")
+                pipeline.add(appsrc)
+                appsrc.set_property('caps', Gst.Caps.from_string(self.frame_source.caps))
+                appsrc.set_property('format', Gst.Format.TIME)
+                appsrc.set_property('is-live', False)
+                appsrc.set_property('block', True)
+                appsrc.set_property('max-bytes', 1)
+                sinkpad = streammux.get_request_pad(f"sink_{index}")
+                if not appsrc.get_static_pad("src").link(sinkpad) == Gst.PadLinkReturn.OK:
+                    raise RuntimeError("Failed to link appsrc to streammux")
+                appsrcs.append(appsrc)
+                continue
+            parser = Gst.ElementFactory.make("jpegparse", f"jpeg-parser-{index}")
+            decoder = Gst.ElementFactory.make("jpegdec", f"jpeg-decoder-{index}")
+            videoconvert = Gst.ElementFactory.make("videoconvert", f"stream-video-convert-{index}")
+            branch = [appsrc, parser, decoder, videoconvert]
+            for element in branch:
+                if not element:
+                    raise RuntimeError("Failed to create streaming elements")
+                pipeline.add(element)
+
+            # Each buffer pushed into appsrc is one complete JPEG file
+            appsrc.set_property('caps', Gst.Caps.from_string("image/jpeg"))
+            appsrc.set_property('format', Gst.Format.TIME)
+            appsrc.set_property('is-live', False)
+            appsrc.set_property('block', True)
+            # Keep only about one image queued per branch, so a branch that is
+            # still decoding doesn't take work an idle branch could do
+            appsrc.set_property('max-bytes', 1)
+
+            if not (appsrc.link(parser) and parser.link(decoder) and decoder.link(videoconvert)):
+                raise RuntimeError("Failed to link streaming decode chain")
+            sinkpad = streammux.get_request_pad(f"sink_{index}")
+            srcpad = videoconvert.get_static_pad("src")
+            if not srcpad.link(sinkpad) == Gst.PadLinkReturn.OK:
+                raise RuntimeError("Failed to link videoconvert to streammux")
+            appsrcs.append(appsrc)
+
+        if not streammux.link(lprnet):
+            raise RuntimeError("Failed to link streammux to lprnet")
+        if not lprnet.link(fakesink):
+            raise RuntimeError("Failed to link lprnet to fakesink")
+
+        probe = self.stream_pad_buffer_probe
+        if self.trace is not None:
+            self.trace.attach(pipeline)
+            probe = self.trace.wrap_probe("stream probe", probe)
+        infer_pad = lprnet.get_static_pad("src")
+        infer_pad.add_probe(Gst.PadProbeType.BUFFER, probe)
+        return pipeline, appsrcs
+
+    def dispatch_images(self, image_files, work):
+        # Images are numbered in arrival order; each branch takes the next one
+        # as soon as it is idle, so per-pad timestamps keep increasing
+        for index, image_path in enumerate(image_files):
+            if self.stream_stop.is_set():
+                # Taken from the source but never pushed
+                self.notify_image_done(image_path, None)
+                break
+            work.put((index, image_path))
+        for _ in range(self.num_sources):
+            work.put(None)
+
+    def feed_branch(self, appsrc, work, session):
+        while True:
+            item = work.get()
+            if item is None:
+                break
+            index, image_path = item
+            if self.result_cache is not None:
+                labels = self.result_cache.lookup(image_path)
+                if labels is not None:
+                    with self.stream_lock:
+                        self.stream_cached += 1
+                        self.stream_recognized += bool(labels)
+                    self.replay_cached(image_path, labels)
+                    self.notify_image_done(image_path, labels)
+                    continue
+            try:
+                if self.frame_source is not None:
+                    data = self.frame_source.get(image_path)
+                else:
+                    with open(image_path, 'rb') as f:
+                        data = f.read()
+            except Exception as e:
+                print(f"Error reading {image_path}: {str(e)}")
+                self.discard_cached(image_path)
+                self.notify_image_done(image_path, None)
+                continue
+
+            buffer = Gst.Buffer.new_wrapped(data)
+            buffer.pts = index * STREAM_FRAME_DURATION
+            buffer.duration = STREAM_FRAME_DURATION
+            with self.stream_lock:
+                self.stream_pending[buffer.pts] = (image_path, time.perf_counter())
+                self.stream_pushed += 1
+            if self.trace is not None:
+                self.trace.tag(buffer.pts, image_path, index)
+
+            # Blocks while this branch is busy
+            ret = appsrc.emit('push-buffer', buffer)
+            if ret != Gst.FlowReturn.OK:
+                print(f"Failed to push {image_path}: {ret}")
+                with self.stream_lock:
+                    self.stream_pending.pop(buffer.pts, None)
+                self.discard_cached(image_path)
+                self.notify_image_done(image_path, None)
+                self.stop_stream()
+                session.stop()
+                break
+        appsrc.emit('end-of-stream')
+
+    def process_folder(self, image_files):
+        # In-flight images by PTS; entries leave when the image comes out of
+        # nvinfer or times out, so a long-running stream stays bounded
+        self.stream_pending = {}
+        self.stream_pushed = 0
+        self.stream_cached = 0
+        self.stream_recognized = 0
+        self.stream_timed_out = 0
+        self.stream_lock = threading.Lock()
+        self.stream_stop = threading.Event()
+
+        build_started = time.perf_counter()
+        pipeline, appsrcs = self.build_stream_pipeline()
+        session = PipelineSession(pipeline, self.stream_bus_call, build_started)
+
+        start = time.perf_counter()
+        self.first_result_at = None
+        if not session.play():
+            print("Failed to set streaming pipeline to PLAYING state")
+            session.close()
             return False
 
+        work = queue.Queue(maxsize=self.num_sources * 2)
+        feeders = [threading.Thread(target=self.dispatch_images, args=(image_files, work), daemon=True)]
+        for appsrc in appsrcs:
+            feeders.append(threading.Thread(target=self.feed_branch, args=(appsrc, work, session), daemon=True))
+        for feeder in feeders:
+            feeder.start()
+        watchdog_id = GLib.timeout_add(500, self.check_stream_deadlines)
         try:
-            # Increase timeout to 30 seconds
-            GLib.timeout_add_seconds(30, lambda: loop.quit())
-            loop.run()
+            session.run()
         except Exception as e:
             print(f"Error in processing loop: {str(e)}")
             return False
         finally:
-            # Reset pipeline state between images
-            self.pipeline.set_state(Gst.State.NULL)
-            # Wait for state change to complete
-            self.pipeline.get_state(Gst.CLOCK_TIME_NONE)
+            GLib.source_remove(watchdog_id)
+            self.stop_stream()
+            # If the run ended early, let what was already pushed come out of
+            # nvinfer before tearing down
+            if not session.drain():
+                print("Streaming pipeline did not drain cleanly")
+            session.close()
+            # Unblock the dispatcher if the run ended early; it returns once
+            # its source notices the stop
+            while feeders[0].is_alive():
+                try:
+                    item = work.get_nowait()
+                except queue.Empty:
+                    feeders[0].join(timeout=0.1)
+                    continue
+                if item is not None:
+                    self.notify_image_done(item[1], None)
+            for feeder in feeders:
+                feeder.join(timeout=1)
+            # Whatever is still queued or in flight now will never get a
+            # result; report it as failed so callers stop waiting for it
+            abandoned = []
+            while True:
+                try:
+                    item = work.get_nowait()
+                except queue.Empty:
+                    break
+                if item is not None:
+                    abandoned.append(item[1])
+            with self.stream_lock:
+                in_flight = [image_path for image_path, _ in self.stream_pending.values()]
+                self.stream_pending.clear()
+            for image_path in in_flight:
+                self.discard_cached(image_path)
+            for image_path in abandoned + in_flight:
+                self.notify_image_done(image_path, None)
+
+        self.writer.flush()
+        elapsed = time.perf_counter() - start
+        total = self.stream_pushed + self.stream_cached
+        recognized = self.stream_recognized
+        rate = total / elapsed if elapsed > 0 else 0.0
+        print(f"Streamed {total} images in {elapsed:.2f}s with batch size {self.batch_size} "
+              f"and {self.num_sources} decode branches "
+              f"({rate:.1f} images/sec), plates recognized in {recognized}")
+        if self.first_result_at is not None:
+            print(f"First result {self.first_result_at - start:.2f}s after start")
+        p50, p99 = self.watchdog.percentile(0.5), self.watchdog.percentile(0.99)
+        self.stream_stats = {'images': total, 'seconds': elapsed, 'images_per_sec': rate,
+                             'p50': p50, 'p99': p99, 'timed_out': self.stream_timed_out,
+                             'phases': dict(session.timings)}
+        print(f"Pipeline phases: {session.report()}")
+        if p50 is not None:
+            print(f"Per-image latency p50 {p50 * 1000:.1f} ms, p99 {p99 * 1000:.1f} ms, "
+                  f"{self.stream_timed_out} images exceeded the watchdog deadline")
+        if self.frame_source is not None:
+            self.frame_source.report()
         return True
 
+    def close(self):
+        self.session.close()
+        print(f"Per-image pipeline phases: {self.session.report()}")
+        if self.frame_source is not None:
+            self.frame_source.close()
+        if self.result_cache is not None:
+            self.result_cache.report()
+            self.result_cache.close()
+        if self.trace is not None:
+            self.trace.close()
+        self.writer.close()
+        self.writer.report()
+        if self.results_sink is not None:
+            self.results_sink.close()
+            print(f"Recorded {self.results_sink.written} results in {self.results_sink.batches} batches")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Recognize license plates in a folder of images")
+    parser.add_argument('--input', default="plate_images_processed",
+                        help="folder with the images to process")
+    parser.add_argument('--stream', action='store_true',
+                        help="feed all JPEGs through one long-lived pipeline")
+    parser.add_argument('--batch-size', type=int, default=1,
+                        help="images per nvstreammux/nvinfer batch in streaming mode")
+    parser.add_argument('--sources', type=int, default=None,
+                        help="parallel decode branches in streaming mode (default: batch size)")
+    parser.add_argument('--push-timeout', type=int, default=4000000,
+                        help="nvstreammux batched-push-timeout in microseconds")
+    parser.add_argument('--stub', action='store_true',
+                        help="use funnel/identity instead of nvstreammux/nvinfer (CPU only)")
+    parser.add_argument('--writer-threads', type=int, default=2,
+                        help="threads copying recognized images to the output folder")
+    parser.add_argument('--output-mode', choices=OUTPUT_MODES, default='copy',
+                        help="copy each recognized image, link it to a single stored copy, or save "
+                             "only the plate crop (box coordinates go to crops.jsonl)")
+    parser.add_argument('--crop-padding', type=float, default=0.1,
+                        help="with --output-mode crop, grow the plate box by this fraction on each side")
+    parser.add_argument('--crop-quality', type=int, default=85,
+                        help="JPEG quality of the plate crops")
+    parser.add_argument('--results-db', default=None,
+                        help="record every result in this SQLite database")
+    parser.add_argument('--results-jsonl', default=None,
+                        help="record every result as JSON lines in this folder")
+    parser.add_argument('--lpr-config', default='spec_files/lpr_config.txt',
+                        help="nvinfer config for LPRNet, e.g. an overlay written by autotune.py")
+    parser.add_argument('--gpu-id', type=int, default=None,
+                        help="run nvstreammux/nvinfer on this GPU instead of the config files' gpu-id")
+    parser.add_argument('--engine-cache', default=None, metavar='DIR',
+                        help="validate/build the LPR engine into DIR and warm it up before starting")
+    parser.add_argument('--frame-cache', default=None, metavar='DIR',
+                        help="stream pre-decoded frames kept in DIR, decoding only new or changed images")
+    parser.add_argument('--decoder', choices=('jpegdec', 'pil'), default='jpegdec',
+                        help="streaming mode decoder; pil decodes in the feeder threads straight to "
+                             "the muxer's resolution, using libjpeg DCT scaling for large JPEGs")
+    parser.add_argument('--no-dct-scaling', action='store_true',
+                        help="always decode JPEGs at full size with --decoder pil/--frame-cache")
+    parser.add_argument('--result-cache', default=None, metavar='DB',
+                        help="reuse results of images seen before (same content, same model/config), "
+                             "kept in this SQLite file")
+    parser.add_argument('--perceptual-hash', action='store_true',
+                        help="let the result cache also match near-duplicate images (needs Pillow)")
+    parser.add_argument('--phash-distance', type=int, default=4,
+                        help="bits two perceptual hashes may differ by to count as the same image")
+    parser.add_argument('--trace', default=None, metavar='JSON',
+                        help="write per-element, per-buffer latency as a Chrome trace "
+                             "(open in ui.perfetto.dev or chrome://tracing)")
+    parser.add_argument('--quarantine', default="quarantine",
+                        help="folder that receives corrupt or unsupported images")
+    parser.add_argument('--no-validate', action='store_true',
+                        help="skip the pre-flight image validation")
+    return parser.parse_args()
+
+def make_result_cache(args, version):
+    if not args.result_cache:
+        return None
+    return ResultCache(args.result_cache, version, perceptual=args.perceptual_hash,
+                       max_distance=args.phash_distance)
+
+def make_trace(args):
+    return PipelineTrace(args.trace) if args.trace else None
+
 def main():
-    lpr_pipeline = LPRPipeline()
+    args = parse_args()
+    startup = time.perf_counter()
+    frame_source = None
+    if args.frame_cache:
+        frame_source = FrameCache(args.frame_cache, MUX_WIDTH, MUX_HEIGHT, dct_scaling=not args.no_dct_scaling)
+    elif args.decoder == 'pil':
+        frame_source = FrameDecoder(MUX_WIDTH, MUX_HEIGHT, dct_scaling=not args.no_dct_scaling)
+    if args.stub:
+        lpr_pipeline = LPRPipeline(args.batch_size, infer_element="identity", mux_element="funnel",
+                                   writer_threads=args.writer_threads, output_mode=args.output_mode,
+                                   num_sources=args.sources, push_timeout=args.push_timeout,
+                                   results_sink=make_results_sink(args), frame_source=frame_source,
+                                   result_cache=make_result_cache(args, "stub"),
+                                   crop_padding=args.crop_padding, crop_quality=args.crop_quality,
+                                   trace=make_trace(args))
+    else:
+        lpr_config = args.lpr_config
+        if args.engine_cache:
+            lpr_config = prepare_engine(lpr_config, args.engine_cache, args.batch_size, gpu_id=args.gpu_id)
+        lpr_pipeline = LPRPipeline(args.batch_size, writer_threads=args.writer_threads,
+                                   output_mode=args.output_mode, num_sources=args.sources,
+                                   push_timeout=args.push_timeout, results_sink=make_results_sink(args),
+                                   lpr_config=lpr_config, gpu_id=args.gpu_id, frame_source=frame_source,
+                                   result_cache=make_result_cache(args, model_version(lpr_config)),
+                                   crop_padding=args.crop_padding, crop_quality=args.crop_quality,
+                                   trace=make_trace(args))
+    print(f"Startup took {time.perf_counter() - startup:.2f}s")
     try:
-        image_folder = Path("plate_images_processed")
-        image_files = list(image_folder.glob("*.jpg")) + \
-                     list(image_folder.glob("*.jpeg")) + \
-                     list(image_folder.glob("*.png"))
-        
-        for image_file in image_files:
+        image_folder = Path(args.input)
+        jpeg_files = list(image_folder.glob("*.jpg")) + \
+                     list(image_folder.glob("*.jpeg"))
+        image_files = jpeg_files + list(image_folder.glob("*.png"))
+
+        # Faulty files are moved to the quarantine folder by a thread pool
+        # running ahead of the pipeline, so they never reach the decoder
+        validate = lambda files: files
+        if not args.no_validate:
+            validate = ImageValidator(args.quarantine).validate
+
+        if frame_source is not None:
+            # Frames are decoded by Pillow, whatever their format
+            lpr_pipeline.process_folder(validate(image_files))
+            image_files = []
+        elif args.stream or args.batch_size > 1 or args.sources:
+            # The streaming decoder only handles JPEG, anything else goes
+            # through the per-image pipeline
+            lpr_pipeline.process_folder(validate(jpeg_files))
+            image_files = [f for f in image_files if f not in jpeg_files]
+
+        for image_file in validate(image_files):
             if not lpr_pipeline.process_image(image_file):
                 print(f"Failed to process {image_file}, continuing with next image")
-            time.sleep(1)  # Add small delay between images
-            
+
+        # Time to first result including startup, in either mode
+        if lpr_pipeline.first_result_at is not None:
+            print(f"First result {lpr_pipeline.first_result_at - startup:.2f}s after launch")
     except Exception as e:
         print(f"An error occurred: {str(e)}")
+    finally:
+        lpr_pipeline.close()
 
 if __name__ == '__main__':
     main()
-
-#issue is that it breaks when there is a certain faulty image
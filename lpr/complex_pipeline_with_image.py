@@ -1,27 +1,28 @@
 import gi
 gi.require_version('Gst', '1.0')
-from gi.repository import GObject, Gst, GLib
+from gi.repository import GObject, Gst
 import pyds
 import sys
 import time
 import os
+import argparse
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.pipeline_session import PipelineSession
+from common.pipeline_trace import PipelineTrace
 
 videoconvert = None
-loop = None
 
-def bus_call(bus, message, loop):
+def bus_call(bus, message):
     t = message.type
     if t == Gst.MessageType.EOS:
         print("End-of-stream")
-        loop.quit()
     elif t == Gst.MessageType.WARNING:
         warn, debug = message.parse_warning()
         print("Warning: %s: %s\n" % (warn, debug))
     elif t == Gst.MessageType.ERROR:
         err, debug = message.parse_error()
         print("Error: %s: %s\n" % (err, debug))
-        loop.quit()
-    return True
 
 def osd_sink_pad_buffer_probe(pad, info):
     gst_buffer = info.get_buffer()
@@ -79,11 +80,20 @@ def decoder_pad_added(dbin, pad):
         if not sink_pad.is_linked():
             pad.link(sink_pad)
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="Run LPRNet on 2785ASR.jpg and save the annotated image")
+    parser.add_argument('--trace', default=None, metavar='JSON',
+                        help="write per-element, per-buffer latency as a Chrome trace "
+                             "(open in ui.perfetto.dev or chrome://tracing)")
+    return parser.parse_args()
+
 def main():
-    global videoconvert, loop
+    global videoconvert
     
+    args = parse_args()
     Gst.init(None)
 
+    build_started = time.perf_counter()
     pipeline = Gst.Pipeline()
     if not pipeline:
         sys.stderr.write(" Unable to create Pipeline \n")
@@ -157,29 +167,35 @@ def main():
         sys.exit(1)
 
     # Add probe
+    probe = osd_sink_pad_buffer_probe
+    trace = None
+    if args.trace:
+        trace = PipelineTrace(args.trace)
+        trace.begin_image("2785ASR.jpg", 0)
+        trace.attach(pipeline)
+        probe = trace.wrap_probe("osd probe", probe)
     osdsinkpad = nvosd.get_static_pad("sink")
-    osdsinkpad.add_probe(Gst.PadProbeType.BUFFER, osd_sink_pad_buffer_probe)
+    osdsinkpad.add_probe(Gst.PadProbeType.BUFFER, probe)
 
-    # Create and run loop
-    loop = GLib.MainLoop()
-    bus = pipeline.get_bus()
-    bus.add_signal_watch()
-    bus.connect("message", bus_call, loop)
+    session = PipelineSession(pipeline, bus_call, build_started)
 
     # Start playing
-    ret = pipeline.set_state(Gst.State.PLAYING)
-    if ret == Gst.StateChangeReturn.FAILURE:
+    if not session.play():
         sys.stderr.write(" Unable to set the pipeline to the playing state.\n")
+        session.close()
         sys.exit(1)
 
     try:
-        loop.run()
+        session.run()
     except:
         pass
     finally:
-        pipeline.send_event(Gst.Event.new_eos())
-        time.sleep(2)
-        pipeline.set_state(Gst.State.NULL)
+        # Waits for the EOS to reach filesink so the JPEG is complete
+        session.drain()
+        session.close()
+        print(f"Pipeline phases: {session.report()}")
+        if trace is not None:
+            trace.close()
 
 if __name__ == '__main__':
     try:
@@ -1,28 +1,90 @@
 import gi
 gi.require_version('Gst', '1.0')
-from gi.repository import GObject, Gst, GLib
+from gi.repository import GObject, Gst
 import pyds
 import sys
 import os
 import time
 from datetime import datetime
 import traceback
+import argparse
+from pathlib import Path
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.track_voting import TrackAggregator, UNTRACKED_OBJECT_ID
+from common.frame_encoder import FrameEncoder
+from common.probe_log import ProbeLog, DEBUG, INFO
+from common.pipeline_session import PipelineSession
+from common.object_gating import ObjectGate
+from common.pipeline_trace import PipelineTrace
+
+try:
+    import numpy as np
+    from PIL import Image
+except ImportError:
+    np = None
 
 videoconvert = None
-
-def bus_call(bus, message, loop):
+args = None
+# One voted plate per vehicle track instead of one line per frame
+aggregator = None
+encoder = None
+# Probe output goes through a buffered logger, never print() on the streaming thread
+plog = None
+# Optional ObjectGate dropping detections before the LPD and LPR stages
+gate = None
+
+# gie-unique-id of TrafficCamNet and the LPD in spec_files/
+VEHICLE_GIE_ID = 1
+PLATE_GIE_ID = 2
+MUX_WIDTH, MUX_HEIGHT = 1920, 1080
+# frame_num of every frame let through to the encoder, by buffer PTS; only
+# kept with the appsink encoder, which takes the entries out again
+output_frames = {}
+# Still images never get a confirmed track (probationAge in
+# spec_files/tracker_config.yml), their readings are emitted as they come
+IMAGE_SUFFIXES = ('.jpg', '.jpeg', '.png', '.bmp')
+single_frame = False
+
+def save_crop(crop, name):
+    crops_dir = Path(args.save_crops)
+    crops_dir.mkdir(exist_ok=True)
+    Image.fromarray(crop).convert('RGB').save(crops_dir / name)
+
+def emit_track_results(results):
+    for result in results:
+        if plog.info:
+            plog.write("Track {} (source {}): {} confidence {:.2f} over {} frames, best frame {}",
+                       result.track_id, result.source_id, result.plate_number,
+                       result.confidence, result.observations, result.best_frame)
+        if result.best_crop is not None:
+            save_crop(result.best_crop, f"{result.plate_number}_{result.source_id}_{result.track_id}.jpg")
+
+def emit_reading(source_id, frame_num, plate_number, confidence, crop=None):
+    # A reading that isn't voted on: untracked objects and still images
+    if plog.info:
+        plog.write("Plate (source {}, frame {}): {} confidence {:.2f}",
+                   source_id, frame_num, plate_number, confidence)
+    if crop is not None:
+        save_crop(crop(), f"{plate_number}_{source_id}_f{frame_num}.jpg")
+
+def bus_call(bus, message):
     t = message.type
     if t == Gst.MessageType.EOS:
         print("End-of-stream")
-        loop.quit()
+        emit_track_results(aggregator.flush())
     elif t == Gst.MessageType.ERROR:
         err, debug = message.parse_error()
         print("Error: %s: %s\n" % (err, debug))
-        loop.quit()
     elif t == Gst.MessageType.WARNING:
         err, debug = message.parse_warning()
         print("Warning: %s: %s\n" % (err, debug))
-    return True
+
+def plate_crop(gst_buffer, frame_meta, rect):
+    # Copy only the plate region out of the RGBA frame
+    frame = pyds.get_nvds_buf_surface(hash(gst_buffer), frame_meta.batch_id)
+    left, top = max(0, int(rect.left)), max(0, int(rect.top))
+    return np.array(frame[top:top + int(rect.height), left:left + int(rect.width)], copy=True, order='C')
 
 def osd_sink_pad_buffer_probe(pad, info):
     gst_buffer = info.get_buffer()
@@ -38,41 +100,52 @@ def osd_sink_pad_buffer_probe(pad, info):
         except StopIteration:
             break
 
-        print(f"\nFrame Number={frame_meta.frame_num}")
+        if plog.debug:
+            plog.write("\nFrame Number={}", frame_meta.frame_num)
         l_obj = frame_meta.obj_meta_list
         while l_obj is not None:
             try:
                 obj_meta = pyds.NvDsObjectMeta.cast(l_obj.data)
-                print(f"\nObject ID: {obj_meta.object_id}")
-                print(f"Label: {obj_meta.obj_label}")
-                print(f"Class ID: {obj_meta.class_id}")
-                print(f"Confidence: {obj_meta.confidence}")
-                
-                if obj_meta.classifier_meta_list:
-                    print("\nClassifier Metadata found:")
-                    cls_meta = obj_meta.classifier_meta_list
-                    while cls_meta:
-                        cls = pyds.NvDsClassifierMeta.cast(cls_meta.data)
-                        print(f"Component ID: {cls.unique_component_id}")
-                        
-                        label_info = cls.label_info_list
-                        while label_info:
-                            label = pyds.glist_get_nvds_label_info(label_info.data)
-                            print(f"Label: {label.result_label}")
-                            print(f"Confidence: {label.result_prob}")
-                            
-                            try:
-                                label_info = label_info.next
-                            except StopIteration:
-                                break
-                            
+                if plog.debug:
+                    plog.write("\nObject ID: {}\nLabel: {}\nClass ID: {}\nConfidence: {}",
+                               obj_meta.object_id, obj_meta.obj_label,
+                               obj_meta.class_id, obj_meta.confidence)
+
+                # Prefer the vehicle's track when the plate was detected inside
+                # one, otherwise the plate's own track
+                track_id = obj_meta.object_id
+                if obj_meta.parent is not None:
+                    track_id = obj_meta.parent.object_id
+
+                cls_meta = obj_meta.classifier_meta_list
+                while cls_meta:
+                    cls = pyds.NvDsClassifierMeta.cast(cls_meta.data)
+                    label_info = cls.label_info_list
+                    while label_info:
+                        label = pyds.glist_get_nvds_label_info(label_info.data)
+                        if plog.debug:
+                            plog.write("Component ID: {}\nLabel: {}\nConfidence: {}",
+                                       cls.unique_component_id, label.result_label, label.result_prob)
+                        rect = obj_meta.rect_params
+                        crop = None
+                        if args.save_crops:
+                            crop = lambda: plate_crop(gst_buffer, frame_meta, rect)
+                        if single_frame or track_id == UNTRACKED_OBJECT_ID:
+                            emit_reading(frame_meta.source_id, frame_meta.frame_num,
+                                         label.result_label, label.result_prob, crop)
+                        else:
+                            emit_track_results(aggregator.update(
+                                frame_meta.source_id, track_id, label.result_label, label.result_prob,
+                                frame_meta.frame_num, (rect.left, rect.top, rect.width, rect.height), crop))
                         try:
-                            cls_meta = cls_meta.next
+                            label_info = label_info.next
                         except StopIteration:
                             break
-                else:
-                    print("No classifier metadata found")
-                
+
+                    try:
+                        cls_meta = cls_meta.next
+                    except StopIteration:
+                        break
             except StopIteration:
                 break
 
@@ -81,6 +154,7 @@ def osd_sink_pad_buffer_probe(pad, info):
             except StopIteration:
                 break
 
+        emit_track_results(aggregator.expire(frame_meta.source_id, frame_meta.frame_num))
         try:
             l_frame = l_frame.next
         except StopIteration:
@@ -88,6 +162,78 @@ def osd_sink_pad_buffer_probe(pad, info):
 
     return Gst.PadProbeReturn.OK
 
+def stage_gate_probe(pad, info, stage):
+    # Removes the objects the gate rejects, so the next nvinfer never sees them
+    gst_buffer = info.get_buffer()
+    if not gst_buffer:
+        return Gst.PadProbeReturn.OK
+
+    gated_id = VEHICLE_GIE_ID if stage == 'vehicles' else PLATE_GIE_ID
+    batch_meta = pyds.gst_buffer_get_nvds_batch_meta(hash(gst_buffer))
+    l_frame = batch_meta.frame_meta_list
+    while l_frame is not None:
+        frame_meta = pyds.NvDsFrameMeta.cast(l_frame.data)
+        vehicles = []
+        candidates = []
+        l_obj = frame_meta.obj_meta_list
+        while l_obj is not None:
+            obj_meta = pyds.NvDsObjectMeta.cast(l_obj.data)
+            if obj_meta.unique_component_id == gated_id:
+                candidates.append(obj_meta)
+            elif obj_meta.unique_component_id == VEHICLE_GIE_ID:
+                rect = obj_meta.rect_params
+                vehicles.append((rect.left, rect.top, rect.width, rect.height))
+            l_obj = l_obj.next
+
+        # Removing while walking the list would skip entries
+        for obj_meta in candidates:
+            rect = obj_meta.rect_params
+            if not gate.keep(stage, frame_meta.source_id, rect.left, rect.top, rect.width, rect.height,
+                             obj_meta.confidence, vehicles):
+                pyds.nvds_remove_obj_meta_from_frame(frame_meta, obj_meta)
+        l_frame = l_frame.next
+    return Gst.PadProbeReturn.OK
+
+def output_gate_probe(pad, info):
+    # Only frames with detections are worth encoding
+    gst_buffer = info.get_buffer()
+    if not gst_buffer:
+        return Gst.PadProbeReturn.OK
+
+    batch_meta = pyds.gst_buffer_get_nvds_batch_meta(hash(gst_buffer))
+    l_frame = batch_meta.frame_meta_list
+    while l_frame is not None:
+        frame_meta = pyds.NvDsFrameMeta.cast(l_frame.data)
+        if frame_meta.num_obj_meta > 0:
+            if encoder is not None:
+                output_frames[gst_buffer.pts] = frame_meta.frame_num
+            return Gst.PadProbeReturn.OK
+        l_frame = l_frame.next
+    return Gst.PadProbeReturn.DROP
+
+def output_name(frame_num):
+    return f"{Path(args.input).stem}_{frame_num:05d}.jpg"
+
+def on_new_sample(appsink):
+    sample = appsink.emit('pull-sample')
+    if sample is None:
+        return Gst.FlowReturn.EOS
+    gst_buffer = sample.get_buffer()
+    structure = sample.get_caps().get_structure(0)
+    width, height = structure.get_value('width'), structure.get_value('height')
+    frame_num = output_frames.pop(gst_buffer.pts, 0)
+
+    ok, mapinfo = gst_buffer.map(Gst.MapFlags.READ)
+    if not ok:
+        return Gst.FlowReturn.ERROR
+    try:
+        data = bytes(mapinfo.data)
+    finally:
+        gst_buffer.unmap(mapinfo)
+    # Blocks while the encoder pool is full
+    encoder.submit(data, width, height, len(data) // height, output_name(frame_num))
+    return Gst.FlowReturn.OK
+
 def decoder_pad_added(dbin, pad):
     print("Pad added:", pad.get_name())
     if pad.get_current_caps().get_structure(0).get_name().startswith("video/"):
@@ -96,11 +242,55 @@ def decoder_pad_added(dbin, pad):
         if not sink_pad.is_linked():
             pad.link(sink_pad)
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="Vehicle, plate and LPR detection on an image or video")
+    parser.add_argument('input', nargs='?', default="car.jpg")
+    parser.add_argument('--verbose', action='store_true',
+                        help="print every object and label on every frame")
+    parser.add_argument('--ttl-frames', type=int, default=30,
+                        help="frames without a reading before a track's plate is emitted")
+    parser.add_argument('--save-crops', default=None, metavar='DIR',
+                        help="save the best plate crop of every track into DIR (needs numpy and Pillow)")
+    parser.add_argument('--output-dir', default="output_processed",
+                        help="annotated frames with detections are written here, one file per frame")
+    parser.add_argument('--encode-workers', type=int, default=4,
+                        help="threads JPEG-encoding output frames")
+    parser.add_argument('--no-osd', action='store_true',
+                        help="skip drawing boxes and labels, write the plain frames")
+    parser.add_argument('--gating', default=None, metavar='JSON',
+                        help="drop detections by ROI, size and confidence before the LPD and LPR stages, "
+                             "e.g. spec_files/gating.json")
+    parser.add_argument('--lpd-on-vehicles', action='store_true',
+                        help="run the LPD on vehicle boxes instead of full frames, so vehicle gating "
+                             "also saves LPD work")
+    parser.add_argument('--trace', default=None, metavar='JSON',
+                        help="write per-element, per-buffer latency as a Chrome trace "
+                             "(open in ui.perfetto.dev or chrome://tracing)")
+    parser.add_argument('--log-rate', type=int, default=None,
+                        help="at most this many probe log records per second")
+    parser.add_argument('--log-sample', type=int, default=1,
+                        help="keep one probe log record out of every N")
+    return parser.parse_args()
+
 def main():
-    global videoconvert
-    
+    global videoconvert, args, aggregator, plog, gate, single_frame
+
+    args = parse_args()
+    single_frame = Path(args.input).suffix.lower() in IMAGE_SUFFIXES
+    plog = ProbeLog(DEBUG if args.verbose else INFO, rate_limit=args.log_rate, sample_every=args.log_sample)
+    aggregator = TrackAggregator(ttl_frames=args.ttl_frames)
+    if args.gating:
+        gate = ObjectGate.load(args.gating, MUX_WIDTH, MUX_HEIGHT)
+    if args.save_crops and np is None:
+        sys.stderr.write(" --save-crops needs numpy and Pillow\n")
+        sys.exit(1)
+    if args.save_crops and args.no_osd:
+        sys.stderr.write(" --save-crops reads RGBA frames at the OSD and can't be used with --no-osd\n")
+        sys.exit(1)
+
     Gst.init(None)
 
+    build_started = time.perf_counter()
     pipeline = Gst.Pipeline()
     if not pipeline:
         sys.stderr.write(" Unable to create Pipeline \n")
@@ -112,7 +302,7 @@ def main():
     if not source:
         sys.stderr.write(" Unable to create source \n")
         sys.exit(1)
-    source.set_property('location', "car.jpg")
+    source.set_property('location', args.input)
 
     decoder = Gst.ElementFactory.make("decodebin", "image-decoder")
     if not decoder:
@@ -134,6 +324,11 @@ def main():
         sys.stderr.write(" Unable to create pgie \n")
         sys.exit(1)
 
+    tracker = Gst.ElementFactory.make("nvtracker", "tracker")
+    if not tracker:
+        sys.stderr.write(" Unable to create tracker \n")
+        sys.exit(1)
+
     sgie = Gst.ElementFactory.make("nvinfer", "secondary-inference")
     if not sgie:
         sys.stderr.write(" Unable to create sgie \n")
@@ -154,6 +349,11 @@ def main():
         sys.stderr.write(" Unable to create nvosd \n")
         sys.exit(1)
 
+    output_queue = Gst.ElementFactory.make("queue", "output-queue")
+    if not output_queue:
+        sys.stderr.write(" Unable to create output queue \n")
+        sys.exit(1)
+
     nvvidconv2 = Gst.ElementFactory.make("nvvideoconvert", "convertor2")
     if not nvvidconv2:
         sys.stderr.write(" Unable to create nvvidconv2 \n")
@@ -164,20 +364,22 @@ def main():
         sys.stderr.write(" Unable to create capsfilter \n")
         sys.exit(1)
 
-    jpegenc = Gst.ElementFactory.make("jpegenc", "jpegenc")
-    if not jpegenc:
-        sys.stderr.write(" Unable to create jpegenc \n")
-        sys.exit(1)
-
-    filesink = Gst.ElementFactory.make("filesink", "filesink")
-    if not filesink:
-        sys.stderr.write(" Unable to create filesink \n")
+    # Encoding happens on a thread pool behind an appsink when Pillow is
+    # available, otherwise on jpegenc with one file per frame
+    if FrameEncoder.available():
+        output_elements = [Gst.ElementFactory.make("appsink", "frame-sink")]
+    else:
+        print("Pillow not found, encoding output frames with jpegenc on one thread")
+        output_elements = [Gst.ElementFactory.make("jpegenc", "jpegenc"),
+                           Gst.ElementFactory.make("multifilesink", "filesink")]
+    if not all(output_elements):
+        sys.stderr.write(" Unable to create output sink \n")
         sys.exit(1)
 
     print("All elements created successfully")
 
-    streammux.set_property('width', 1920)
-    streammux.set_property('height', 1080)
+    streammux.set_property('width', MUX_WIDTH)
+    streammux.set_property('height', MUX_HEIGHT)
     streammux.set_property('batch-size', 1)
     streammux.set_property('batched-push-timeout', 4000000)
     streammux.set_property('live-source', 0)
@@ -186,16 +388,51 @@ def main():
     pgie.set_property('config-file-path', 'spec_files/traffic_config.txt')
     sgie.set_property('config-file-path', 'spec_files/lpd_config.txt')
     tgie.set_property('config-file-path', 'spec_files/lpr_config.txt')
-
-    caps = Gst.Caps.from_string("video/x-raw, format=I420")
-    capsfilter.set_property("caps", caps)
-    jpegenc.set_property('quality', 85)
-    filesink.set_property('location', 'output_processed.jpg')
-    filesink.set_property('sync', False)
+    if args.lpd_on_vehicles:
+        # Secondary mode on TrafficCamNet's objects, as in the LPR reference app
+        sgie.set_property('process-mode', 2)
+        sgie.set_property('infer-on-gie-id', VEHICLE_GIE_ID)
+
+    # Sits after the LPD so vehicles and plates both get a stable object_id
+    # across frames, which is what plate readings are voted on
+    tracker.set_property('ll-lib-file', '/opt/nvidia/deepstream/deepstream/lib/libnvds_nvmultiobjecttracker.so')
+    tracker.set_property('ll-config-file', 'spec_files/tracker_config.yml')
+    tracker.set_property('tracker-width', 640)
+    tracker.set_property('tracker-height', 384)
+
+    if args.save_crops:
+        # Frames must be CPU-mappable for get_nvds_buf_surface on dGPU
+        mem_type = int(pyds.NVBUF_MEM_CUDA_UNIFIED)
+        streammux.set_property('nvbuf-memory-type', mem_type)
+        nvvidconv.set_property('nvbuf-memory-type', mem_type)
+
+    # Lets inference run ahead while frames are converted and encoded
+    output_queue.set_property('max-size-buffers', 8)
+    output_queue.set_property('max-size-bytes', 0)
+    output_queue.set_property('max-size-time', 0)
+
+    global encoder
+    Path(args.output_dir).mkdir(exist_ok=True)
+    if FrameEncoder.available():
+        capsfilter.set_property("caps", Gst.Caps.from_string("video/x-raw, format=RGBA"))
+        appsink = output_elements[0]
+        appsink.set_property('emit-signals', True)
+        appsink.set_property('sync', False)
+        appsink.set_property('max-buffers', 4)
+        appsink.connect('new-sample', on_new_sample)
+        encoder = FrameEncoder(args.output_dir, workers=args.encode_workers)
+    else:
+        capsfilter.set_property("caps", Gst.Caps.from_string("video/x-raw, format=I420"))
+        jpegenc, filesink = output_elements
+        jpegenc.set_property('quality', 85)
+        filesink.set_property('location', os.path.join(args.output_dir, f"{Path(args.input).stem}_%05d.jpg"))
+        filesink.set_property('sync', False)
+
+    osd_elements = [] if args.no_osd else [nvvidconv, nvosd]
 
     print("Adding elements to pipeline...")
-    elements = [source, decoder, videoconvert, streammux, pgie, sgie, tgie,
-               nvvidconv, nvosd, nvvidconv2, capsfilter, jpegenc, filesink]
+    elements = [source, decoder, videoconvert, streammux, pgie, sgie, tracker, tgie] + \
+               osd_elements + [output_queue, nvvidconv2, capsfilter] + output_elements
 
     for element in elements:
         pipeline.add(element)
@@ -222,8 +459,8 @@ def main():
         sys.stderr.write(" Failed to link videoconvert to streammux\n")
         sys.exit(1)
 
-    elements_to_link = [streammux, pgie, sgie, tgie, nvvidconv, nvosd, 
-                       nvvidconv2, capsfilter, jpegenc, filesink]
+    elements_to_link = [streammux, pgie, sgie, tracker, tgie] + osd_elements + \
+                       [output_queue, nvvidconv2, capsfilter] + output_elements
 
     for i in range(len(elements_to_link) - 1):
         if not elements_to_link[i].link(elements_to_link[i + 1]):
@@ -233,45 +470,63 @@ def main():
             sys.exit(1)
 
     print("Adding probe...")
-    osdsinkpad = nvosd.get_static_pad("sink")
+    trace = None
+    traced = lambda name, probe: probe
+    if args.trace:
+        # Attached first, so its probes still see buffers the gate drops
+        trace = PipelineTrace(args.trace)
+        trace.begin_image(args.input)
+        trace.attach(pipeline)
+        traced = trace.wrap_probe
+    # Without OSD the plate readings are taken straight after LPRNet
+    osdsinkpad = tgie.get_static_pad("src") if args.no_osd else nvosd.get_static_pad("sink")
     if not osdsinkpad:
         sys.stderr.write(" Unable to get sink pad of nvosd\n")
         sys.exit(1)
-    osdsinkpad.add_probe(Gst.PadProbeType.BUFFER, osd_sink_pad_buffer_probe)
+    osdsinkpad.add_probe(Gst.PadProbeType.BUFFER, traced("osd probe", osd_sink_pad_buffer_probe))
+    output_queue.get_static_pad("sink").add_probe(Gst.PadProbeType.BUFFER,
+                                                  traced("output gate probe", output_gate_probe))
+    if gate is not None:
+        sgie.get_static_pad("sink").add_probe(Gst.PadProbeType.BUFFER,
+                                              traced("vehicle gate probe", stage_gate_probe), 'vehicles')
+        tgie.get_static_pad("sink").add_probe(Gst.PadProbeType.BUFFER,
+                                              traced("plate gate probe", stage_gate_probe), 'plates')
 
     print("Creating pipeline bus...")
-    loop = GLib.MainLoop()
-    bus = pipeline.get_bus()
-    bus.add_signal_watch()
-    bus.connect("message", bus_call, loop)
+    session = PipelineSession(pipeline, bus_call, build_started)
 
     print("Starting pipeline...")
-    ret = pipeline.set_state(Gst.State.PLAYING)
-    if ret == Gst.StateChangeReturn.FAILURE:
+    if not session.play():
         sys.stderr.write(" Unable to set the pipeline to the playing state.\n")
+        session.close()
         sys.exit(1)
 
     try:
         print("Running pipeline...")
-        loop.run()
+        session.run()
     except:
-        print("Error occurred. Getting last error...")
-        bus.timed_pop_filtered(Gst.CLOCK_TIME_NONE, Gst.MessageType.ERROR)
+        print("Error occurred, draining pipeline...")
     finally:
         print("Cleaning up...")
-        pipeline.send_event(Gst.Event.new_eos())
-        
-        time.sleep(2)
-        
-        pipeline.set_state(Gst.State.NULL)
+        # Interrupted runs still get their in-flight frames encoded
+        if not session.drain():
+            print("Warning: pipeline did not drain cleanly")
+        session.close()
+        # Tracks still open when the run was cut short (no-op after a normal EOS)
+        emit_track_results(aggregator.flush())
+        plog.close()
+        print(f"Pipeline phases: {session.report()}")
+        if gate is not None:
+            gate.report()
+        if trace is not None:
+            trace.close()
         
-        if os.path.exists('output_processed.jpg'):
-            size = os.path.getsize('output_processed.jpg')
-            print(f"Output file size: {size} bytes")
-            if size == 0:
-                print("Warning: Output file is empty!")
-        else:
-            print("Error: Output file was not created!")
+        if encoder is not None:
+            encoder.close()
+            if encoder.failed:
+                print(f"Warning: {encoder.failed} frames failed to encode")
+        written = len(list(Path(args.output_dir).glob("*.jpg")))
+        print(f"Wrote {written} annotated frames to {args.output_dir}")
 
 if __name__ == '__main__':
     sys.exit(main())
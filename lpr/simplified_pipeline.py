@@ -1,26 +1,30 @@
 import gi
 gi.require_version('Gst', '1.0')
-from gi.repository import GObject, Gst, GLib
+from gi.repository import GObject, Gst
 import pyds
 import sys
+import os
 import time
+import argparse
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.probe_log import ProbeLog, LEVELS
+from common.pipeline_session import PipelineSession
+from common.pipeline_trace import PipelineTrace
 
 videoconvert = None
-loop = None
+plog = None
 
-def bus_call(bus, message, loop):
+def bus_call(bus, message):
     t = message.type
     if t == Gst.MessageType.EOS:
         print("End-of-stream")
-        loop.quit()
     elif t == Gst.MessageType.WARNING:
         warn, debug = message.parse_warning()
         print("Warning: %s: %s\n" % (warn, debug))
     elif t == Gst.MessageType.ERROR:
         err, debug = message.parse_error()
         print("Error: %s: %s\n" % (err, debug))
-        loop.quit()
-    return True
 
 def inference_pad_buffer_probe(pad, info):
     gst_buffer = info.get_buffer()
@@ -44,8 +48,9 @@ def inference_pad_buffer_probe(pad, info):
                             label_info = cls.label_info_list
                             while label_info:
                                 label = pyds.glist_get_nvds_label_info(label_info.data)
-                                print(f"License Plate Text: {label.result_label}")
-                                print(f"Confidence: {label.result_prob}")
+                                if plog.info:
+                                    plog.write("License Plate Text: {}\nConfidence: {}",
+                                               label.result_label, label.result_prob)
                                 label_info = label_info.next
                             cls_meta = cls_meta.next
                     l_obj = l_obj.next
@@ -63,11 +68,27 @@ def decoder_pad_added(dbin, pad):
         if not sink_pad.is_linked():
             pad.link(sink_pad)
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="Run LPRNet on a single plate image")
+    parser.add_argument('input', nargs='?', default="2785ASR.jpg")
+    parser.add_argument('--log-level', choices=list(LEVELS), default='info')
+    parser.add_argument('--log-rate', type=int, default=None,
+                        help="at most this many probe log records per second")
+    parser.add_argument('--log-sample', type=int, default=1,
+                        help="keep one probe log record out of every N")
+    parser.add_argument('--trace', default=None, metavar='JSON',
+                        help="write per-element, per-buffer latency as a Chrome trace "
+                             "(open in ui.perfetto.dev or chrome://tracing)")
+    return parser.parse_args()
+
 def main():
-    global videoconvert, loop
-    
+    global videoconvert, plog
+
+    args = parse_args()
+    plog = ProbeLog(LEVELS[args.log_level], rate_limit=args.log_rate, sample_every=args.log_sample)
     Gst.init(None)
 
+    build_started = time.perf_counter()
     pipeline = Gst.Pipeline()
     if not pipeline:
         raise RuntimeError("Unable to create Pipeline")
@@ -84,7 +105,7 @@ def main():
         raise RuntimeError("Failed to create elements")
 
     # Set properties
-    source.set_property('location', "2785ASR.jpg")
+    source.set_property('location', args.input)
     streammux.set_property('width', 720)
     streammux.set_property('height', 320)
     streammux.set_property('batch-size', 1)
@@ -113,28 +134,35 @@ def main():
         raise RuntimeError("Failed to link lprnet to fakesink")
 
     # Add probe right after inference
+    probe = inference_pad_buffer_probe
+    trace = None
+    if args.trace:
+        # Before the probe, which drops every buffer
+        trace = PipelineTrace(args.trace)
+        trace.begin_image(args.input, 0)
+        trace.attach(pipeline)
+        probe = trace.wrap_probe("inference probe", probe)
     infer_pad = lprnet.get_static_pad("src")
-    infer_pad.add_probe(Gst.PadProbeType.BUFFER, inference_pad_buffer_probe)
+    infer_pad.add_probe(Gst.PadProbeType.BUFFER, probe)
 
-    # Create and run loop
-    loop = GLib.MainLoop()
-    bus = pipeline.get_bus()
-    bus.add_signal_watch()
-    bus.connect("message", bus_call, loop)
+    session = PipelineSession(pipeline, bus_call, build_started)
 
     # Start playing
-    ret = pipeline.set_state(Gst.State.PLAYING)
-    if ret == Gst.StateChangeReturn.FAILURE:
+    if not session.play():
+        session.close()
         raise RuntimeError("Unable to set the pipeline to the playing state")
 
     try:
-        loop.run()
+        session.run()
     except:
         pass
     finally:
-        pipeline.send_event(Gst.Event.new_eos())
-        time.sleep(2)
-        pipeline.set_state(Gst.State.NULL)
+        session.drain()
+        session.close()
+        plog.close()
+        print(f"Pipeline phases: {session.report()}")
+        if trace is not None:
+            trace.close()
 
 if __name__ == '__main__':
     try:
@@ -1,35 +1,52 @@
 import gi
 gi.require_version('Gst', '1.0')
-from gi.repository import GObject, Gst, GLib
-import pyds
+from gi.repository import GObject, Gst
+try:
+    import pyds
+except ImportError:
+    # Only needed to read nvinfer metadata; stand-in runs work without it
+    pyds = None
 import sys
 import time
 import os
 from pathlib import Path
 import shutil
+import argparse
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.pipeline_session import PipelineSession
+from common.plate_naming import PlateNameIndex
+from common.pipeline_trace import PipelineTrace
 
 class LPRPipeline:
-    def __init__(self):
+    def __init__(self, infer_element="nvinfer", mux_element="nvstreammux", output_dir="recognized_plates",
+                 trace=None):
         self.current_file = None
         self.current_image_path = None
-        self.output_dir = Path("recognized_plates")
+        self.infer_element = infer_element
+        self.mux_element = mux_element
+        # With stand-ins for nvstreammux/nvinfer the file stem is the plate
+        self.deepstream = pyds is not None and infer_element == "nvinfer"
+        self.output_dir = Path(output_dir)
         # Create output directory if it doesn't exist
         self.output_dir.mkdir(exist_ok=True)
+        self.names = PlateNameIndex(self.output_dir)
+        # Optional common.pipeline_trace.PipelineTrace, attached to every
+        # per-image pipeline
+        self.trace = trace
+        self.traced_images = 0
         Gst.init(None)
 
-    def bus_call(self, bus, message, loop):
+    def bus_call(self, bus, message):
         t = message.type
         if t == Gst.MessageType.EOS:
             print(f"Finished processing: {self.current_file}")
-            loop.quit()
         elif t == Gst.MessageType.WARNING:
             warn, debug = message.parse_warning()
             print(f"Warning: {warn}: {debug}\n")
         elif t == Gst.MessageType.ERROR:
             err, debug = message.parse_error()
             print(f"Error: {err}: {debug}\n")
-            loop.quit()
-        return True
 
     def save_image_with_plate_number(self, plate_number, confidence):
         if confidence < 0.5:  # You can adjust this threshold
@@ -41,16 +58,9 @@ class LPRPipeline:
         # Get the file extension from the original file
         file_extension = Path(self.current_file).suffix
         
-        # Create the new filename with the plate number
-        new_filename = f"{plate_number}{file_extension}"
-        output_path = self.output_dir / new_filename
-        
-        # If file already exists, add a counter
-        counter = 1
-        while output_path.exists():
-            new_filename = f"{plate_number}_{counter}{file_extension}"
-            output_path = self.output_dir / new_filename
-            counter += 1
+        # Next free "{plate}_{n}" name, without probing the folder
+        output_path = self.names.reserve(plate_number, file_extension)
+        new_filename = output_path.name
             
         # Copy the original image with the new name
         try:
@@ -66,6 +76,9 @@ class LPRPipeline:
             return
 
         try:
+            if not self.deepstream:
+                self.save_image_with_plate_number(Path(self.current_file).stem, 1.0)
+                return Gst.PadProbeReturn.DROP
             batch_meta = pyds.gst_buffer_get_nvds_batch_meta(hash(gst_buffer))
             l_frame = batch_meta.frame_meta_list
             while l_frame is not None:
@@ -103,14 +116,15 @@ class LPRPipeline:
         print(f"Processing: {self.current_file}")
 
         # Create a new pipeline for each image
+        build_started = time.perf_counter()
         pipeline = Gst.Pipeline()
         
         # Create elements
         source = Gst.ElementFactory.make("filesrc", "file-source")
         decoder = Gst.ElementFactory.make("decodebin", "image-decoder")
         videoconvert = Gst.ElementFactory.make("videoconvert", "video-convert")
-        streammux = Gst.ElementFactory.make("nvstreammux", "stream-muxer")
-        lprnet = Gst.ElementFactory.make("nvinfer", "lpr-inference")
+        streammux = Gst.ElementFactory.make(self.mux_element, "stream-muxer")
+        lprnet = Gst.ElementFactory.make(self.infer_element, "lpr-inference")
         fakesink = Gst.ElementFactory.make("fakesink", "fakesink")
 
         if not all([source, decoder, videoconvert, streammux, lprnet, fakesink]):
@@ -119,12 +133,14 @@ class LPRPipeline:
 
         # Set properties
         source.set_property('location', str(image_path))
-        streammux.set_property('width', 720)
-        streammux.set_property('height', 320)
-        streammux.set_property('batch-size', 1)
-        streammux.set_property('batched-push-timeout', 4000000)
-        streammux.set_property('live-source', 0)
-        lprnet.set_property('config-file-path', 'spec_files/lpr_config.txt')
+        if self.mux_element == "nvstreammux":
+            streammux.set_property('width', 720)
+            streammux.set_property('height', 320)
+            streammux.set_property('batch-size', 1)
+            streammux.set_property('batched-push-timeout', 4000000)
+            streammux.set_property('live-source', 0)
+        if self.infer_element == "nvinfer":
+            lprnet.set_property('config-file-path', 'spec_files/lpr_config.txt')
 
         # Add elements to pipeline
         for element in [source, decoder, videoconvert, streammux, lprnet, fakesink]:
@@ -148,38 +164,47 @@ class LPRPipeline:
             return False
 
         # Add probe
+        probe = self.inference_pad_buffer_probe
+        if self.trace is not None:
+            self.trace.begin_image(image_path, self.traced_images)
+            self.traced_images += 1
+            self.trace.attach(pipeline)
+            probe = self.trace.wrap_probe("inference probe", probe)
         infer_pad = lprnet.get_static_pad("src")
-        infer_pad.add_probe(Gst.PadProbeType.BUFFER, self.inference_pad_buffer_probe)
+        infer_pad.add_probe(Gst.PadProbeType.BUFFER, probe)
 
-        # Create a new main loop
-        loop = GLib.MainLoop()
-        
-        # Setup bus
-        bus = pipeline.get_bus()
-        bus.add_signal_watch()
-        bus.connect("message", self.bus_call, loop)
+        session = PipelineSession(pipeline, self.bus_call, build_started)
 
         # Start playing
-        ret = pipeline.set_state(Gst.State.PLAYING)
-        if ret == Gst.StateChangeReturn.FAILURE:
+        if not session.play():
             print(f"Failed to set pipeline to PLAYING state for {image_path}")
+            session.close()
             return False
 
         try:
             # Run for maximum 10 seconds
-            GLib.timeout_add_seconds(10, lambda: loop.quit())
-            loop.run()
+            outcome = session.run(timeout=10)
         except Exception as e:
             print(f"Error in processing loop: {str(e)}")
             return False
         finally:
-            # Cleanup
-            pipeline.set_state(Gst.State.NULL)
+            # Cleanup, this also removes the bus watch
+            session.close()
+        print(f"Pipeline phases: {session.report()}")
             
-        return True
+        return outcome == 'eos'
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Recognize the plates in plate_images/, one pipeline per image")
+    parser.add_argument('--trace', default=None, metavar='JSON',
+                        help="write per-element, per-buffer latency as a Chrome trace "
+                             "(open in ui.perfetto.dev or chrome://tracing)")
+    return parser.parse_args()
 
 def main():
-    lpr_pipeline = LPRPipeline()
+    args = parse_args()
+    trace = PipelineTrace(args.trace) if args.trace else None
+    lpr_pipeline = LPRPipeline(trace=trace)
     
     try:
         # Process all images in the folder
@@ -189,11 +214,12 @@ def main():
         for image_file in image_files:
             if not lpr_pipeline.process_image(image_file):
                 print(f"Failed to process {image_file}, continuing with next image")
-            # Add a small delay between images
-            time.sleep(2)
             
     except Exception as e:
         print(f"An error occurred: {str(e)}")
+    finally:
+        if trace is not None:
+            trace.close()
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
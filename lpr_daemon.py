@@ -0,0 +1,176 @@
+import argparse
+import shutil
+import signal
+import threading
+import time
+from pathlib import Path
+
+from gi.repository import GLib
+
+from final import LPRPipeline, make_results_sink
+from common.folder_watch import FolderWatcher
+from common.image_validation import ImageValidator
+from common.plate_index import PlateIndex, PlateSearchServer
+
+
+class LPRDaemon:
+    def __init__(self, lpr_pipeline, watcher, validator=None, done_dir=None, max_in_flight=32):
+        self.lpr_pipeline = lpr_pipeline
+        self.watcher = watcher
+        self.validator = validator
+        self.done_dir = Path(done_dir) if done_dir else None
+        if self.done_dir:
+            self.done_dir.mkdir(parents=True, exist_ok=True)
+        # Bounds images between arrival and result, so a burst of drops
+        # doesn't turn into unbounded memory
+        self.in_flight = threading.BoundedSemaphore(max_in_flight)
+        self.arrivals = {}
+        self.lock = threading.Lock()
+        self.processed = 0
+        self.latencies = []
+        lpr_pipeline.on_image_done = self.image_done
+        # A pipeline error ends the run like SIGINT does; the watcher would
+        # otherwise keep the teardown waiting for the next file
+        lpr_pipeline.on_stream_stop = watcher.stop
+
+    def incoming(self):
+        files = iter(self.watcher)
+        if self.validator is not None:
+            files = self.validator.validate(files, lookahead=1)
+        for image_path in files:
+            while not self.in_flight.acquire(timeout=0.5):
+                if self.watcher.stop_event.is_set():
+                    return
+            if self.watcher.stop_event.is_set():
+                # Stopped while waiting; the file stays for the next run
+                self.in_flight.release()
+                return
+            with self.lock:
+                self.arrivals[image_path] = time.perf_counter()
+            yield image_path
+
+    def image_done(self, image_path, labels):
+        with self.lock:
+            arrived = self.arrivals.pop(image_path, None)
+            latency = time.perf_counter() - arrived if arrived is not None else None
+            self.processed += 1
+            if latency is not None:
+                self.latencies.append(latency)
+                del self.latencies[:-1000]
+        self.in_flight.release()
+
+        name = Path(image_path).name
+        timing = f" {latency * 1000:.1f} ms after arrival" if latency is not None else ""
+        if labels is None:
+            print(f"{name}: failed{timing}")
+        else:
+            plates = ", ".join(f"{label.plate_number} ({label.confidence:.2f})" for label in labels) or "no plate"
+            print(f"{name}: {plates}{timing}")
+
+        if self.done_dir is not None and labels is not None:
+            # Wait until the writer has copied the source before moving it
+            self.lpr_pipeline.writer.when_idle(image_path, lambda: self.move_to_done(image_path))
+
+    def move_to_done(self, image_path):
+        image_path = Path(image_path)
+        target = self.done_dir / image_path.name
+        if target.exists():
+            target = self.done_dir / f"{image_path.stem}_{time.time_ns()}{image_path.suffix}"
+        try:
+            shutil.move(str(image_path), target)
+        except OSError as e:
+            print(f"Failed to move {image_path} to {self.done_dir}: {str(e)}")
+
+    def stop(self, *args):
+        print("Stopping, draining in-flight images...")
+        self.watcher.stop()
+        return GLib.SOURCE_REMOVE
+
+    def run(self):
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            GLib.unix_signal_add(GLib.PRIORITY_DEFAULT, signum, self.stop)
+        print(f"Watching {self.watcher.folder} "
+              f"({'inotify' if self.watcher.libc is not None else 'polling'})")
+        self.lpr_pipeline.process_folder(self.incoming())
+
+        latencies = sorted(self.latencies)
+        if latencies:
+            p50 = latencies[len(latencies) // 2]
+            p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+            print(f"Processed {self.processed} images, arrival-to-result latency "
+                  f"p50 {p50 * 1000:.1f} ms, p99 {p99 * 1000:.1f} ms")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Keep the LPR pipeline warm and process images as they arrive")
+    parser.add_argument('--input', default="plate_images_processed",
+                        help="folder to watch for new images")
+    parser.add_argument('--done', default=None,
+                        help="move processed inputs into this folder")
+    parser.add_argument('--max-in-flight', type=int, default=32,
+                        help="images allowed between arrival and result")
+    parser.add_argument('--batch-size', type=int, default=1)
+    parser.add_argument('--sources', type=int, default=None)
+    parser.add_argument('--push-timeout', type=int, default=20000,
+                        help="nvstreammux batched-push-timeout in microseconds")
+    parser.add_argument('--poll', action='store_true',
+                        help="poll the folder instead of using inotify")
+    parser.add_argument('--results-db', default=None,
+                        help="record every result in this SQLite database")
+    parser.add_argument('--results-jsonl', default=None,
+                        help="record every result as JSON lines in this folder")
+    parser.add_argument('--search-socket', default="plate_search.sock",
+                        help="serve plate_search.py --socket queries against the live plate index "
+                             "on this Unix socket ('' to disable)")
+    parser.add_argument('--search-distance', type=int, default=2,
+                        help="largest edit distance the live index answers")
+    parser.add_argument('--quarantine', default="quarantine")
+    parser.add_argument('--no-validate', action='store_true')
+    parser.add_argument('--stub', action='store_true',
+                        help="use funnel/identity instead of nvstreammux/nvinfer (CPU only)")
+    return parser.parse_args()
+
+
+def load_plate_index(args, output_dir):
+    # Earlier results seed the index, the pipeline adds new ones as they come
+    index = PlateIndex(max_distance=args.search_distance)
+    start = time.perf_counter()
+    if args.results_db and Path(args.results_db).exists():
+        index.load_sqlite(args.results_db)
+    elif args.results_jsonl and Path(args.results_jsonl).is_dir():
+        index.load_jsonl(args.results_jsonl)
+    elif Path(output_dir).is_dir():
+        index.load_folder(output_dir)
+    print(f"Plate index: {len(index)} earlier recognitions loaded in {time.perf_counter() - start:.2f}s")
+    return index
+
+
+def main():
+    args = parse_args()
+    plate_index = load_plate_index(args, "recognized_plates")
+    if args.stub:
+        lpr_pipeline = LPRPipeline(args.batch_size, infer_element="identity", mux_element="funnel",
+                                   num_sources=args.sources, push_timeout=args.push_timeout,
+                                   results_sink=make_results_sink(args), plate_index=plate_index)
+    else:
+        lpr_pipeline = LPRPipeline(args.batch_size, num_sources=args.sources,
+                                   push_timeout=args.push_timeout, results_sink=make_results_sink(args),
+                                   plate_index=plate_index)
+    search_server = None
+    if args.search_socket:
+        search_server = PlateSearchServer(plate_index, args.search_socket)
+        print(f"Answering plate searches on {args.search_socket}")
+    # The streaming decoder takes JPEG only
+    watcher = FolderWatcher(args.input, suffixes=('.jpg', '.jpeg'), use_inotify=not args.poll)
+    validator = None if args.no_validate else ImageValidator(args.quarantine)
+    daemon = LPRDaemon(lpr_pipeline, watcher, validator, args.done, args.max_in_flight)
+    try:
+        daemon.run()
+    finally:
+        if search_server is not None:
+            search_server.close()
+        lpr_pipeline.close()
+
+
+if __name__ == '__main__':
+    main()
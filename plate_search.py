@@ -0,0 +1,64 @@
+import argparse
+import time
+from datetime import datetime
+
+from common.plate_index import PlateIndex, query_server
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Find recognized plates within an edit distance of a query")
+    parser.add_argument('plates', nargs='+', help="plate numbers to look up")
+    parser.add_argument('--distance', type=int, default=1,
+                        help="maximum edit distance after folding O/0, B/8, ...")
+    parser.add_argument('--socket', default=None,
+                        help="query the live index of a running lpr_daemon.py (its --search-socket) "
+                             "instead of loading one")
+    parser.add_argument('--db', default=None, help="SQLite results database")
+    parser.add_argument('--jsonl', default=None, help="folder with JSONL results")
+    parser.add_argument('--folder', default="recognized_plates",
+                        help="recognized plates folder, used when no --db/--jsonl is given")
+    parser.add_argument('--limit', type=int, default=5, help="sightings listed per matching plate")
+    return parser.parse_args()
+
+
+def print_matches(plate, matches, elapsed, limit):
+    print(f"\n{plate}: {len(matches)} matching plates ({elapsed:.2f} ms)")
+    for match in matches:
+        print(f"  {match['plate_number']} (distance {match['distance']}, {match['sightings']} sightings)")
+        for _, source_file, timestamp, _ in match['records'][-limit:]:
+            seen = datetime.fromtimestamp(timestamp).isoformat(' ', 'seconds') \
+                if timestamp else "unknown time"
+            print(f"    {seen}  {source_file}")
+
+
+def main():
+    args = parse_args()
+    if args.socket:
+        for plate in args.plates:
+            start = time.perf_counter()
+            matches = query_server(args.socket, plate, args.distance, args.limit)
+            print_matches(plate, matches, (time.perf_counter() - start) * 1000, args.limit)
+        return
+
+    index = PlateIndex(max_distance=args.distance)
+    start = time.perf_counter()
+    if args.db:
+        index.load_sqlite(args.db)
+    elif args.jsonl:
+        index.load_jsonl(args.jsonl)
+    else:
+        index.load_folder(args.folder)
+    print(f"Indexed {len(index)} recognitions of {len(index.records)} distinct plates "
+          f"in {time.perf_counter() - start:.2f}s")
+
+    for plate in args.plates:
+        start = time.perf_counter()
+        matches = index.search(plate, args.distance)
+        elapsed = (time.perf_counter() - start) * 1000
+        matches = [{'distance': m.distance, 'plate_number': m.plate_number, 'sightings': len(m.records),
+                    'records': m.records} for m in matches]
+        print_matches(plate, matches, elapsed, args.limit)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,45 @@
+import argparse
+import sys
+import time
+
+from common.engine_cache import check_engine, prepare_engine
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Validate, build and warm up the TensorRT engines of nvinfer configs")
+    parser.add_argument('configs', nargs='*', default=['spec_files/traffic_config.txt',
+                                                       'spec_files/lpd_config.txt',
+                                                       'spec_files/lpr_config.txt'])
+    parser.add_argument('--check', action='store_true',
+                        help="only validate the configs against their engine files (no GPU needed)")
+    parser.add_argument('--cache-dir', default="engine_cache")
+    parser.add_argument('--batch-size', type=int, default=None,
+                        help="override the batch size of every config")
+    parser.add_argument('--gpu-id', type=int, default=None,
+                        help="override the gpu-id of every config")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    failed = False
+    for config in args.configs:
+        if args.check:
+            check = check_engine(config, args.batch_size, args.gpu_id)
+            status = "OK" if not check.problems else "; ".join(check.problems)
+            print(f"{config}: batch {check.batch_size}, gpu {check.gpu_id}, {check.precision}: {status}")
+            failed |= bool(check.problems)
+            continue
+        start = time.perf_counter()
+        try:
+            overlay = prepare_engine(config, args.cache_dir, args.batch_size, args.gpu_id)
+        except RuntimeError as e:
+            print(str(e))
+            failed = True
+            continue
+        print(f"{config}: ready in {time.perf_counter() - start:.2f}s, use {overlay}")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
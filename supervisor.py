@@ -0,0 +1,255 @@
+import argparse
+import multiprocessing
+import queue
+import time
+from pathlib import Path
+
+from common.result_writer import OUTPUT_MODES
+from common.results_store import make_results_sink
+
+
+class ForwardingSink:
+    # Stands in for the results sink inside a worker: results travel to the
+    # supervisor, which owns the one real SQLite/JSONL sink
+    def __init__(self, events, worker_id):
+        self.events = events
+        self.worker_id = worker_id
+        self.written = 0
+        self.batches = 0
+
+    def submit(self, result):
+        self.events.put(('result', self.worker_id, result))
+        self.written += 1
+
+    def close(self):
+        pass
+
+
+def worker_main(worker_id, gpu_id, options, tasks, events):
+    # Runs in a spawned process with its own GStreamer pipeline and GIL
+    from final import LPRPipeline
+    from common.engine_cache import prepare_engine
+
+    factories = {'infer_element': "identity", 'mux_element': "funnel"} if options['stub'] else {}
+    lpr_config = options['lpr_config']
+    if options['engine_cache'] and not options['stub']:
+        lpr_config = prepare_engine(lpr_config, options['engine_cache'], options['batch_size'], gpu_id=gpu_id)
+    lpr_pipeline = LPRPipeline(options['batch_size'], num_sources=options['sources'],
+                               push_timeout=options['push_timeout'], output_mode=options['output_mode'],
+                               crop_padding=options.get('crop_padding', 0.1),
+                               crop_quality=options.get('crop_quality', 85),
+                               output_dir=options['output_dir'], lpr_config=lpr_config,
+                               results_sink=ForwardingSink(events, worker_id), gpu_id=gpu_id, **factories)
+    lpr_pipeline.writer.verbose = False
+    lpr_pipeline.on_image_done = \
+        lambda image_path, labels: events.put(('done', worker_id, str(image_path), labels is not None))
+
+    def pull():
+        # Idle workers take the next file off the shared queue, so a slow
+        # or busy worker never holds up work another one could do. Once the
+        # pipeline has stopped (error, failed push) nothing more is taken,
+        # the supervisor hands the rest to the other workers
+        while not lpr_pipeline.stream_stop.is_set():
+            try:
+                item = tasks.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            if item is None:
+                return
+            events.put(('claimed', worker_id, item))
+            yield Path(item)
+
+    try:
+        lpr_pipeline.process_folder(pull())
+    finally:
+        lpr_pipeline.close()
+    events.put(('stats', worker_id, getattr(lpr_pipeline, 'stream_stats', None)))
+
+
+class Supervisor:
+    def __init__(self, image_files, workers, gpus, options, max_restarts=3, max_attempts=2):
+        self.context = multiprocessing.get_context('spawn')
+        self.tasks = self.context.Queue()
+        self.events = self.context.Queue()
+        self.options = options
+        self.gpus = gpus
+        self.max_restarts = max_restarts
+        # A file that takes down its worker this many times is given up on
+        self.max_attempts = max_attempts
+        self.results_sink = make_results_sink(argparse.Namespace(**options))
+        self.remaining = {str(f) for f in image_files}
+        self.attempts = {}
+        self.claimed = {}
+        self.processes = {}
+        self.restarts = 0
+        self.failed = []
+        self.stats = {}
+        self.done = {}
+        for image_path in self.remaining:
+            self.tasks.put(image_path)
+        for worker_id in range(workers):
+            self.start_worker(worker_id)
+
+    def gpu_for(self, worker_id):
+        return self.gpus[worker_id % len(self.gpus)] if self.gpus else None
+
+    def start_worker(self, worker_id):
+        process = self.context.Process(target=worker_main, name=f"lpr-worker-{worker_id}",
+                                       args=(worker_id, self.gpu_for(worker_id), self.options,
+                                             self.tasks, self.events))
+        process.start()
+        self.processes[worker_id] = process
+        self.claimed[worker_id] = set()
+
+    def handle(self, event):
+        kind, worker_id = event[0], event[1]
+        if kind == 'claimed':
+            self.claimed[worker_id].add(event[2])
+        elif kind == 'done':
+            image_path, ok = event[2], event[3]
+            self.claimed[worker_id].discard(image_path)
+            self.remaining.discard(image_path)
+            self.done[worker_id] = self.done.get(worker_id, 0) + 1
+            if not ok:
+                self.failed.append(image_path)
+        elif kind == 'result':
+            if self.results_sink is not None:
+                self.results_sink.submit(event[2])
+        elif kind == 'stats':
+            self.stats[worker_id] = event[2]
+
+    def drain_events(self):
+        while True:
+            try:
+                self.handle(self.events.get(timeout=0.1))
+            except queue.Empty:
+                break
+
+    def check_workers(self):
+        for worker_id, process in list(self.processes.items()):
+            if process.is_alive():
+                continue
+            # Completions the worker sent before exiting must not be redone
+            self.drain_events()
+            lost = self.claimed.pop(worker_id)
+            del self.processes[worker_id]
+            # A clean exit with images still claimed means process_folder
+            # gave up early (pipeline error, failed push); treat it as a crash
+            if process.exitcode != 0 or lost:
+                print(f"Worker {worker_id} exited with code {process.exitcode}, "
+                      f"re-queueing {len(lost)} in-flight images")
+            for image_path in lost:
+                self.attempts[image_path] = self.attempts.get(image_path, 0) + 1
+                if self.attempts[image_path] >= self.max_attempts:
+                    print(f"Giving up on {image_path} after {self.attempts[image_path]} worker failures")
+                    self.remaining.discard(image_path)
+                    self.failed.append(image_path)
+                else:
+                    self.tasks.put(image_path)
+            if self.remaining and self.restarts < self.max_restarts:
+                self.restarts += 1
+                self.start_worker(worker_id)
+
+    def run(self):
+        start = time.perf_counter()
+        stopping = False
+        while self.processes:
+            try:
+                self.handle(self.events.get(timeout=0.5))
+            except queue.Empty:
+                pass
+            self.check_workers()
+            if not self.remaining and not stopping:
+                # Everything is accounted for; let every worker drain and exit
+                stopping = True
+                for _ in self.processes:
+                    self.tasks.put(None)
+            if not self.processes and self.remaining:
+                # Out of restarts and nobody left to take the queued images
+                print(f"All workers are gone, {len(self.remaining)} images left unprocessed")
+                self.failed.extend(sorted(self.remaining))
+                self.remaining.clear()
+                # Don't block exit flushing tasks nobody will read
+                self.tasks.cancel_join_thread()
+        # Results and stats still queued behind the last worker exit
+        self.drain_events()
+        elapsed = time.perf_counter() - start
+        if self.results_sink is not None:
+            self.results_sink.close()
+        return self.report(elapsed)
+
+    def report(self, elapsed):
+        processed = sum(self.done.values())
+        rate = processed / elapsed if elapsed > 0 else 0.0
+        print(f"Processed {processed} images in {elapsed:.2f}s with {len(self.done)} workers "
+              f"({rate:.1f} images/sec), {len(self.failed)} failed, {self.restarts} worker restarts")
+        for worker_id in sorted(self.stats):
+            stats = self.stats[worker_id]
+            if not stats:
+                continue
+            latency = ""
+            if stats['p50'] is not None:
+                latency = f", p50 {stats['p50'] * 1000:.1f} ms, p99 {stats['p99'] * 1000:.1f} ms"
+            print(f"  worker {worker_id} (gpu {self.gpu_for(worker_id)}): {stats['images']} images, "
+                  f"{stats['images_per_sec']:.1f} images/sec{latency}")
+        if self.results_sink is not None:
+            print(f"Recorded {self.results_sink.written} results in {self.results_sink.batches} batches")
+        return {'images': processed, 'seconds': elapsed, 'images_per_sec': rate,
+                'failed': len(self.failed), 'restarts': self.restarts, 'workers': self.stats}
+
+
+def parse_gpus(value):
+    return [int(v) for v in value.split(',') if v]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Shard a folder of images across several LPR worker processes")
+    parser.add_argument('--input', default="plate_images_processed",
+                        help="folder with the JPEGs to process")
+    parser.add_argument('--workers', type=int, default=multiprocessing.cpu_count(),
+                        help="worker processes, each with its own pipeline")
+    parser.add_argument('--gpus', type=parse_gpus, default=[],
+                        help="comma separated gpu-ids handed out to workers round robin "
+                             "(default: whatever the config files say)")
+    parser.add_argument('--batch-size', type=int, default=1)
+    parser.add_argument('--sources', type=int, default=None)
+    parser.add_argument('--push-timeout', type=int, default=20000,
+                        help="nvstreammux batched-push-timeout in microseconds; kept short as the "
+                             "shared queue can run dry and a partial batch would wait that long")
+    parser.add_argument('--output-dir', default="recognized_plates")
+    parser.add_argument('--output-mode', choices=OUTPUT_MODES, default='copy')
+    parser.add_argument('--crop-padding', type=float, default=0.1)
+    parser.add_argument('--crop-quality', type=int, default=85)
+    parser.add_argument('--results-db', default=None,
+                        help="record every result in this SQLite database")
+    parser.add_argument('--results-jsonl', default=None,
+                        help="record every result as JSON lines in this folder")
+    parser.add_argument('--lpr-config', default='spec_files/lpr_config.txt')
+    parser.add_argument('--engine-cache', default=None, metavar='DIR',
+                        help="validate/build each GPU's LPR engine into DIR before starting")
+    parser.add_argument('--max-restarts', type=int, default=3,
+                        help="crashed workers restarted before carrying on with fewer")
+    parser.add_argument('--stub', action='store_true',
+                        help="use funnel/identity instead of nvstreammux/nvinfer (CPU only)")
+    return parser.parse_args()
+
+
+def options_from_args(args):
+    return {'batch_size': args.batch_size, 'sources': args.sources, 'push_timeout': args.push_timeout,
+            'output_dir': args.output_dir, 'output_mode': args.output_mode,
+            'crop_padding': args.crop_padding, 'crop_quality': args.crop_quality,
+            'results_db': args.results_db, 'results_jsonl': args.results_jsonl,
+            'lpr_config': args.lpr_config, 'engine_cache': args.engine_cache, 'stub': args.stub}
+
+
+def main():
+    args = parse_args()
+    image_folder = Path(args.input)
+    image_files = list(image_folder.glob("*.jpg")) + list(image_folder.glob("*.jpeg"))
+    supervisor = Supervisor(image_files, args.workers, args.gpus, options_from_args(args),
+                            max_restarts=args.max_restarts)
+    supervisor.run()
+
+
+if __name__ == '__main__':
+    main()
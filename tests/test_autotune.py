@@ -0,0 +1,38 @@
+import argparse
+import json
+
+from autotune import pick_best, trial_settings, write_recommendation
+from common.engine_cache import read_infer_config
+
+
+def stats(images_per_sec, p50=0.01, p99=0.02):
+    return {'images_per_sec': images_per_sec, 'p50': p50, 'p99': p99}
+
+
+def test_trial_settings():
+    args = argparse.Namespace(batch_sizes=[1, 4], push_timeouts=[4000], infer_batch_sizes=[])
+    assert list(trial_settings(args)) == [
+        {'batch_size': 1, 'push_timeout': 4000, 'infer_batch_size': 1},
+        {'batch_size': 4, 'push_timeout': 4000, 'infer_batch_size': 4}]
+
+
+def test_pick_best_skips_trials_without_results():
+    results = [({'batch_size': 1}, None),
+               ({'batch_size': 2}, stats(500.0, p50=None, p99=None)),
+               ({'batch_size': 4}, stats(100.0)),
+               ({'batch_size': 8}, stats(200.0, p99=0.5))]
+    assert pick_best(results, None)[0] == {'batch_size': 8}
+    assert pick_best(results, 100)[0] == {'batch_size': 4}
+    assert pick_best(results[:2], None) is None
+
+
+def test_write_recommendation(tmp_path):
+    config = tmp_path / "lpr_config.txt"
+    config.write_text("[property]\nbatch-size=1\ngpu-id=0\n")
+    output = tmp_path / "tuned"
+    args = argparse.Namespace(output=str(output), lpr_config=str(config))
+    settings = {'batch_size': 8, 'push_timeout': 20000, 'infer_batch_size': 8}
+    write_recommendation(args, settings, stats(123.0))
+    assert read_infer_config(output / "lpr_config.txt")['property']['batch-size'] == '8'
+    written = json.loads((output / "settings.json").read_text())
+    assert written['streammux'] == {'batch-size': 8, 'batched-push-timeout': 20000}
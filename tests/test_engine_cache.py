@@ -0,0 +1,60 @@
+from common.engine_cache import check_engine, engine_is_usable, read_infer_config, write_overlay
+
+CONFIG = """[property]
+gpu-id=0
+model-engine-file=models/lpr.etlt_b{batch}_gpu{gpu}_{precision}.engine
+tlt-encoded-model=models/lpr.etlt
+batch-size={config_batch}
+network-mode=2
+"""
+
+
+def write_config(tmp_path, batch=16, gpu=0, precision='fp16', config_batch=1, engine=True, model=True):
+    models = tmp_path / "models"
+    models.mkdir(exist_ok=True)
+    if model:
+        (models / "lpr.etlt").write_bytes(b"model")
+    if engine:
+        (models / f"lpr.etlt_b{batch}_gpu{gpu}_{precision}.engine").write_bytes(b"engine")
+    config = tmp_path / "lpr_config.txt"
+    config.write_text(CONFIG.format(batch=batch, gpu=gpu, precision=precision, config_batch=config_batch))
+    return config
+
+
+def test_matching_engine(tmp_path):
+    check = check_engine(write_config(tmp_path, batch=4, config_batch=4))
+    assert check.problems == []
+    assert check.engine_path == tmp_path / "models" / "lpr.etlt_b4_gpu0_fp16.engine"
+    assert engine_is_usable(check)
+
+
+def test_larger_engine_batch_is_usable(tmp_path):
+    check = check_engine(write_config(tmp_path, batch=16, config_batch=1))
+    assert check.problems == ["engine batch 16 differs from batch-size 1"]
+    assert engine_is_usable(check)
+
+
+def test_mismatches(tmp_path):
+    config = write_config(tmp_path, batch=1, gpu=0, precision='fp32')
+    check = check_engine(config, batch_size=8, gpu_id=1)
+    assert check.problems == ["engine is built for batch 1, config needs 8",
+                              "engine is built for gpu 0, config uses gpu 1",
+                              "engine precision fp32, network-mode asks for fp16"]
+    assert not engine_is_usable(check)
+
+
+def test_missing_files(tmp_path):
+    check = check_engine(write_config(tmp_path, batch=1, engine=False, model=False))
+    assert len(check.problems) == 2
+    assert check.problems[0].startswith("engine file") and check.problems[1].startswith("model file")
+    assert not engine_is_usable(check)
+
+
+def test_overlay_makes_paths_absolute(tmp_path):
+    config = write_config(tmp_path, batch=1)
+    check = check_engine(config, batch_size=4)
+    overlay = write_overlay(check, tmp_path / "cache" / "lpr_b4.engine", tmp_path / "cache" / "lpr.txt")
+    properties = read_infer_config(overlay)['property']
+    assert properties['batch-size'] == '4'
+    assert properties['model-engine-file'] == str(tmp_path / "cache" / "lpr_b4.engine")
+    assert properties['tlt-encoded-model'] == str(tmp_path / "models" / "lpr.etlt")
@@ -0,0 +1,39 @@
+import threading
+import time
+
+import pytest
+
+from common.folder_watch import FolderWatcher
+
+
+def collect(watcher, found):
+    for path in watcher:
+        found.append((path.name, path.stat().st_size))
+
+
+@pytest.mark.parametrize('use_inotify', [True, False])
+def test_startup_backlog_waits_for_complete_files(tmp_path, use_inotify):
+    (tmp_path / "done.jpg").write_bytes(b"x" * 100)
+    # Still being uploaded when the watcher starts
+    upload = open(tmp_path / "upload.jpg", 'wb')
+    upload.write(b"x" * 10)
+    upload.flush()
+
+    watcher = FolderWatcher(tmp_path, poll_interval=0.1, use_inotify=use_inotify)
+    found = []
+    thread = threading.Thread(target=collect, args=(watcher, found), daemon=True)
+    thread.start()
+    try:
+        for _ in range(5):
+            time.sleep(0.05)
+            upload.write(b"x" * 10)
+            upload.flush()
+        upload.close()
+        deadline = time.monotonic() + 5
+        while len(found) < 2 and time.monotonic() < deadline:
+            time.sleep(0.05)
+        time.sleep(0.3)
+    finally:
+        watcher.stop()
+        thread.join(timeout=2)
+    assert sorted(found) == [("done.jpg", 100), ("upload.jpg", 60)]
@@ -0,0 +1,40 @@
+import io
+
+import pytest
+
+from common.image_validation import InvalidImage, check_image
+
+Image = pytest.importorskip("PIL.Image")
+
+
+def jpeg_bytes(size=(320, 240)):
+    data = io.BytesIO()
+    Image.effect_noise(size, 64).convert('RGB').save(data, 'JPEG', quality=90)
+    return data.getvalue()
+
+
+def test_trailing_data_after_end_marker_is_valid(tmp_path):
+    # Camera/vendor trailers and padding after EOI
+    path = tmp_path / "trailer.jpg"
+    path.write_bytes(jpeg_bytes() + b"VENDOR-TRAILER" * 20 + b"\0" * 512)
+    assert check_image(path) == ('jpeg', 320, 240)
+
+
+def test_truncated_jpeg_is_rejected(tmp_path):
+    data = jpeg_bytes()
+    path = tmp_path / "cut.jpg"
+    path.write_bytes(data[:len(data) * 2 // 3])
+    with pytest.raises(InvalidImage):
+        check_image(path)
+
+
+def test_end_marker_check_without_pillow(tmp_path, monkeypatch):
+    import common.image_validation as image_validation
+    monkeypatch.setattr(image_validation, "Image", None)
+    data = jpeg_bytes()
+    path = tmp_path / "trailer.jpg"
+    path.write_bytes(data + b"\0" * 4096)
+    assert check_image(path) == ('jpeg', 320, 240)
+    path.write_bytes(data[:-2])
+    with pytest.raises(InvalidImage, match="no end marker"):
+        check_image(path)
@@ -0,0 +1,45 @@
+import threading
+
+import pytest
+
+pytest.importorskip("gi")
+try:
+    from lpr_daemon import LPRDaemon
+except (ImportError, ValueError) as e:
+    pytest.skip(f"GStreamer unavailable: {e}", allow_module_level=True)
+
+from common.folder_watch import FolderWatcher
+
+
+class FailingPipeline:
+    # Takes one image, then fails the way a pipeline error does: the image
+    # is reported as failed and the run stops taking images
+    def __init__(self):
+        self.on_image_done = None
+        self.on_stream_stop = None
+        self.taken = []
+
+    def process_folder(self, images):
+        for image_path in images:
+            self.taken.append(image_path)
+            self.on_image_done(image_path, None)
+            if self.on_stream_stop is not None:
+                self.on_stream_stop()
+        return False
+
+
+@pytest.mark.parametrize('use_inotify', [True, False])
+def test_pipeline_error_ends_the_run(tmp_path, use_inotify):
+    (tmp_path / "first.jpg").write_bytes(b"x" * 10)
+    watcher = FolderWatcher(tmp_path, poll_interval=0.1, use_inotify=use_inotify)
+    pipeline = FailingPipeline()
+    daemon = LPRDaemon(pipeline, watcher, max_in_flight=2)
+
+    # No further file arrives, the run must still end
+    thread = threading.Thread(target=daemon.run, daemon=True)
+    thread.start()
+    thread.join(10)
+    assert not thread.is_alive(), "daemon kept waiting after the pipeline stopped"
+    assert [path.name for path in pipeline.taken] == ["first.jpg"]
+    # The failed image gave its in-flight slot back
+    assert daemon.in_flight.acquire(blocking=False) and daemon.in_flight.acquire(blocking=False)
@@ -0,0 +1,34 @@
+from pathlib import Path
+
+import pytest
+
+from common.object_gating import ObjectGate, RoiMask
+
+LOWER_FRAME = [[[0, 216], [1920, 216], [1920, 1080], [0, 1080]]]
+
+
+def test_boxes_touching_the_frame_edge_stay_in_the_roi():
+    gate = ObjectGate(rois={"0": LOWER_FRAME})
+    # Bottom centre at y == 1080, the last row of the frame
+    assert gate.keep('vehicles', 0, 800, 700, 300, 380, 0.9)
+    assert gate.keep('vehicles', 0, 800, 700, 300, 379, 0.9)
+    # Left and right edges
+    assert gate.keep('vehicles', 0, -40, 500, 80, 580, 0.9)
+    assert gate.keep('vehicles', 0, 1840, 500, 80, 580, 0.9)
+    # Above the ROI is still dropped
+    assert not gate.keep('vehicles', 0, 800, 0, 300, 100, 0.9)
+    assert gate.dropped['vehicles', 'roi'] == 1
+
+
+@pytest.mark.parametrize('x, y', [(0, 1080), (1920, 1080), (1919.5, 1079.9), (5000, 5000)])
+def test_mask_clamps_points_outside_the_grid(x, y):
+    assert RoiMask(LOWER_FRAME, 1920, 1080).contains(x, y)
+
+
+def test_load_rules():
+    gate = ObjectGate.load(Path(__file__).resolve().parent.parent / "spec_files" / "gating.json")
+    assert not gate.keep('vehicles', 0, 800, 700, 300, 380, 0.1)
+    assert not gate.keep('plates', 0, 900, 900, 60, 20, 0.9, vehicles=[(0, 0, 100, 100)])
+    assert gate.keep('plates', 0, 900, 900, 60, 20, 0.9, vehicles=[(800, 700, 300, 380)])
+    assert gate.dropped['vehicles', 'confidence'] == 1
+    assert gate.dropped['plates', 'no_vehicle'] == 1
@@ -0,0 +1,30 @@
+import json
+
+from common.plate_index import PlateIndex, PlateSearchServer, query_server
+
+
+def test_load_folder(tmp_path):
+    for name in ("AB123.jpg", "AB123_1.jpg", "CD_12.jpg", "EF9.png", "notes.txt"):
+        (tmp_path / name).write_bytes(b"")
+    (tmp_path / "GH_7.jpg").write_bytes(b"")
+    (tmp_path / "crops.jsonl").write_text(json.dumps({'file': "GH_7.jpg", 'plate_number': "GH 7",
+                                                      'confidence': 0.9}) + "\n")
+    index = PlateIndex()
+    index.load_folder(tmp_path)
+    plates = sorted(record.plate_number for records in index.records.values() for record in records)
+    # The repeat of AB123 is folded onto it; CD_12 keeps its digits
+    assert plates == ["AB123", "AB123", "CD_12", "EF9", "GH 7"]
+
+
+def test_search_server(tmp_path):
+    index = PlateIndex(max_distance=2)
+    index.add("ABC123", "a.jpg", 1.0, 0.9)
+    server = PlateSearchServer(index, tmp_path / "search.sock")
+    try:
+        # Results added after startup are answered too
+        index.add("XYZ789", "b.jpg", 2.0, 0.8)
+        matches = query_server(tmp_path / "search.sock", "XYZ78", 1)
+        assert [(m['plate_number'], m['distance'], m['sightings']) for m in matches] == [("XYZ789", 1, 1)]
+        assert matches[0]['records'] == [["XYZ789", "b.jpg", 2.0, 0.8]]
+    finally:
+        server.close()
@@ -0,0 +1,54 @@
+import random
+
+import pytest
+
+from common.result_cache import ResultCache, hamming, hash_chunks
+from common.result_writer import PlateLabel
+
+
+def test_hash_chunks_find_every_near_hash():
+    rng = random.Random(1)
+    for max_distance in (0, 2, 4):
+        parts = max_distance + 1
+        for _ in range(200):
+            a = rng.getrandbits(64)
+            b = a
+            for bit in rng.sample(range(64), rng.randint(0, max_distance)):
+                b ^= 1 << bit
+            assert hamming(a, b) <= max_distance
+            assert set(hash_chunks(a, parts)) & set(hash_chunks(b, parts))
+
+
+def test_discard_and_store(tmp_path):
+    image = tmp_path / "a.jpg"
+    image.write_bytes(b"not really a jpeg")
+    cache = ResultCache(tmp_path / "cache.db", "v1")
+    try:
+        assert cache.lookup(image) is None
+        cache.discard(image)
+        assert not cache.pending
+        # Discarded lookups are not stored
+        cache.store(image, [PlateLabel("AB123", 0.9, None)])
+        assert cache.lookup(image) is None
+        cache.store(image, [PlateLabel("AB123", 0.9, None)])
+        assert cache.lookup(image) == [PlateLabel("AB123", 0.9, None)]
+        assert not cache.pending
+    finally:
+        cache.close()
+
+
+def test_perceptual_near_hit(tmp_path):
+    Image = pytest.importorskip("PIL.Image")
+    original = tmp_path / "a.jpg"
+    resent = tmp_path / "b.jpg"
+    image = Image.linear_gradient('L').resize((320, 240))
+    image.save(original, quality=95)
+    image.save(resent, quality=60)
+    cache = ResultCache(tmp_path / "cache.db", "v1", perceptual=True)
+    try:
+        assert cache.lookup(original) is None
+        cache.store(original, [PlateLabel("AB123", 0.9, None)])
+        assert cache.lookup(resent) == [PlateLabel("AB123", 0.9, None)]
+        assert cache.near_hits == 1
+    finally:
+        cache.close()
@@ -0,0 +1,120 @@
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("gi")
+try:
+    import final
+except (ImportError, ValueError) as e:
+    pytest.skip(f"GStreamer unavailable: {e}", allow_module_level=True)
+
+from common.image_validation import LatencyWatchdog
+
+
+class Node:
+    # One link of a pyds GList
+    def __init__(self, items):
+        self.data = items[0]
+        self.next = Node(items[1:]) if len(items) > 1 else None
+
+
+def glist(items):
+    return Node(items) if items else None
+
+
+class FakePyds:
+    # Enough of pyds to walk a batch: the batch meta of a buffer is looked
+    # up by hash(buffer) like the real bindings do
+    def __init__(self):
+        self.batches = {}
+
+    def add_batch(self, buffer, frames):
+        # frames: [(pts, [plate, ...]), ...] in batch order
+        frame_metas = []
+        for pts, plates in frames:
+            objects = []
+            for plate in plates:
+                label = SimpleNamespace(result_label=plate, result_prob=0.9)
+                classifier = SimpleNamespace(label_info_list=glist([label]))
+                rect = SimpleNamespace(left=1, top=2, width=3, height=4)
+                objects.append(SimpleNamespace(rect_params=rect, classifier_meta_list=glist([classifier])))
+            frame_metas.append(SimpleNamespace(buf_pts=pts, obj_meta_list=glist(objects)))
+        self.batches[hash(buffer)] = SimpleNamespace(frame_meta_list=glist(frame_metas))
+
+    def gst_buffer_get_nvds_batch_meta(self, address):
+        return self.batches[address]
+
+    @staticmethod
+    def glist_get_nvds_label_info(data):
+        return data
+
+    NvDsFrameMeta = NvDsObjectMeta = NvDsClassifierMeta = SimpleNamespace(cast=staticmethod(lambda data: data))
+
+
+def make_pipeline(pending, deepstream):
+    # The streaming state process_folder sets up, without building pipelines
+    pipeline = final.LPRPipeline.__new__(final.LPRPipeline)
+    pipeline.deepstream = deepstream
+    pipeline.stream_pending = {pts: (path, 0.0) for pts, path in pending.items()}
+    pipeline.stream_lock = threading.Lock()
+    pipeline.stream_recognized = 0
+    pipeline.stream_timed_out = 0
+    pipeline.watchdog = LatencyWatchdog()
+    pipeline.result_cache = None
+    pipeline.saved = []
+    pipeline.done = []
+    pipeline.save_image_with_plate_number = \
+        lambda plate, confidence, image_path=None, bbox=None: pipeline.saved.append((image_path, plate, bbox))
+    pipeline.on_image_done = lambda image_path, labels: pipeline.done.append(
+        (image_path, [label.plate_number for label in labels] if labels is not None else None))
+    return pipeline
+
+
+def run_probe(pipeline, buffer):
+    info = SimpleNamespace(get_buffer=lambda: buffer)
+    return pipeline.stream_pad_buffer_probe(None, info)
+
+
+def test_batch_frames_map_to_their_files(monkeypatch):
+    fake_pyds = FakePyds()
+    monkeypatch.setattr(final, "pyds", fake_pyds)
+    duration = final.STREAM_FRAME_DURATION
+    pending = {index * duration: f"/in/{index}.jpg" for index in range(5)}
+    pipeline = make_pipeline(pending, deepstream=True)
+
+    # Batch slots follow muxer pads, not push order, and a frame may have
+    # no plate; the PTS of frame 7 was never pushed
+    buffer = object()
+    fake_pyds.add_batch(buffer, [(3 * duration, ["CCC333"]), (0, ["AAA111"]),
+                                 (4 * duration, []), (7 * duration, ["ZZZ999"])])
+    assert run_probe(pipeline, buffer) == final.Gst.PadProbeReturn.DROP
+
+    assert pipeline.done == [("/in/3.jpg", ["CCC333"]), ("/in/0.jpg", ["AAA111"]), ("/in/4.jpg", [])]
+    assert pipeline.saved == [("/in/3.jpg", "CCC333", (1, 2, 3, 4)), ("/in/0.jpg", "AAA111", (1, 2, 3, 4))]
+    assert pipeline.stream_recognized == 2
+    assert sorted(pipeline.stream_pending) == [duration, 2 * duration]
+
+    # The rest arrive in the next batch
+    second = object()
+    fake_pyds.add_batch(second, [(2 * duration, ["BBB222"]), (duration, [])])
+    run_probe(pipeline, second)
+    assert pipeline.done[3:] == [("/in/2.jpg", ["BBB222"]), ("/in/1.jpg", [])]
+    assert pipeline.stream_pending == {}
+
+
+def test_stub_maps_buffer_pts_to_file():
+    duration = final.STREAM_FRAME_DURATION
+    pipeline = make_pipeline({0: "/in/AB12CD.jpg", duration: "/in/EF34GH.jpg"}, deepstream=False)
+    run_probe(pipeline, SimpleNamespace(pts=duration))
+    run_probe(pipeline, SimpleNamespace(pts=5 * duration))
+    assert pipeline.done == [("/in/EF34GH.jpg", ["EF34GH"])]
+    assert list(pipeline.stream_pending) == [0]
+
+
+def test_expired_frames_are_released():
+    pipeline = make_pipeline({0: "/in/slow.jpg"}, deepstream=False)
+    pipeline.watchdog = LatencyWatchdog(min_deadline=0.0, max_deadline=0.0)
+    assert pipeline.check_stream_deadlines()
+    assert pipeline.done == [("/in/slow.jpg", None)]
+    assert pipeline.stream_pending == {} and pipeline.stream_timed_out == 1
@@ -0,0 +1,199 @@
+import os
+import queue
+import threading
+
+import pytest
+
+from supervisor import Supervisor, worker_main
+
+OPTIONS = {'batch_size': 1, 'sources': None, 'push_timeout': 20000, 'output_dir': None,
+           'output_mode': 'hardlink', 'results_db': None, 'results_jsonl': None,
+           'lpr_config': 'spec_files/lpr_config.txt', 'engine_cache': None, 'stub': True}
+
+
+class FakeWorker:
+    # Stands in for a worker process inside the test: while "alive" it
+    # takes files off the task queue and reports them done
+    def __init__(self, worker_id, supervisor, claim_and_quit=False):
+        self.worker_id = worker_id
+        self.supervisor = supervisor
+        self.claim_and_quit = claim_and_quit
+        self.exitcode = None
+
+    def is_alive(self):
+        if self.exitcode is not None:
+            return False
+        try:
+            item = self.supervisor.tasks.get(timeout=0.05)
+        except queue.Empty:
+            return True
+        if item is None:
+            self.exitcode = 0
+            return False
+        self.supervisor.events.put(('claimed', self.worker_id, item))
+        if self.claim_and_quit:
+            # process_folder returning early with the file still in flight
+            self.exitcode = 0
+            return False
+        self.supervisor.events.put(('done', self.worker_id, item, True))
+        return True
+
+
+class FakeSupervisor(Supervisor):
+    def __init__(self, *args, quitters=(), **kwargs):
+        self.quitters = set(quitters)
+        super().__init__(*args, **kwargs)
+
+    def start_worker(self, worker_id):
+        quits = worker_id in self.quitters
+        # A restarted worker behaves normally
+        self.quitters.discard(worker_id)
+        self.processes[worker_id] = FakeWorker(worker_id, self, claim_and_quit=quits)
+        self.claimed[worker_id] = set()
+
+
+def test_clean_exit_with_claimed_files_is_requeued():
+    files = [f"image{index}.jpg" for index in range(6)]
+    supervisor = FakeSupervisor(files, 2, [], OPTIONS, max_restarts=0, quitters={0})
+    stats = supervisor.run()
+    assert stats['images'] == len(files)
+    assert stats['failed'] == 0
+    assert not supervisor.remaining
+
+
+def test_stops_when_no_worker_is_left():
+    files = [f"image{index}.jpg" for index in range(4)]
+    supervisor = FakeSupervisor(files, 1, [], OPTIONS, max_restarts=0, quitters={0})
+    stats = supervisor.run()
+    assert stats['failed'] == len(files)
+    assert not supervisor.processes
+
+
+def require_stub_backend():
+    gi = pytest.importorskip("gi")
+    try:
+        gi.require_version('Gst', '1.0')
+    except ValueError:
+        pytest.skip("GStreamer introspection data is not installed")
+    pytest.importorskip("PIL")
+
+
+def run_bounded(supervisor, timeout=300):
+    # A hang fails the test instead of blocking the run
+    outcome = {}
+    thread = threading.Thread(target=lambda: outcome.update(stats=supervisor.run()), daemon=True)
+    thread.start()
+    thread.join(timeout)
+    assert not thread.is_alive(), "supervisor did not finish"
+    return outcome['stats']
+
+
+def failing_worker_main(worker_id, gpu_id, options, tasks, events):
+    # worker_main whose stand-in inference posts an error on its third
+    # buffer, the way a pipeline failing partway through would
+    import final
+    build = final.LPRPipeline.build_stream_pipeline
+
+    def build_failing(self):
+        pipeline, appsrcs = build(self)
+        pipeline.get_by_name("lpr-inference").set_property('error-after', 3)
+        return pipeline, appsrcs
+
+    final.LPRPipeline.build_stream_pipeline = build_failing
+    worker_main(worker_id, gpu_id, options, tasks, events)
+
+
+class CrashingTasks:
+    # Task queue of a worker that dies right after claiming its third file,
+    # with files still in flight. It dies outside get() and after flushing
+    # its events, so it holds none of the shared queues' locks
+    def __init__(self, tasks, events):
+        self.tasks = tasks
+        self.events = events
+        self.claims = 0
+
+    def get(self, timeout=None):
+        if self.claims == 3:
+            self.events.close()
+            self.events.join_thread()
+            os._exit(3)
+        item = self.tasks.get(timeout=timeout)
+        self.claims += 1
+        return item
+
+
+def crashing_worker_main(worker_id, gpu_id, options, tasks, events):
+    worker_main(worker_id, gpu_id, options, CrashingTasks(tasks, events), events)
+
+
+class FirstRunSupervisor(Supervisor):
+    # Runs the first instance of worker 0 with another target; restarts and
+    # the other workers run worker_main
+    def __init__(self, *args, target, **kwargs):
+        self.first_target = target
+        super().__init__(*args, **kwargs)
+
+    def start_worker(self, worker_id):
+        target = worker_main
+        if worker_id == 0 and self.first_target is not None:
+            target, self.first_target = self.first_target, None
+        process = self.context.Process(target=target, name=f"lpr-worker-{worker_id}",
+                                       args=(worker_id, self.gpu_for(worker_id), self.options,
+                                             self.tasks, self.events))
+        process.start()
+        self.processes[worker_id] = process
+        self.claimed[worker_id] = set()
+
+
+def test_sharding_stub_backend(tmp_path):
+    # bench_sharding's run against the CPU stand-ins, kept small
+    require_stub_backend()
+    from bench_sharding import make_images
+
+    files = make_images(tmp_path, 48)
+    for workers in (1, 2):
+        output_dir = tmp_path / f"out{workers}"
+        output_dir.mkdir()
+        supervisor = Supervisor(files, workers, [], dict(OPTIONS, output_dir=str(output_dir)))
+        stats = run_bounded(supervisor)
+        assert stats['images'] == len(files)
+        assert stats['failed'] == 0
+        # Every worker took a share of the queue and no file was done twice
+        assert sorted(supervisor.done) == list(range(workers))
+        assert all(count > 0 for count in supervisor.done.values())
+        assert sum(supervisor.done.values()) == len(files)
+
+
+def test_pipeline_failure_mid_run(tmp_path):
+    require_stub_backend()
+    from bench_sharding import make_images
+
+    files = make_images(tmp_path, 24)
+    output_dir = tmp_path / "out"
+    output_dir.mkdir()
+    supervisor = FirstRunSupervisor(files, 1, [], dict(OPTIONS, output_dir=str(output_dir)),
+                                    target=failing_worker_main)
+    stats = run_bounded(supervisor)
+    # The failed worker reports what it had taken as failed and exits
+    # instead of waiting on the task queue; its restart does the rest
+    assert not supervisor.remaining
+    assert stats['images'] == len(files)
+    assert 1 <= stats['failed'] < len(files)
+    assert stats['restarts'] == 1
+
+
+def test_worker_crash_mid_run_is_requeued(tmp_path):
+    require_stub_backend()
+    from bench_sharding import make_images
+
+    files = make_images(tmp_path, 24)
+    output_dir = tmp_path / "out"
+    output_dir.mkdir()
+    supervisor = FirstRunSupervisor(files, 1, [], dict(OPTIONS, output_dir=str(output_dir)),
+                                    target=crashing_worker_main)
+    stats = run_bounded(supervisor)
+    assert not supervisor.remaining
+    assert stats['failed'] == 0
+    assert stats['restarts'] == 1
+    # Files the crashed worker had in flight were done again by the restart
+    assert stats['images'] >= len(files)
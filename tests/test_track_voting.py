@@ -0,0 +1,65 @@
+from common.track_voting import TrackAggregator
+
+
+def feed(aggregator, readings, source_id=0, track_id=7, start_frame=0):
+    finished = []
+    for offset, (plate, confidence) in enumerate(readings):
+        finished.extend(aggregator.update(source_id, track_id, plate, confidence, start_frame + offset))
+    return finished
+
+
+def test_votes_length_then_characters():
+    aggregator = TrackAggregator()
+    # One short misread and one wrong character are outvoted
+    feed(aggregator, [("AB12CD", 0.9), ("AB12C", 0.95), ("A812CD", 0.6), ("AB12CD", 0.7)])
+    [result] = aggregator.flush()
+    assert result.plate_number == "AB12CD"
+    assert result.observations == 4
+    # The best reading was the outvoted five-character one
+    assert result.best_frame == 1
+    # Position 1 agreed on 1.6 of 2.2 weight, scaled by the best reading
+    assert abs(result.confidence - 1.6 / 2.2 * 0.95) < 1e-9
+
+
+def test_best_crop_is_only_taken_for_a_new_best():
+    aggregator = TrackAggregator()
+    taken = []
+
+    def crop(frame):
+        return lambda: taken.append(frame) or f"crop{frame}"
+
+    for frame, confidence in enumerate([0.5, 0.9, 0.7]):
+        aggregator.update(0, 1, "XY99", confidence, frame, (frame, 0, 10, 5), crop(frame))
+    [result] = aggregator.flush()
+    assert taken == [0, 1]
+    assert result.best_crop == "crop1" and result.best_bbox == (1, 0, 10, 5)
+
+
+def test_expire_after_ttl():
+    aggregator = TrackAggregator(ttl_frames=5)
+    feed(aggregator, [("AAA111", 0.9)], source_id=0, track_id=1, start_frame=0)
+    feed(aggregator, [("BBB222", 0.9)], source_id=0, track_id=2, start_frame=3)
+    feed(aggregator, [("CCC333", 0.9)], source_id=1, track_id=1, start_frame=0)
+    assert aggregator.expire(0, 5) == []
+    # Only source 0's track 1 has gone more than ttl_frames without a reading
+    [result] = aggregator.expire(0, 6)
+    assert (result.source_id, result.track_id, result.plate_number) == (0, 1, "AAA111")
+    assert sorted(aggregator.tracks) == [(0, 2), (1, 1)]
+
+
+def test_max_tracks_finishes_the_oldest():
+    aggregator = TrackAggregator(max_tracks=2)
+    assert feed(aggregator, [("AAA111", 0.9)], track_id=1, start_frame=0) == []
+    assert feed(aggregator, [("BBB222", 0.9)], track_id=2, start_frame=1) == []
+    feed(aggregator, [("AAA111", 0.9)], track_id=1, start_frame=2)
+    [evicted] = feed(aggregator, [("CCC333", 0.9)], track_id=3, start_frame=3)
+    assert evicted.track_id == 2
+    assert sorted(key[1] for key in aggregator.tracks) == [1, 3]
+
+
+def test_min_observations():
+    aggregator = TrackAggregator(min_observations=2)
+    feed(aggregator, [("AAA111", 0.9)], track_id=1)
+    feed(aggregator, [("BBB222", 0.9), ("BBB222", 0.8)], track_id=2)
+    assert [result.plate_number for result in aggregator.flush()] == ["BBB222"]
+    assert aggregator.tracks == {}